@@ -0,0 +1,100 @@
+'''
+Throughput of the browser based translators with different WebDriverPool sizes.
+
+Serves a local stand-in page that mimics the DOM of the Yandex translator
+(a contenteditable input and the result split into `translation-word` elements,
+rendered with a random delay), and translates the same lines through YandexTranslator.
+Requires one of the supported browsers to be installed.
+
+    python -m benchmarks.browser_pool --sizes 1 2 4 --lines 24
+'''
+import argparse
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import config.config as config
+config.USE_TRANSLATION_MEMORY = False
+
+from src.translators.driver import WebDriverPool
+from src.translators.translators import YandexTranslator
+
+
+STAND_IN_PAGE = b'''<!DOCTYPE html>
+<html><head><meta charset="UTF-8"><title>Stand-in translator</title></head>
+<body>
+<div id="fakeArea" contenteditable="true"></div>
+<div id="translation"></div>
+<script>
+const input = document.getElementById('fakeArea');
+const output = document.getElementById('translation');
+let pending = null;
+
+function render(text) {
+    output.replaceChildren();
+    // The result appears word by word, like the real page
+    text.split(' ').reverse().forEach((word, i) => setTimeout(() => {
+        const span = document.createElement('span');
+        span.className = 'translation-word';
+        span.textContent = (i ? ' ' : '') + word.split('').reverse().join('');
+        output.appendChild(span);
+    }, 10 * i));
+}
+
+input.addEventListener('input', () => {
+    clearTimeout(pending);
+    pending = setTimeout(() => render(input.innerText.trim()), 100 + Math.random() * 200);
+});
+
+const text = new URLSearchParams(location.search).get('text');
+if (text) {
+    input.innerText = text;
+    render(text);
+}
+</script>
+</body></html>
+'''
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(STAND_IN_PAGE)))
+        self.end_headers()
+        self.wfile.write(STAND_IN_PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--lines', type=int, default=24)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}/?source_lang={{}}&target_lang={{}}&text={{}}'
+    lines = [f'stand-in line number {i}' for i in range(args.lines)]
+
+    for size in args.sizes:
+        WebDriverPool.close_instance()
+        pool = WebDriverPool(size=size)
+        pool.warm_up(size)
+        translator = YandexTranslator('en', 'ru', base_url=base_url)
+        translator.translate_batch([f'warm up {i}' for i in range(size)]) # loads the page in every browser
+
+        start = time.perf_counter()
+        translated = translator.translate_batch(lines)
+        elapsed = time.perf_counter() - start
+        errors = sum(result != line[::-1] for line, result in zip(lines, translated))
+        print(f'{size} browsers: {len(lines) / elapsed:.1f} lines/s, {errors} wrong results')
+
+    WebDriverPool.close_instance()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
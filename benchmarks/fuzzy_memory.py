@@ -0,0 +1,111 @@
+'''
+Lookup latency of FuzzyTranslationMemory.
+
+Fills the index with synthetic subtitle-like lines and queries it with
+OCR-like noisy variants of stored lines and with unseen lines.
+Then checks that digits misread inside words still match ("Hel1o there, trave1er")
+and that lines differing in a number do not ("You found 5 coins" and "You found 6 coins").
+
+    python -m benchmarks.fuzzy_memory --entries 100000 --queries 2000
+'''
+import argparse
+import random
+import string
+import time
+
+import numpy as np
+
+from src.translators.fuzzy import FuzzyTranslationMemory
+
+
+OCR_CONFUSIONS = {'l': '1', 'o': '0', 'i': 'l', 'e': 'c', 's': '5', 'a': 'o', 'b': '6', 'g': '9'}
+
+# (stored line, query, whether the query should find the stored line)
+NUMBER_CASES = [
+    ('Hello there, traveler', 'Hel1o there, traveler', True),
+    ('Hello there, traveler', 'He11o there, trave1er', True),
+    ('Some text about the old bridge', '5ome text about the o1d bridge', True),
+    ('You found 5 coins in the chest', 'You found 6 coins in the chest', False),
+    ('You found 3 potions and a rusty key', 'You found 8 potions and a rusty key', False),
+    ('Deal 150 damage to all enemies', 'Deal 750 damage to all enemies', False),
+    ('Wait 10 seconds', 'Wait 10 seconds.', True),
+]
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list:
+    return [
+        ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        for _ in range(size)
+    ]
+
+
+def make_line(vocabulary: list, weights: np.ndarray, rng: np.random.Generator) -> str:
+    words = rng.choice(len(vocabulary), size=rng.integers(3, 13), p=weights)
+    return ' '.join(vocabulary[i] for i in words).capitalize()
+
+
+def add_ocr_noise(line: str, rng: random.Random, errors: int = 1) -> str:
+    chars = list(line)
+    for _ in range(errors):
+        i = rng.randrange(len(chars))
+        chars[i] = OCR_CONFUSIONS.get(chars[i].lower(), rng.choice(string.ascii_lowercase))
+    return ''.join(chars)
+
+
+def measure(memory: FuzzyTranslationMemory, queries: list) -> tuple:
+    timings = []
+    found = 0
+    for query in queries:
+        start = time.perf_counter()
+        found += memory.lookup(query) is not None
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--vocabulary', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    np_rng = np.random.default_rng(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    weights = 1 / np.arange(1, len(vocabulary) + 1) # Zipf distribution of words
+    weights /= weights.sum()
+
+    memory = FuzzyTranslationMemory()
+    lines = [make_line(vocabulary, weights, np_rng) for _ in range(args.entries)]
+    start = time.perf_counter()
+    for line in lines:
+        memory.add(line, line.upper())
+    print(f'Indexed {len(memory)} entries in {time.perf_counter() - start:.1f} s')
+
+    noisy = [add_ocr_noise(line, rng) for line in rng.sample(lines, args.queries)]
+    unseen = [make_line(vocabulary, weights, np_rng) for _ in range(args.queries)]
+    for name, queries in (('noisy variants', noisy), ('unseen lines', unseen)):
+        timings, found = measure(memory, queries)
+        print(
+            f'{name:>15}: p50 {np.percentile(timings, 50):.3f} ms, '
+            f'p95 {np.percentile(timings, 95):.3f} ms, p99 {np.percentile(timings, 99):.3f} ms, '
+            f'mean {timings.mean():.3f} ms, found {found}/{len(queries)}'
+        )
+
+    # The same lines with a count in front, queried with another count
+    counted = rng.sample(lines, args.queries)
+    for i, line in enumerate(counted):
+        memory.add(f'{i % 9 + 1} {line}', line.upper())
+    changed = [f'{(i + 1) % 9 + 1} {line}' for i, line in enumerate(counted)]
+    _, found = measure(memory, changed)
+    print(f'{"changed numbers":>15}: found {found}/{len(changed)}, should be 0')
+
+    for stored, query, expected in NUMBER_CASES:
+        memory.add(stored, stored.upper())
+        found = memory.lookup(query) == stored.upper()
+        print(f"{'ok    ' if found == expected else 'FAILED'} {query!r} {'matches' if found else 'does not match'} {stored!r}")
+
+
+if __name__ == '__main__':
+    main()
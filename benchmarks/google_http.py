@@ -0,0 +1,192 @@
+'''
+Checks the HTTP client of GoogleTranslator against a local stand-in server.
+
+The server answers like the mobile page of Google Translate (the reversed text
+in a `result-container`), and the path of the request selects its behaviour:
+    /ok/          answers at once
+    /unavailable/ answers 503 to the first `--failures` requests of every text
+    /slow/        answers after `--delay` seconds, longer than the read timeout
+    /busy/        answers after `--busy-delay` seconds, so concurrent requests overlap
+
+Every check runs through the synchronous session and through the async one:
+    pooling       sequential lines reuse one keep-alive connection
+    retry         a 503 is retried and the translation still arrives
+    read timeout  a slow answer gives up after the read timeout and its retries,
+                  with an empty translation
+Then `translate_batch` sends the lines concurrently:
+    concurrency   no more than HTTP_MAX_CONCURRENCY requests are open at once,
+                  and the translations come back in the order of the lines
+
+    python -m benchmarks.google_http --lines 20 --failures 2
+'''
+import sys
+import html
+import time
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import config.config as config
+config.USE_TRANSLATION_MEMORY = False
+
+from src.translators.translators import GoogleTranslator
+from src.translators.aio import run_sync
+
+
+RESULT_PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="UTF-8"><title>Google Translate</title></head>
+<body><div class="translate-form">
+<div class="result-container">{}</div>
+</div></body></html>
+'''
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, failures: int, delay: float, busy_delay: float):
+        super(StandInServer, self).__init__(('127.0.0.1', 0), StandInHandler)
+        self.failures = failures
+        self.delay = delay
+        self.busy_delay = busy_delay
+        self.lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self) -> None:
+        with self.lock:
+            self.requests = 0
+            self.connections = set() # client ports
+            self.attempts = {} # text -> requests for it
+            self.active = 0 # requests being answered
+            self.peak = 0 # most requests answered at once
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        text = parse_qs(url.query).get('q', [''])[0]
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address[1])
+            attempt = server.attempts[text] = server.attempts.get(text, 0) + 1
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            if url.path.startswith('/unavailable/') and attempt <= server.failures:
+                self.respond(503, b'')
+                return
+            if url.path.startswith('/slow/'):
+                time.sleep(server.delay)
+            elif url.path.startswith('/busy/'):
+                time.sleep(server.busy_delay)
+            self.respond(200, RESULT_PAGE.format(html.escape(text[::-1])).encode('utf-8'))
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+    def respond(self, status: int, body: bytes) -> None:
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            pass # the client gave up waiting
+
+
+    def log_message(self, *args):
+        pass
+
+
+def check(name: str, ok: bool, details: str) -> bool:
+    print(f"{'ok    ' if ok else 'FAILED'} {name}: {details}")
+    return ok
+
+
+def run_checks(mode: str, translate, server: StandInServer, port: int, args) -> list:
+    base_url = f'http://127.0.0.1:{port}/{{}}/?'
+    results = []
+    lines = [f'stand-in line number {i}' for i in range(args.lines)]
+
+    translator = GoogleTranslator('english', 'russian', base_url=base_url.format('ok'))
+    server.reset()
+    start = time.perf_counter()
+    translated = [translate(translator, line) for line in lines]
+    elapsed = time.perf_counter() - start
+    errors = sum(result != line[::-1] for line, result in zip(lines, translated))
+    results.append(check(
+        f'{mode} pooling', errors == 0 and len(server.connections) == 1,
+        f'{len(lines)} lines in {elapsed * 1000:.0f} ms over {len(server.connections)} connections, {errors} wrong results'
+    ))
+    translator.close()
+
+    translator = GoogleTranslator('english', 'russian', base_url=base_url.format('unavailable'))
+    server.reset()
+    translated = translate(translator, lines[0])
+    results.append(check(
+        f'{mode} retry', translated == lines[0][::-1] and server.requests == args.failures + 1,
+        f'{server.requests} requests for {args.failures} answers 503, result {translated!r}'
+    ))
+    translator.close()
+
+    translator = GoogleTranslator('english', 'russian', base_url=base_url.format('slow'))
+    translator._timeout = (config.HTTP_TIMEOUT[0], args.read_timeout)
+    server.reset()
+    start = time.perf_counter()
+    translated = translate(translator, lines[0])
+    elapsed = time.perf_counter() - start
+    attempts = config.HTTP_RETRIES + 1
+    results.append(check(
+        f'{mode} read timeout', translated == '' and elapsed < attempts * (args.read_timeout + 0.5) + 1,
+        f'gave up after {elapsed:.2f} s and {server.requests} requests, result {translated!r}'
+    ))
+    translator.close()
+    return results
+
+
+def check_concurrency(server: StandInServer, port: int, args) -> bool:
+    translator = GoogleTranslator('english', 'russian', base_url=f'http://127.0.0.1:{port}/busy/?')
+    lines = [f'stand-in batch line {i}' for i in range(args.lines)]
+    server.reset()
+    start = time.perf_counter()
+    translated = translator.translate_batch(lines)
+    elapsed = time.perf_counter() - start
+    translator.close()
+    limit = config.HTTP_MAX_CONCURRENCY
+    in_order = translated == [line[::-1] for line in lines]
+    return check(
+        'batch concurrency', 1 < server.peak <= limit and in_order,
+        f'{len(lines)} lines in {elapsed * 1000:.0f} ms, at most {server.peak} requests at once (limit {limit}), '
+        f"results {'in' if in_order else 'NOT in'} order"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=20)
+    parser.add_argument('--failures', type=int, default=config.HTTP_RETRIES, help='503 answers before the translation')
+    parser.add_argument('--read-timeout', type=float, default=0.5, help='seconds')
+    parser.add_argument('--delay', type=float, default=2.0, help='seconds of the slow answers')
+    parser.add_argument('--busy-delay', type=float, default=0.1, help='seconds of the answers to the batch')
+    args = parser.parse_args()
+
+    server = StandInServer(args.failures, args.delay, args.busy_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    results = run_checks('sync', lambda translator, text: translator._translate(text), server, port, args)
+    results += run_checks('async', lambda translator, text: run_sync(translator._atranslate(text)), server, port, args)
+    results.append(check_concurrency(server, port, args))
+    server.shutdown()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
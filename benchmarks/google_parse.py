@@ -0,0 +1,100 @@
+'''
+Parse time of the Google Translate result page.
+
+Compares the previous BeautifulSoup extraction with GoogleTranslator._extract_translation.
+Pages saved from https://translate.google.com/m?... can be passed with --pages,
+otherwise synthetic pages with the same layout are generated.
+
+    python -m benchmarks.google_parse --pages page1.html page2.html --repeat 500
+'''
+import argparse
+import html
+import random
+import time
+
+import numpy as np
+from bs4 import BeautifulSoup
+
+from src.translators.constants import GOOGLE_CODES
+from src.translators.translators import GoogleTranslator
+
+
+SAMPLE_RESULTS = [
+    'Привет, мир!',
+    'Tom &amp; Jerry say &quot;hi&quot; &lt;again&gt;',
+    'It&#39;s 5 &#x2192; 10 &mdash; caf&eacute;',
+    '我们走吧 &nbsp;…',
+]
+
+
+def make_page(result: str, rng: random.Random) -> bytes:
+    # Mirrors the mobile page: styles, two language selectors, the form and the result
+    options = ''.join(
+        f'<option value="{code}">{html.escape(name)}</option>' for name, code in GOOGLE_CODES.items()
+    )
+    style = ''.join(f'.c{i}{{margin:{rng.randint(0, 9)}px;color:#{rng.randrange(0xffffff):06x}}}' for i in range(300))
+    page = (
+        '<!DOCTYPE html><html><head><meta charset="UTF-8"><title>Google Translate</title>'
+        f'<style>{style}</style></head><body><div class="root-container">'
+        '<div class="header"><div class="logo-image"></div><div class="logo-text">Translate</div></div>'
+        '<div class="languages-container"><form action="/m">'
+        f'<select name="sl">{options}</select><select name="tl">{options}</select>'
+        '<input type="text" name="q" class="input-field"></form></div>'
+        f'<div class="result-container">{result}</div>'
+        '<div class="links-container"><ul><li><a href="https://www.google.com/m?hl=en">Google home</a></li>'
+        '<li><a href="https://www.google.com/tools/feedback">Send feedback</a></li></ul></div>'
+        '</div></body></html>'
+    )
+    return page.encode('utf-8')
+
+
+def extract_with_soup(content: bytes) -> str:
+    element = BeautifulSoup(content, 'lxml').find('div', class_='result-container')
+    return element.text if element else ''
+
+
+def measure(function, pages: list, repeat: int) -> np.ndarray:
+    timings = []
+    for _ in range(repeat):
+        for page in pages:
+            start = time.perf_counter()
+            function(page)
+            timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', nargs='*', default=[])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, 'rb') as file:
+                pages.append(file.read())
+    else:
+        rng = random.Random(args.seed)
+        pages = [make_page(result, rng) for result in SAMPLE_RESULTS]
+
+    for page in pages:
+        expected, actual = extract_with_soup(page), GoogleTranslator._extract_translation(page)
+        if expected != actual:
+            print(f'Mismatch: {expected!r} != {actual!r}')
+
+    print(f'{len(pages)} pages, {np.mean([len(page) for page in pages]) / 1024:.1f} KiB on average')
+    for name, function in (
+        ('BeautifulSoup', extract_with_soup),
+        ('extractor', GoogleTranslator._extract_translation)
+    ):
+        timings = measure(function, pages, args.repeat)
+        print(
+            f'{name:>13}: p50 {np.percentile(timings, 50):.3f} ms, '
+            f'p99 {np.percentile(timings, 99):.3f} ms, mean {timings.mean():.3f} ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+'''
+Glass-to-glass latency: the time from a text appearing on the screen
+to its translation being shown by the subtitle window.
+
+A line of text from a small pool changes every `--period` seconds. It is drawn
+offscreen with Qt and fed to the full pipeline in place of the screen capture,
+recognized by the OCR, translated by a local stand-in translator with a random
+delay and rendered by a BackgroundSubtitleWindow. For every change the probe records
+when the recognized text was first shown (the placeholder of progressive rendering)
+and when its translation was shown. Changes that were replaced before their
+translation was shown are counted as missed.
+
+Every configuration of the scheduler and the translation memory runs for `--duration` seconds:
+    default            the settings of config.py
+    no-progressive     nothing is shown until the translation arrives
+    no-memory          no translation memory, repeated lines are requested again
+    batch-1            one line per translation request
+    no-stabilization   no typewriter stabilization
+
+    python -m benchmarks.latency_probe --duration 20 --configs default no-memory
+    python -m benchmarks.latency_probe --ocr stand-in --ocr-delay 0.03
+'''
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import zlib
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from PyQt5.QtCore import Qt, QEventLoop, QTimer
+from PyQt5.QtGui import QImage, QPainter, QFont, QColor
+from PyQt5.QtWidgets import QApplication
+from thefuzz import fuzz
+
+import config.config as config
+# The stand-in translations must not end up in the translation memory of the application
+config.TRANSLATION_MEMORY_PATH = os.path.join(tempfile.mkdtemp(), 'latency_probe.db')
+
+from src.pipeline import TranslationPipeline, PipelineStage, CaptureStage, Frame
+from src.subtitle_window import BackgroundSubtitleWindow
+from src.ocr_systems import TesseractOCR, EasyOCR
+from src.translators.translators import BaseTranslator
+
+
+PATTERN_LINES = [
+    'Where are you going at this hour',
+    'The bridge to the north was destroyed',
+    'You found three potions and a rusty key',
+    'Do not trust the merchant in the square',
+    'We have to leave before the sun rises',
+    'Quest updated find the lost caravan',
+    'I knew your father he was a brave man',
+    'The gate will open only at midnight',
+]
+TRANSLATION_MARK = '» '
+CONFIGS = ['default', 'no-progressive', 'no-memory', 'batch-1', 'no-stabilization']
+
+
+class ChangingTextPattern():
+    '''
+    One line of text that changes every `period` seconds, drawn on a QImage.
+    The schedule is set by the clock, not by the capture, so the capture interval
+    is a part of the measured latency.
+    '''
+    def __init__(self, size: tuple, period: float, seed: int):
+        self.width, self.height = size
+        self.period = period
+        self.rng = random.Random(seed)
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.changes = [] # (changed_at, text)
+        self.image = None
+        self.texts = {} # crc of a rendered image -> text, for the stand-in OCR
+
+
+    def current(self) -> tuple:
+        '''
+        Returns the image shown now, its text and the time it appeared.
+        '''
+        with self.lock:
+            index = int((time.perf_counter() - self.start) / self.period)
+            if len(self.changes) <= index:
+                text = self.rng.choice([line for line in PATTERN_LINES if not self.changes or line != self.changes[-1][1]])
+                self.changes.append((self.start + index * self.period, text))
+                self.image = self.render(text)
+                self.texts[zlib.crc32(self.image)] = text
+            changed_at, text = self.changes[-1]
+            return self.image, text, changed_at
+
+
+    def render(self, text: str) -> np.ndarray:
+        image = QImage(self.width, self.height, QImage.Format_RGB888)
+        image.fill(QColor(40, 50, 60))
+        painter = QPainter(image)
+        painter.setPen(QColor(255, 255, 255))
+        font = QFont('Arial')
+        font.setPixelSize(28)
+        painter.setFont(font)
+        painter.drawText(0, 0, self.width, self.height, Qt.AlignCenter, text)
+        painter.end()
+        pointer = image.constBits()
+        pointer.setsize(image.byteCount())
+        rows = np.frombuffer(pointer, dtype=np.uint8).reshape(self.height, image.bytesPerLine())
+        return rows[:, :self.width * 3].reshape(self.height, self.width, 3).copy()
+
+
+class PatternCaptureStage(CaptureStage):
+    '''
+    Captures the pattern instead of the screen. CaptureStage.__init__ is skipped,
+    so no win32 ScreenCapture is created.
+    '''
+    def __init__(self, pattern: ChangingTextPattern, interval: float = config.CAPTURE_INTERVAL):
+        PipelineStage.__init__(self, 'capture')
+        self.interval = interval
+        self.regions = []
+        self.screen_rect = None
+        self.frame_id = 0
+        self.stop_event = threading.Event()
+        self.pattern = pattern
+
+
+    def process(self, item) -> list:
+        image, _, _ = self.pattern.current()
+        self.frame_id += 1
+        return [Frame(self.frame_id, image.copy(), 0)]
+
+
+class StandInOCR():
+    '''
+    Returns the text the pattern drew on the image after `delay` seconds.
+    '''
+    def __init__(self, pattern: ChangingTextPattern, delay: float):
+        self.pattern = pattern
+        self.delay = delay
+        self.timings = {}
+
+
+    def ocr_process_image(self, image: np.ndarray, inpaint: bool = False) -> tuple:
+        time.sleep(self.delay)
+        self.timings = {'recognize': self.delay}
+        text = self.pattern.texts.get(zlib.crc32(np.ascontiguousarray(image)), '')
+        height, width, _ = image.shape
+        lines = [(text, height // 2 - 14, 28, 10, width - 20)] if text else []
+        return (np.empty(shape = (0,)), np.empty(shape = (0,)), lines)
+
+
+class StandInTranslator(BaseTranslator):
+    '''
+    Marks the lines as translated after a random delay, like a remote translator.
+    '''
+    max_concurrency = 4
+
+    def __init__(self, source: str, target: str, delay: tuple = (0.1, 0.4)):
+        super(StandInTranslator, self).__init__(source, target, codes={'english': 'en', 'russian': 'ru'})
+        self.delay = delay
+
+
+    def _translate(self, text: str, **kwargs) -> str:
+        time.sleep(random.uniform(*self.delay))
+        return TRANSLATION_MARK + text
+
+
+    async def _atranslate_concat(self, batch: list) -> list:
+        await asyncio.sleep(random.uniform(*self.delay))
+        return [TRANSLATION_MARK + text for text in batch]
+
+
+class ProbeSubtitleWindow(BackgroundSubtitleWindow):
+    '''
+    Records when the current text of the pattern is first shown and when its translation is shown.
+    '''
+    def __init__(self, pattern: ChangingTextPattern, *args, **kwargs):
+        self.pattern = pattern
+        self.shown = {} # changed_at -> time the recognized text was shown
+        self.translated = {} # changed_at -> time the translation was shown
+        super(ProbeSubtitleWindow, self).__init__(*args, **kwargs)
+
+
+    def update_text(self, text_data: list) -> None:
+        super().update_text(text_data)
+        now = time.perf_counter()
+        _, text, changed_at = self.pattern.current()
+        for rendered, *_ in text_data:
+            is_translation = rendered.startswith(TRANSLATION_MARK)
+            if fuzz.ratio(rendered.removeprefix(TRANSLATION_MARK), text) < 80:
+                continue
+            self.shown.setdefault(changed_at, now)
+            if is_translation:
+                self.translated.setdefault(changed_at, now)
+
+
+def percentiles(values: list) -> str:
+    if not values:
+        return 'no samples'
+    values = np.array(values) * 1000
+    return (
+        f'p50 {np.percentile(values, 50):.0f} ms, p95 {np.percentile(values, 95):.0f} ms, '
+        f'p99 {np.percentile(values, 99):.0f} ms, max {values.max():.0f} ms'
+    )
+
+
+def run(config_name: str, args, translator: StandInTranslator) -> None:
+    size = (640, 80)
+    pattern = ChangingTextPattern(size, args.period, args.seed)
+    if args.ocr == 'stand-in':
+        ocr_system = StandInOCR(pattern, args.ocr_delay)
+    else:
+        ocr_system = {'tesseract': TesseractOCR, 'easyocr': EasyOCR}[args.ocr]('english')
+
+    if translator.memory is not None:
+        translator.memory.clear()
+    memory = translator.memory
+    if config_name == 'no-memory':
+        translator.memory = None
+
+    pipeline = TranslationPipeline(
+        ocr_system = ocr_system,
+        regions = [(0, 0, *size)],
+        screen_rect = (0, 0, *size),
+        translator = translator,
+        translate = True,
+        capture_stage = PatternCaptureStage(pattern)
+    )
+    translation_stage = pipeline.translation_stage
+    if config_name == 'no-progressive':
+        translation_stage.progressive_rendering = ''
+    elif config_name == 'batch-1':
+        translation_stage.scheduler.batch_lines = 1
+    elif config_name == 'no-stabilization':
+        translation_stage.stabilizer = None
+
+    window = ProbeSubtitleWindow(
+        pattern,
+        ocr_system = ocr_system,
+        geometry = (0, 0, *size),
+        screen_rect = (0, 0, *size),
+        text_style = {'font-family': 'Arial'},
+        translator = translator,
+        translate = True,
+        pipeline = pipeline
+    )
+    window.show()
+    pipeline.start()
+    loop = QEventLoop()
+    QTimer.singleShot(int(args.duration * 1000), loop.quit)
+    loop.exec_()
+    pipeline.stop()
+    window.close()
+    translator.memory = memory
+
+    # The last change may still be in flight
+    changes = [changed_at for changed_at, _ in pattern.changes[:-1]]
+    shown = [window.shown[c] - c for c in changes if c in window.shown]
+    translated = [window.translated[c] - c for c in changes if c in window.translated]
+    print(f'{config_name}: {len(changes)} changes, {len(changes) - len(translated)} missed')
+    print(f'    text shown:        {percentiles(shown)}')
+    print(f'    translation shown: {percentiles(translated)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', nargs='+', choices=CONFIGS, default=CONFIGS)
+    parser.add_argument('--duration', type=float, default=15, help='seconds of every configuration')
+    parser.add_argument('--period', type=float, default=1.0, help='seconds between the text changes')
+    parser.add_argument('--ocr', choices=['tesseract', 'easyocr', 'stand-in'], default='tesseract')
+    parser.add_argument('--ocr-delay', type=float, default=0.05, help='seconds of the stand-in OCR')
+    parser.add_argument('--translator-delay', type=float, nargs=2, default=[0.1, 0.4])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    translator = StandInTranslator('english', 'russian', delay=tuple(args.translator_delay))
+    for config_name in args.configs:
+        run(config_name, args, translator)
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
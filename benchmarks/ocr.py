@@ -0,0 +1,294 @@
+'''
+Speed and accuracy of the OCR systems on a corpus of screenshots with ground truth.
+
+A corpus is a directory of images, each with a JSON file of the same name
+listing the lines it shows:
+    {"lines": [{"text": "Where are you going?", "box": [x, y, w, h]}, ...]}
+`--generate` writes a synthetic corpus of subtitle-like lines over noisy,
+game-like backgrounds; captured screenshots can be added with their own JSON files.
+
+Every OCR system is run with every preprocessing variant. For each run it reports
+the per-frame latency percentiles, the mean duration of the OCR steps, the character
+and word error rates and the mean IoU of the line boxes. `--output` saves the results
+as JSON and `--compare` prints the change against the results of a previous run,
+e.g. of the previous commit. Runs on the CPU, EasyOCR falls back to it without CUDA.
+
+    python -m benchmarks.ocr --generate --corpus benchmarks/corpus
+    python -m benchmarks.ocr --corpus benchmarks/corpus --systems tesseract --output after.json --compare before.json
+'''
+import os
+import glob
+import json
+import time
+import random
+import shutil
+import argparse
+import subprocess
+
+import cv2
+import numpy as np
+import pytesseract
+from rapidfuzz.distance import Levenshtein
+
+from src.ocr_systems import TesseractOCR, EasyOCR
+from config.config import PYTESSERACT_PATH
+
+
+SYSTEMS = {
+    'tesseract': TesseractOCR,
+    'easyocr': EasyOCR,
+}
+
+# Replacements of `preprocessing_image`, called with the image and the default method
+VARIANTS = {
+    'default': lambda image, default: default(image),
+    'gray': lambda image, default: cv2.cvtColor(image, cv2.COLOR_RGB2GRAY),
+    'otsu': lambda image, default: cv2.threshold(
+        cv2.cvtColor(image, cv2.COLOR_RGB2GRAY), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU
+    )[1],
+    'adaptive': lambda image, default: cv2.adaptiveThreshold(
+        cv2.cvtColor(image, cv2.COLOR_RGB2GRAY), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10
+    ),
+}
+
+SAMPLE_LINES = [
+    'Where are you going at this hour?',
+    'The bridge to the north was destroyed.',
+    'You found 3 potions and a rusty key.',
+    'Do not trust the merchant in the square.',
+    'We have to leave before the sun rises.',
+    'Press any button to continue',
+    'Quest updated: Find the lost caravan',
+    'I knew your father, he was a brave man.',
+    'Is that really all you have to say?',
+    'The gate will open only at midnight.',
+]
+
+
+def use_tesseract_from_path() -> None:
+    # The configured path is the Windows one, on other systems tesseract is taken from PATH
+    if not os.path.isfile(PYTESSERACT_PATH) and shutil.which('tesseract'):
+        pytesseract.pytesseract.tesseract_cmd = shutil.which('tesseract')
+
+
+def generate_corpus(path: str, frames: int, seed: int) -> None:
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    fonts = [cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX, cv2.FONT_HERSHEY_TRIPLEX]
+    for i in range(frames):
+        width, height = 960, 240
+        # A gradient with noise and a few shapes, like a dimmed game scene
+        top, bottom = np.array([rng.randrange(256) for _ in range(3)]), np.array([rng.randrange(256) for _ in range(3)])
+        gradient = np.linspace(top, bottom, height)[:, None, :].repeat(width, axis=1)
+        noise = np.random.default_rng(seed + i).normal(0, 12, (height, width, 3))
+        image = np.clip(gradient * 0.6 + noise, 0, 255).astype(np.uint8)
+        for _ in range(rng.randint(2, 6)):
+            x, y = rng.randrange(width), rng.randrange(height)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            cv2.rectangle(image, (x, y), (x + rng.randint(20, 200), y + rng.randint(20, 100)), color, -1)
+
+        font = rng.choice(fonts)
+        scale = rng.uniform(0.8, 1.2)
+        lines = []
+        y = 40
+        for text in rng.sample(SAMPLE_LINES, rng.randint(1, 3)):
+            (text_width, text_height), baseline = cv2.getTextSize(text, font, scale, 2)
+            x = max((width - text_width) // 2 + rng.randint(-40, 40), 0)
+            # Outlined white text, as subtitles are usually drawn
+            cv2.putText(image, text, (x, y + text_height), font, scale, (0, 0, 0), 6, cv2.LINE_AA)
+            cv2.putText(image, text, (x, y + text_height), font, scale, (255, 255, 255), 2, cv2.LINE_AA)
+            lines.append({'text': text, 'box': [x, y, text_width, text_height + baseline]})
+            y += text_height + baseline + rng.randint(20, 40)
+
+        name = os.path.join(path, f'synthetic_{i:03d}')
+        cv2.imwrite(name + '.png', cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+        with open(name + '.json', 'w', encoding='utf-8') as file:
+            json.dump({'lines': lines}, file, ensure_ascii=False, indent=1)
+
+
+def load_corpus(path: str) -> list:
+    corpus = []
+    for image_path in sorted(glob.glob(os.path.join(path, '*.png')) + glob.glob(os.path.join(path, '*.jpg'))):
+        truth_path = os.path.splitext(image_path)[0] + '.json'
+        if not os.path.isfile(truth_path):
+            print(f'No ground truth for {image_path}')
+            continue
+        with open(truth_path, encoding='utf-8') as file:
+            lines = json.load(file)['lines']
+        image = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+        corpus.append((os.path.basename(image_path), image, lines))
+    return corpus
+
+
+def reading_order(lines: list) -> list:
+    return sorted(lines, key=lambda line: (line['box'][1], line['box'][0]))
+
+
+def iou(a: list, b: list) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_w = max(min(ax + aw, bx + bw) - max(ax, bx), 0)
+    overlap_h = max(min(ay + ah, by + bh) - max(ay, by), 0)
+    overlap = overlap_w * overlap_h
+    union = aw * ah + bw * bh - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+def mean_box_iou(truth: list, predicted: list) -> float:
+    '''
+    Every ground-truth line is matched to the free predicted line with the highest IoU,
+    a line without a match counts as 0.
+    '''
+    if not truth:
+        return 1.0 if not predicted else 0.0
+    pairs = sorted(
+        ((iou(t['box'], p['box']), i, j) for i, t in enumerate(truth) for j, p in enumerate(predicted)),
+        reverse=True
+    )
+    matched_truth, matched_predicted, total = set(), set(), 0.0
+    for score, i, j in pairs:
+        if score <= 0:
+            break
+        if i in matched_truth or j in matched_predicted:
+            continue
+        matched_truth.add(i)
+        matched_predicted.add(j)
+        total += score
+    return total / len(truth)
+
+
+def frame_errors(truth: list, predicted: list) -> tuple:
+    '''
+    Character and word edit distances between the texts of the frame in reading order,
+    with the number of the ground-truth characters and words.
+    '''
+    truth_text = '\n'.join(line['text'] for line in reading_order(truth))
+    predicted_text = '\n'.join(line['text'] for line in reading_order(predicted))
+    truth_words, predicted_words = truth_text.split(), predicted_text.split()
+    return (
+        Levenshtein.distance(truth_text, predicted_text), len(truth_text),
+        Levenshtein.distance(truth_words, predicted_words), len(truth_words),
+    )
+
+
+def run(ocr_system, variant: str, corpus: list, repeat: int) -> dict:
+    default_preprocessing = ocr_system.preprocessing_image
+    ocr_system.preprocessing_image = lambda image: VARIANTS[variant](image, default_preprocessing)
+    try:
+        # The first call loads the models and warms up the caches
+        ocr_system.ocr_process_image(corpus[0][1])
+        latencies, steps = [], {}
+        char_errors = chars = word_errors = words = 0
+        ious = []
+        for _, image, truth in corpus:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _, _, lines = ocr_system.ocr_process_image(image)
+                latencies.append(time.perf_counter() - start)
+                for step, duration in ocr_system.timings.items():
+                    steps.setdefault(step, []).append(duration)
+            predicted = [{'text': text, 'box': [x, y, w, h]} for text, y, h, x, w in lines]
+            frame_char_errors, frame_chars, frame_word_errors, frame_words = frame_errors(truth, predicted)
+            char_errors += frame_char_errors
+            chars += frame_chars
+            word_errors += frame_word_errors
+            words += frame_words
+            ious.append(mean_box_iou(truth, predicted))
+    finally:
+        ocr_system.preprocessing_image = default_preprocessing
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'latency_ms': {
+            'mean': float(latencies.mean()),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+        },
+        'steps_ms': {step: float(np.mean(durations) * 1000) for step, durations in steps.items()},
+        'cer': char_errors / chars if chars else 0.0,
+        'wer': word_errors / words if words else 0.0,
+        'iou': float(np.mean(ious)),
+    }
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def print_results(results: list, previous: list = None) -> None:
+    previous = {(r['system'], r['variant']): r for r in previous or []}
+    print(f"{'system':<10}{'variant':<10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'CER':>8}{'WER':>8}{'IoU':>7}")
+    for result in results:
+        latency = result['latency_ms']
+        print(
+            f"{result['system']:<10}{result['variant']:<10}"
+            f"{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}"
+            f"{result['cer']:>8.3f}{result['wer']:>8.3f}{result['iou']:>7.3f}"
+        )
+        old = previous.get((result['system'], result['variant']))
+        if old is not None:
+            old_latency = old['latency_ms']
+            print(
+                f"{'':<10}{'change':<10}"
+                f"{latency['p50'] - old_latency['p50']:>+9.1f}{latency['p95'] - old_latency['p95']:>+9.1f}"
+                f"{latency['p99'] - old_latency['p99']:>+9.1f}{result['cer'] - old['cer']:>+8.3f}"
+                f"{result['wer'] - old['wer']:>+8.3f}{result['iou'] - old['iou']:>+7.3f}"
+            )
+        steps = ', '.join(f'{step} {duration:.1f}' for step, duration in result['steps_ms'].items())
+        print(f"{'':<20}steps, ms: {steps}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default='benchmarks/corpus')
+    parser.add_argument('--generate', action='store_true', help='write a synthetic corpus first')
+    parser.add_argument('--frames', type=int, default=20, help='frames of the synthetic corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--systems', nargs='+', choices=list(SYSTEMS), default=['tesseract'])
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--language', default='english')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every frame')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    args = parser.parse_args()
+
+    use_tesseract_from_path()
+    if args.generate:
+        generate_corpus(args.corpus, args.frames, args.seed)
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        parser.error(f'No images with ground truth in {args.corpus}')
+
+    results = []
+    for system_name in args.systems:
+        ocr_system = SYSTEMS[system_name](args.language)
+        for variant in args.variants:
+            result = run(ocr_system, variant, corpus, args.repeat)
+            results.append({'system': system_name, 'variant': variant, **result})
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            previous = json.load(file)['results']
+    print(f'{len(corpus)} frames, {args.repeat} runs each')
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({
+                'commit': current_commit(),
+                'corpus': args.corpus,
+                'frames': len(corpus),
+                'repeat': args.repeat,
+                'results': results,
+            }, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+'''
+Replays a trace recorded with TRACE_RECORDING against another OCR or translator configuration.
+
+Every captured frame of the trace is recognized again, and with `--translator`
+the recognized lines are translated again. The results are compared with the recorded
+lines and translations, and the timings with the recorded ones. The recorded
+translation time is the time from the recognized frame to its fully translated frame,
+so it includes the wait in the translation scheduler.
+The translation memory is not used, so every line reaches the translator.
+
+    python -m benchmarks.replay_trace traces/trace_20240101_120000.trace --ocr tesseract --variant otsu
+    python -m benchmarks.replay_trace traces/trace_20240101_120000.trace --translator google --target russian --show-diffs
+'''
+import json
+import time
+import difflib
+import argparse
+
+import numpy as np
+from rapidfuzz.distance import Levenshtein
+
+import config.config as config
+config.USE_TRANSLATION_MEMORY = False
+
+from src.trace import TraceReader
+from src.translators.translators import GoogleTranslator, YandexTranslator, DeeplTranslator
+from src.translators.routing import RoutingTranslator
+from src.translators.offline import OfflineTranslator
+from benchmarks.ocr import SYSTEMS, VARIANTS, use_tesseract_from_path
+
+
+TRANSLATORS = {
+    'google': GoogleTranslator,
+    'yandex': YandexTranslator,
+    'deepl': DeeplTranslator,
+    'fastest': RoutingTranslator,
+    'offline': OfflineTranslator,
+}
+
+
+def load_frames(reader: TraceReader) -> list:
+    '''
+    Groups the events of the trace by frame: the captured image, the recognized lines
+    and the last fully translated text, in the order of capture.
+    '''
+    frames = {}
+    for event in reader.events():
+        frame = frames.setdefault((event['frame_id'], event['region']), {})
+        if event['event'] == 'capture':
+            frame['image'] = event['image']
+        elif event['event'] == 'ocr':
+            frame['ocr'] = event
+        elif event['event'] == 'text' and not event['partial']:
+            frame['text'] = event
+    return [frame for frame in frames.values() if 'image' in frame]
+
+
+def texts(lines: list) -> list:
+    return [line[0] for line in lines]
+
+
+def distance(recorded: list, replayed: list) -> float:
+    return Levenshtein.normalized_distance('\n'.join(recorded), '\n'.join(replayed))
+
+
+def print_diff(title: str, recorded: list, replayed: list) -> None:
+    print(title)
+    for line in difflib.unified_diff(recorded, replayed, 'recorded', 'replayed', lineterm='', n=0):
+        print('    ' + line)
+
+
+def summary(values: list) -> dict:
+    if not values:
+        return {}
+    values = np.array(values) * 1000
+    return {'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)), 'mean': float(values.mean())}
+
+
+def format_summary(values: dict) -> str:
+    return ', '.join(f'{name} {value:.1f} ms' for name, value in values.items()) if values else 'no samples'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace')
+    parser.add_argument('--ocr', choices=list(SYSTEMS), default='tesseract')
+    parser.add_argument('--variant', choices=list(VARIANTS), default='default', help='preprocessing of the OCR')
+    parser.add_argument('--language', default='english', help='language of the OCR and the source of the translator')
+    parser.add_argument('--translator', choices=list(TRANSLATORS))
+    parser.add_argument('--target', default='russian')
+    parser.add_argument('--unique', action='store_true', help='replay every distinct image once')
+    parser.add_argument('--show-diffs', action='store_true')
+    parser.add_argument('--output', help='save the summary to this JSON file')
+    args = parser.parse_args()
+
+    use_tesseract_from_path()
+    reader = TraceReader(args.trace)
+    frames = load_frames(reader)
+    if args.unique:
+        unique = {}
+        for frame in frames:
+            unique.setdefault(frame['image'], frame)
+        frames = list(unique.values())
+
+    ocr_system = SYSTEMS[args.ocr](args.language)
+    default_preprocessing = ocr_system.preprocessing_image
+    ocr_system.preprocessing_image = lambda image: VARIANTS[args.variant](image, default_preprocessing)
+    translator = TRANSLATORS[args.translator](args.language, args.target) if args.translator else None
+
+    timings = {'recorded ocr': [], 'replayed ocr': [], 'recorded translate': [], 'replayed translate': []}
+    steps = {}
+    ocr_changed, ocr_distances = 0, []
+    translation_changed, translation_distances = 0, []
+    for frame in frames:
+        image = reader.image(frame['image'])
+        start = time.perf_counter()
+        _, _, lines = ocr_system.ocr_process_image(image)
+        timings['replayed ocr'].append(time.perf_counter() - start)
+        for step, duration in ocr_system.timings.items():
+            steps.setdefault(step, []).append(duration)
+        replayed_lines = texts(lines)
+
+        ocr_event = frame.get('ocr')
+        if ocr_event is not None:
+            recorded_lines = texts(ocr_event['lines'])
+            if 'ocr' in ocr_event['timings']:
+                timings['recorded ocr'].append(ocr_event['timings']['ocr'])
+            ocr_distances.append(distance(recorded_lines, replayed_lines))
+            if recorded_lines != replayed_lines:
+                ocr_changed += 1
+                if args.show_diffs:
+                    print_diff(f"Frame {frame['ocr']['frame_id']}, region {frame['ocr']['region']}, lines:", recorded_lines, replayed_lines)
+
+        if translator is None or not replayed_lines:
+            continue
+        start = time.perf_counter()
+        replayed_translations = translator.translate_batch_concat(replayed_lines)
+        timings['replayed translate'].append(time.perf_counter() - start)
+        text_event = frame.get('text')
+        if text_event is None:
+            continue
+        recorded_translations = texts(text_event['translated'])
+        if ocr_event is not None:
+            timings['recorded translate'].append(text_event['time'] - ocr_event['time'])
+        translation_distances.append(distance(recorded_translations, replayed_translations))
+        if recorded_translations != replayed_translations:
+            translation_changed += 1
+            if args.show_diffs:
+                print_diff(f"Frame {text_event['frame_id']}, region {text_event['region']}, translations:", recorded_translations, replayed_translations)
+
+    result = {
+        'trace': args.trace,
+        'frames': len(frames),
+        'ocr': args.ocr,
+        'variant': args.variant,
+        'translator': args.translator,
+        'ocr_changed_frames': ocr_changed,
+        'ocr_distance': float(np.mean(ocr_distances)) if ocr_distances else 0.0,
+        'translation_changed_frames': translation_changed,
+        'translation_distance': float(np.mean(translation_distances)) if translation_distances else 0.0,
+        'timings_ms': {name: summary(values) for name, values in timings.items()},
+        'steps_ms': {step: summary(values) for step, values in steps.items()},
+    }
+    print(f"{len(frames)} frames, {len(reader.images)} distinct images")
+    print(f"OCR: {ocr_changed} frames differ, mean normalized edit distance {result['ocr_distance']:.3f}")
+    if translator is not None:
+        print(
+            f"Translation: {translation_changed} frames differ, "
+            f"mean normalized edit distance {result['translation_distance']:.3f}"
+        )
+    for name, values in result['timings_ms'].items():
+        if values:
+            print(f'{name:<20}{format_summary(values)}')
+    for step, values in result['steps_ms'].items():
+        print(f'    {step:<16}{format_summary(values)}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=1)
+    reader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+'''
+Latency of RoutingTranslator with hedged requests against local stand-in backends.
+
+Two stand-in servers answer like the mobile page of Google Translate:
+    fast   answers in `--fast` seconds, but one request in `--spike-rate`
+           takes `--spike` seconds, and one in `--empty-rate` has an empty result
+    slow   always answers in `--slow` seconds
+
+Every backend is measured alone with GoogleTranslator and then through RoutingTranslator,
+which prefers the fast one and hedges it with the slow one after the p95 latency of the fast one.
+The joined batches check that a backend answering with empty lines is not accepted.
+
+    python -m benchmarks.routing --requests 100 --spike-rate 0.1
+'''
+import sys
+import html
+import time
+import random
+import argparse
+import threading
+from functools import partial
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+import config.config as config
+config.USE_TRANSLATION_MEMORY = False
+
+from src.translators.translators import GoogleTranslator
+from src.translators.routing import RoutingTranslator
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, name: str, latency, empty_rate: float = 0.0, seed: int = 0):
+        super(StandInServer, self).__init__(('127.0.0.1', 0), StandInHandler)
+        self.name = name
+        self.latency = latency
+        self.empty_rate = empty_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}/m?'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive
+
+    def do_GET(self):
+        server = self.server
+        text = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+        with server.lock:
+            server.requests += 1
+            delay = server.latency(server.rng)
+            empty = server.rng.random() < server.empty_rate
+        time.sleep(delay)
+        result = '' if empty else html.escape(text.upper())
+        body = f'<div class="result-container">{result}</div>'.encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            pass # the hedged request was cancelled
+
+
+    def log_message(self, *args):
+        pass
+
+
+def percentiles(values: list) -> str:
+    values = np.array(values) * 1000
+    return (
+        f'p50 {np.percentile(values, 50):.0f} ms, p95 {np.percentile(values, 95):.0f} ms, '
+        f'p99 {np.percentile(values, 99):.0f} ms, max {values.max():.0f} ms'
+    )
+
+
+def measure(translator, lines: list) -> tuple:
+    latencies, empty = [], 0
+    for line in lines:
+        start = time.perf_counter()
+        translated = translator.translate(line)
+        latencies.append(time.perf_counter() - start)
+        empty += not translated
+    return latencies, empty
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--batches', type=int, default=50, help='joined batches of 1 to 5 lines')
+    parser.add_argument('--fast', type=float, default=0.05, help='seconds')
+    parser.add_argument('--slow', type=float, default=0.3, help='seconds')
+    parser.add_argument('--spike', type=float, default=2.0, help='seconds')
+    parser.add_argument('--spike-rate', type=float, default=0.1)
+    parser.add_argument('--empty-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    fast = StandInServer(
+        'fast', lambda rng: args.spike if rng.random() < args.spike_rate else args.fast,
+        args.empty_rate, args.seed
+    )
+    slow = StandInServer('slow', lambda rng: args.slow, seed=args.seed)
+    for server in (fast, slow):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    lines = [f'stand-in line number {i}' for i in range(args.requests)]
+
+    for server in (fast, slow):
+        translator = GoogleTranslator('english', 'russian', base_url=server.base_url)
+        latencies, empty = measure(translator, lines)
+        print(f'{server.name} alone: {percentiles(latencies)}, {empty} empty')
+        translator.close()
+
+    router = RoutingTranslator('english', 'russian', backends=[
+        partial(GoogleTranslator, base_url=slow.base_url),
+        partial(GoogleTranslator, base_url=fast.base_url),
+    ])
+    fast.requests = slow.requests = 0
+    latencies, empty = measure(router, lines)
+    print(f'routing: {percentiles(latencies)}, {empty} empty')
+    print(f'    requests: fast {fast.requests}, slow {slow.requests}')
+
+    wrong = 0
+    for i in range(args.batches):
+        batch = [f'batch {i} line {j}' for j in range(1 + i % 5)]
+        translated = router.translate_batch_concat(batch)
+        wrong += translated != [line.upper() for line in batch]
+    print(f'routing joined batches: {wrong} of {args.batches} wrong')
+    router.close()
+    fast.shutdown()
+    slow.shutdown()
+    sys.exit(1 if wrong or empty else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+'''
+Regression check of the TranslationStage and TranslationScheduler when the lines
+of one frame are translated in separate batches that finish at different times.
+
+A stand-in translator answers after a fixed delay per line. In every scenario a region
+shows a sequence of frames, and the check expects the last frame to be rendered complete,
+with every line requested once:
+    grown          [A], then [A, B] while A is in flight
+    grown-reverse  the same, B is translated before A
+    sequential     [A, B, C] with one batch in flight at a time
+    replaced       [A, B], then [A, C] while B is in flight, B is cancelled
+    failing        one line shown for `--frames` frames, every translation fails:
+                   the line is retried with a growing delay, and the rendered frames
+                   show the recognized text instead of an empty translation
+
+    python -m benchmarks.scheduler_interleaving
+'''
+import sys
+import time
+import asyncio
+import argparse
+
+import config.config as config
+from src.pipeline import TranslationStage, RegionQueue, Frame
+
+
+SCENARIOS = {
+    # name: (frames as (delay before the frame, lines), delays of the lines, max concurrency)
+    'grown': ([(0, ['A']), (0.05, ['A', 'B'])], {'A': 0.2, 'B': 0.4}, 4),
+    'grown-reverse': ([(0, ['A']), (0.05, ['A', 'B'])], {'A': 0.4, 'B': 0.1}, 4),
+    'sequential': ([(0, ['A', 'B', 'C'])], {'A': 0.1, 'B': 0.1, 'C': 0.1}, 1),
+    'replaced': ([(0, ['A', 'B']), (0.05, ['A', 'C'])], {'A': 0.1, 'B': 0.4, 'C': 0.2}, 4),
+}
+
+
+class StandInTranslator():
+    '''
+    Translates a line to its lower case after the delay of the line, or fails every line.
+    '''
+    def __init__(self, delays: dict, max_concurrency: int, failing: bool = False):
+        self.delays = delays
+        self.max_concurrency = max_concurrency
+        self.failing = failing
+        self.requests = []
+
+
+    async def atranslate_batch_concat(self, batch: list) -> list:
+        self.requests.append(list(batch))
+        await asyncio.sleep(max(self.delays[text] for text in batch))
+        if self.failing:
+            return [''] * len(batch)
+        return [text.lower() for text in batch]
+
+
+def make_frame(frame_id: int, lines: list) -> Frame:
+    frame = Frame(frame_id, None, 0)
+    frame.lines = [(line, 20 * i, 16, 0, 100) for i, line in enumerate(lines)]
+    return frame
+
+
+def run(name: str, timeout: float) -> bool:
+    frames, delays, max_concurrency = SCENARIOS[name]
+    translator = StandInTranslator(delays, max_concurrency)
+    queue = RegionQueue()
+    stage = TranslationStage(translator, queue)
+    stage.scheduler.batch_lines = 1
+    rendered = [] # (partial, translations)
+    stage.connect_output(lambda frame: rendered.append((frame.partial, [text for text, *_ in frame.translated])))
+    stage.start()
+
+    for frame_id, (delay, lines) in enumerate(frames, 1):
+        time.sleep(delay)
+        queue.put(make_frame(frame_id, lines))
+    last_lines = frames[-1][1]
+    expected = [line.lower() for line in last_lines]
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline and (False, expected) not in rendered:
+        time.sleep(0.01)
+    stage.stop()
+    stage.wait()
+
+    complete = [translations for partial, translations in rendered if not partial]
+    requested = [text for batch in translator.requests for text in batch]
+    distinct = {line for _, lines in frames for line in lines}
+    ok = (
+        complete and complete[-1] == expected
+        and sorted(requested) == sorted(distinct)
+    )
+    print(
+        f"{'ok    ' if ok else 'FAILED'} {name}: {len(translator.requests)} requests {requested}, "
+        f"{len(complete)} complete frames, {len(rendered) - len(complete)} partial frames"
+    )
+    return ok
+
+
+def run_failing(frames: int, interval: float) -> bool:
+    translator = StandInTranslator({'Hello world': 0.01}, 4, failing=True)
+    queue = RegionQueue()
+    stage = TranslationStage(translator, queue)
+    stage.progressive_rendering = 'source'
+    rendered = []
+    stage.connect_output(lambda frame: rendered.append((frame.partial, [text for text, *_ in frame.translated])))
+    stage.start()
+    start = time.perf_counter()
+    for frame_id in range(1, frames + 1):
+        queue.put(make_frame(frame_id, ['Hello world']))
+        time.sleep(interval)
+    elapsed = time.perf_counter() - start
+    stage.stop()
+    stage.wait()
+
+    # The first request and the retries after 1, 2, 4... retry delays
+    retries, waited = 0, config.TRANSLATION_RETRY_DELAY
+    while waited <= elapsed:
+        retries += 1
+        waited += config.TRANSLATION_RETRY_DELAY * 2 ** retries
+    empty = sum(1 for _, translations in rendered if '' in translations)
+    ok = len(translator.requests) <= retries + 1 and not empty and rendered == [(True, ['Hello world'])]
+    print(
+        f"{'ok    ' if ok else 'FAILED'} failing: {len(translator.requests)} requests in {elapsed:.1f} s "
+        f"(at most {retries + 1}), {len(rendered)} rendered frames, {empty} with an empty line"
+    )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS) + ['failing'], default=list(SCENARIOS) + ['failing'])
+    parser.add_argument('--timeout', type=float, default=3.0, help='seconds to wait for the complete frame')
+    parser.add_argument('--frames', type=int, default=40, help='frames of the failing scenario')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between the frames of the failing scenario')
+    args = parser.parse_args()
+    results = [
+        run_failing(args.frames, args.interval) if name == 'failing' else run(name, args.timeout)
+        for name in args.scenarios
+    ]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
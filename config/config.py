@@ -2,9 +2,68 @@ PYTESSERACT_PATH = 'C:/Users/USER_NAME/AppData/Local/Programs/Tesseract-OCR/tess
 
 SETTINGS_PATH = './config/settings.ini'
 
+CAPTURE_INTERVAL = 0.05 # minimum time between two captures, in seconds
+PIPELINE_STATS_INTERVAL = 0 # print stage statistics every N seconds, 0 - disabled
+TRANSLATION_BATCH_LINES = 16 # lines sent to the translator at once
+# A line whose translation failed is requested again after this delay, doubled after every failure
+TRANSLATION_RETRY_DELAY = 1.0 # in seconds
+TRANSLATION_RETRY_MAX_DELAY = 30.0 # in seconds
+# What is shown in place of a line until it is translated: 
+# '' - nothing, the whole frame waits, 'source' - the recognized text, 'previous' - the previous translation
+PROGRESSIVE_RENDERING = 'source'
+# Lines revealed character by character are translated once they stop growing
+TYPEWRITER_STABILIZATION = True
+TYPEWRITER_STABLE_FRAMES = 2 # frames without a change after which a revealed line is translated
+TYPEWRITER_STABLE_TIME = 0.2 # or time without a change, in seconds
+
+STATS_OVERLAY = False # on-screen panel with the latency of the pipeline steps
+STATS_OVERLAY_INTERVAL = 1 # refresh interval of the panel, in seconds
+METRICS_PROMETHEUS_PORT = 0 # serve the latency histograms at http://127.0.0.1:PORT/metrics, 0 - disabled
+METRICS_JSONL_PATH = '' # append the latency histograms to this JSON lines file, '' - disabled
+METRICS_EXPORT_INTERVAL = 5 # of the JSON lines file, in seconds
+
+# Profiling is started and stopped with Left Ctrl + F12
+# 'sample' - stacks of all threads sampled into a speedscope file, 'cprofile' - pstats of the GUI and the pipeline threads
+PROFILER_MODE = 'sample'
+PROFILER_SAMPLE_INTERVAL = 0.005 # in seconds
+PROFILE_ON_START = False # start profiling with the application, it is saved by the hotkey or on exit
+PROFILES_PATH = './profiles'
+
+TRACE_RECORDING = False # record the captured frames, lines, translations and timings for benchmarks/replay_trace.py
+TRACE_PATH = './traces'
+
+HTTP_TIMEOUT = (3.05, 5) # (connect, read) timeouts of translator requests, in seconds
+HTTP_RETRIES = 2
+HTTP_MAX_CONCURRENCY = 4 # parallel requests of one HTTP translator
+CONCAT_MAX_CHARS = 1000 # characters of the lines joined into one translation request
+CONCAT_MAX_REQUEST_SIZE = 1800 # URL-encoded size of the lines joined into one request, in bytes
+
+ROUTING_WINDOW = 100 # requests of each translator used to rank the translators
+ROUTING_MAX_ERROR_RATE = 0.5 # translators failing more often are tried last
+HEDGE_DEFAULT_DELAY = 1.0 # delay of the hedged request until the latency is measured, in seconds
+HEDGE_MIN_DELAY = 0.05 # in seconds
+
+BROWSER_POOL_SIZE = 2 # headless browsers used by the browser based translators
+BROWSER_MAX_REQUESTS = 500 # a browser is restarted after this number of translations
+WEBDRIVER_CACHE_PATH = './config/webdriver_cache.json' # the browser and driver found on the first start
+
+OFFLINE_MODEL_PATH = './models/nllb-200-distilled-600M-int8' # CTranslate2 model of the offline translator
+OFFLINE_TRANSLATOR_THREADS = 4
+OFFLINE_BEAM_SIZE = 2
+OFFLINE_MAX_DECODING_LENGTH = 256
+
+USE_TRANSLATION_MEMORY = True
+TRANSLATION_MEMORY_PATH = './config/translation_memory.db'
+TRANSLATION_MEMORY_LRU_SIZE = 2048
+TRANSLATION_MEMORY_MAX_ENTRIES = 200_000
+TRANSLATION_MEMORY_TTL = 30 * 24 * 60 * 60 # in seconds
+USE_FUZZY_TRANSLATION_MEMORY = True
+FUZZY_MATCH_THRESHOLD = 90 # minimum fuzz.ratio of a noisy OCR line and a stored one
+
 APP_SETTINGS_GROUP = 'AppSettings'
 OCR_SYSTEM_NAME_KEY = 'ocr_system_name'
 OCR_SYSTEM_LANGUAGE_KEY = 'ocr_system_language'
+OCR_PROCESSES_KEY = 'ocr_processes'
 SUBTITLE_MODE_NAME_KEY = 'subtitle_mode_name'
 TRANSLATOR_NAME_KEY = 'translator_name'
 TRANSLATOR_TARGET_LANGUAGE_KEY = 'translator_target_language'
@@ -15,6 +74,7 @@ TEXT_STYLE_KEYS = ['font-family', 'font-style', 'font-weight', 'text-decoration'
 DEFAULT_SETTINGS = {
     f'{APP_SETTINGS_GROUP}/{OCR_SYSTEM_NAME_KEY}': 'TesseractOCR',
     f'{APP_SETTINGS_GROUP}/{OCR_SYSTEM_LANGUAGE_KEY}': 'english',
+    f'{APP_SETTINGS_GROUP}/{OCR_PROCESSES_KEY}': 0, # 0 - OCR runs in the pipeline thread
     f'{APP_SETTINGS_GROUP}/{SUBTITLE_MODE_NAME_KEY}': 'Background Mode',
     f'{APP_SETTINGS_GROUP}/{TRANSLATOR_NAME_KEY}': 'Google Translator',
     f'{APP_SETTINGS_GROUP}/{TRANSLATOR_TARGET_LANGUAGE_KEY}': 'russian',
@@ -11,10 +11,16 @@ from PyQt5.QtCore import  pyqtSignal
 from PyQt5.QtGui import QPixmap, QPainter, QColor, QPalette, QBrush, QImage
 
 from src.ocr_systems import TesseractOCR, EasyOCR
+from src.ocr_pool import OcrProcessPool
 from src.subtitle_window import BackgroundSubtitleWindow, InpaintingSubtitleWindow
-from src.widgets import InterfaceSettingsWidget, MainSettingsWidget, FontStyleSettingsWidget
+from src.pipeline import TranslationPipeline
+from src.widgets import InterfaceSettingsWidget, MainSettingsWidget, FontStyleSettingsWidget, StatsOverlayWidget
+from src.metrics import start_exporters
+from src.profiler import Profiler
+from src.trace import TraceRecorder
 from src.translators.translators import GoogleTranslator, DeeplTranslator, YandexTranslator
-from src.translators.driver import WebDriverManager
+from src.translators.routing import RoutingTranslator
+from src.translators.offline import OfflineTranslator
 from config.config import *  # noqa: F403
 
 import pytesseract
@@ -27,6 +33,7 @@ pytesseract.pytesseract.tesseract_cmd = PYTESSERACT_PATH  # noqa: F405
 class MinMaxThread(QThread):
     
     update_signal = pyqtSignal()
+    profiler_signal = pyqtSignal()
     
     def __init__(self, window, parent=None):
         super(MinMaxThread, self).__init__(parent)
@@ -36,6 +43,10 @@ class MinMaxThread(QThread):
             keyboard.Key.ctrl_l, 
             keyboard.Key.alt_l, 
         }
+        self.profiler_hotkey_combination = {
+            keyboard.Key.ctrl_l,
+            keyboard.Key.f12,
+        }
         self.current_keys = set()
 
         
@@ -46,11 +57,17 @@ class MinMaxThread(QThread):
                 
     def on_key_press(self, key):
         try:
+            is_new_key = key not in self.current_keys
             if key in self.hotkey_combination:
                 self.current_keys.add(key)
                 # If all combination keys are pressed, minimize/maximize the window
                 if all(k in self.current_keys for k in self.hotkey_combination):
                     self.update_signal.emit()
+            if key in self.profiler_hotkey_combination:
+                self.current_keys.add(key)
+                # Start or stop profiling, once per press and not on the key repeat
+                if is_new_key and all(k in self.current_keys for k in self.profiler_hotkey_combination):
+                    self.profiler_signal.emit()
         except Exception as e:
             print(e)
 
@@ -134,7 +151,17 @@ class ScreenTranslatorApp(QMainWindow):
     def __init__(self):
         super(ScreenTranslatorApp, self).__init__()
         self.origin = QPoint()  
-        self.subwindow = None
+        self.subwindows = []
+        self.pipeline = None
+        self.ocr_pool = None
+        self.recorder = None
+        self.metrics_exporters = start_exporters()
+        self.stats_overlay = None
+        if STATS_OVERLAY:  # noqa: F405
+            self.stats_overlay = StatsOverlayWidget()
+        self.profiler = Profiler()
+        if PROFILE_ON_START:  # noqa: F405
+            self.profiler.start()
         
         self.ocr_systems_dict = {
             "TesseractOCR": TesseractOCR, 
@@ -147,10 +174,11 @@ class ScreenTranslatorApp(QMainWindow):
         self.translators_dict = {
             "Google Translator": GoogleTranslator,
             "Deepl Translator": DeeplTranslator,
-            "Yandex Translator": YandexTranslator
+            "Yandex Translator": YandexTranslator,
+            "Fastest Translator": RoutingTranslator,
+            "Offline Translator": OfflineTranslator
         }
     
-        WebDriverManager()
         self.init_configuration()
         self.setWindowFlags(
             Qt.Window 
@@ -163,6 +191,7 @@ class ScreenTranslatorApp(QMainWindow):
         # Threads
         self.maxMinThread_instance = MinMaxThread(window=self)
         self.maxMinThread_instance.update_signal.connect(self.show_hide)
+        self.maxMinThread_instance.profiler_signal.connect(self.toggle_profiling)
         self.maxMinThread_instance.start()
         
         self.initUI()
@@ -183,6 +212,10 @@ class ScreenTranslatorApp(QMainWindow):
             f'{APP_SETTINGS_GROUP}/{OCR_SYSTEM_LANGUAGE_KEY}',   # noqa: F405
             DEFAULT_SETTINGS[f'{APP_SETTINGS_GROUP}/{OCR_SYSTEM_LANGUAGE_KEY}']  # noqa: F405
         )
+        self.ocr_processes = int(self.settings.value(
+            f'{APP_SETTINGS_GROUP}/{OCR_PROCESSES_KEY}',   # noqa: F405
+            DEFAULT_SETTINGS[f'{APP_SETTINGS_GROUP}/{OCR_PROCESSES_KEY}']  # noqa: F405
+        ))
         self.subtitle_mode_name = self.settings.value(
             f'{APP_SETTINGS_GROUP}/{SUBTITLE_MODE_NAME_KEY}',   # noqa: F405
             DEFAULT_SETTINGS[f'{APP_SETTINGS_GROUP}/{SUBTITLE_MODE_NAME_KEY}']  # noqa: F405
@@ -203,10 +236,20 @@ class ScreenTranslatorApp(QMainWindow):
 
         self.subtitle_mode = self.subtitle_modes_dict[self.subtitle_mode_name]
         self.ocr_system = self.ocr_systems_dict[self.ocr_system_name](self.ocr_system_language)
-        self.translator = self.translators_dict[self.translator_name](
-            source=self.ocr_system_language,
-            target=self.translator_target_language 
-        )
+        try:
+            self.translator = self.translators_dict[self.translator_name](
+                source=self.ocr_system_language,
+                target=self.translator_target_language 
+            )
+        except Exception as e:
+            # e.g. the model of the offline translator is not downloaded or the browser is not installed
+            print(e)
+            self.translator_name = DEFAULT_SETTINGS[f'{APP_SETTINGS_GROUP}/{TRANSLATOR_NAME_KEY}']  # noqa: F405
+            print(f'Falling back to {self.translator_name}')
+            self.translator = self.translators_dict[self.translator_name](
+                source=self.ocr_system_language,
+                target=self.translator_target_language 
+            )
         
         
     def initUI(self) -> None:
@@ -238,6 +281,11 @@ class ScreenTranslatorApp(QMainWindow):
         self.rubber_band.setPalette(rb_palette)
         self.rubber_band_selected = False
         
+        # Additional areas are selected with the Shift key held down,
+        # the previously selected areas stay visible
+        self.regions = []
+        self.region_bands = []
+        
         self.interface_window = None
         self.settings_window = None
         self.style_window = None
@@ -358,6 +406,36 @@ class ScreenTranslatorApp(QMainWindow):
         self.ocr_system = self.ocr_systems_dict[system_name](language=language)
         self.ocr_system_name = system_name
         self.ocr_system_language = language
+        self.close_ocr_pool()
+        
+    
+    def set_ocr_processes(self, processes: int) -> None:
+        if processes != self.ocr_processes:
+            self.ocr_processes = processes
+            self.close_ocr_pool()
+            
+    
+    def get_ocr_pool(self) -> Union[OcrProcessPool, None]:
+        '''
+        Returns the pool of OCR worker processes, or None if OCR runs in the pipeline thread.
+        The pool is started on first use, because each worker loads its own OCR engine.
+        '''
+        if self.ocr_processes <= 0:
+            return None
+        if self.ocr_pool is None:
+            self.ocr_pool = OcrProcessPool(
+                self.ocr_systems_dict[self.ocr_system_name],
+                self.ocr_system_language,
+                workers=self.ocr_processes
+            )
+        return self.ocr_pool
+    
+    
+    def close_ocr_pool(self) -> None:
+        if self.ocr_pool:
+            self.close_subwindow()
+            self.ocr_pool.close()
+        self.ocr_pool = None
     
     
     def set_subtitle_mode(self, mode_name: str) -> None:
@@ -366,11 +444,36 @@ class ScreenTranslatorApp(QMainWindow):
     
 
     def set_translator(self, translator_name: str, target_language: str) -> None:
+        '''
+        If the selected translator cannot be created, the current one is kept.
+        '''
+        translator = self.translator
+        languages = (translator.source_lang, translator.target_lang)
+        try:
+            # The same translator only switches the languages, so its session or page is reused
+            if type(self.translator) is self.translators_dict[translator_name]:
+                self.translator.source = self.ocr_system_language
+                self.translator.target = target_language.lower()
+                # The running pipeline shows and caches translations into the previous language
+                if self.pipeline:
+                    self.pipeline.reset_translations()
+            else:
+                self.translator = self.translators_dict[translator_name](
+                    self.ocr_system_language, target_language.lower()
+                )
+        except Exception as e:
+            print(e)
+            # Keeps the previous languages if only one of them was switched
+            self.translator = translator
+            self.translator.source_lang, self.translator.target_lang = languages
+            return
+        if self.translator is not translator:
+            try:
+                translator.close()
+            except Exception as e:
+                print(e)
         self.translator_target_language = target_language.lower()
         self.translator_name = translator_name
-        self.translator = self.translators_dict[translator_name](
-            self.ocr_system_language, self.translator_target_language 
-        )
         
 
     def toggle_interface_settings_window(self):
@@ -410,6 +513,7 @@ class ScreenTranslatorApp(QMainWindow):
     def create_settings_window(self) -> None:
         base_widget = MainSettingsWidget(main_window=self)
         base_widget.update_ocr_signal.connect(self.set_ocr_system)
+        base_widget.update_ocr_processes_signal.connect(self.set_ocr_processes)
         base_widget.update_subtitle_signal.connect(self.set_subtitle_mode)
         base_widget.update_translator_signal.connect(self.set_translator)
 
@@ -497,11 +601,17 @@ class ScreenTranslatorApp(QMainWindow):
         rb_palette = QPalette()
         rb_palette.setBrush(QPalette.Highlight, color)
         self.rubber_band.setPalette(rb_palette)
+        for band in self.region_bands:
+            band.setPalette(rb_palette)
         self.rb_color = color
 
 
     def mousePressEvent(self, event) -> None:
         if event.button() == Qt.LeftButton:
+            if event.modifiers() & Qt.ShiftModifier and self.rubber_band_selected:
+                self.keep_selected_region()
+            else:
+                self.clear_regions()
             self.origin = QPoint(event.pos())
             self.rubber_band.setGeometry(QRect(self.origin, QSize()))
             self.rubber_band.show()
@@ -531,35 +641,84 @@ class ScreenTranslatorApp(QMainWindow):
                 self.Y = self.y() + y
                 self.W = w
                 self.H = h
-                self.rubber_band_selected = True
-            else:
-                self.rubber_band_selected = False
+                self.regions.append((self.X, self.Y, self.W, self.H))
+            self.rubber_band_selected = bool(self.regions)
+    
+    
+    def keep_selected_region(self) -> None:
+        '''
+        Leaves a copy of the current selection on the screen, 
+        so that the rubber band can be used to select another area
+        '''
+        band = QRubberBand(QRubberBand.Rectangle, self)
+        band.setPalette(self.rubber_band.palette())
+        band.setGeometry(self.rubber_band.geometry())
+        band.show()
+        self.region_bands.append(band)
+        
+        
+    def clear_regions(self) -> None:
+        for band in self.region_bands:
+            band.deleteLater()
+        self.region_bands.clear()
+        self.regions.clear()
+        self.rubber_band_selected = False
         
                 
     def execute_continuous_function(self) -> None:
+        '''
+        Starts one pipeline for all the selected areas and a subtitle window for each of them.
+        The areas share one capture per tick, the OCR and the translation batches.
+        '''
         if self.rubber_band_selected:
             self.close_subwindow()
-            self.subwindow = self.subtitle_mode(
+            if TRACE_RECORDING:  # noqa: F405
+                self.recorder = TraceRecorder()
+            self.pipeline = TranslationPipeline(
                 ocr_system = self.ocr_system,
-                geometry = (self.X, self.Y, self.W, self.H),
+                regions = self.regions,
                 screen_rect = self.screen_geometry.getRect(),
-                text_style = self.text_style.copy(),
+                inpaint = self.subtitle_mode.inpaint,
                 translator = self.translator,
-                translate = True
+                translate = True,
+                ocr_pool = self.get_ocr_pool(),
+                recorder = self.recorder
             )
-            
-            self.subwindow.show()
+            for region, geometry in enumerate(self.regions):
+                subwindow = self.subtitle_mode(
+                    ocr_system = self.ocr_system,
+                    geometry = geometry,
+                    screen_rect = self.screen_geometry.getRect(),
+                    text_style = self.text_style.copy(),
+                    translator = self.translator,
+                    translate = True,
+                    pipeline = self.pipeline,
+                    region = region
+                )
+                subwindow.show()
+                self.subwindows.append(subwindow)
+            self.pipeline.start()
+            if self.stats_overlay:
+                self.stats_overlay.show()
+                self.stats_overlay.raise_()
 
             
     def close_subwindow(self) -> None:
-        if self.subwindow:
-            self.subwindow.close()
-        self.subwindow = None
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline.deleteLater()
+        self.pipeline = None
+        if self.recorder:
+            self.recorder.close()
+        self.recorder = None
+        for subwindow in self.subwindows:
+            subwindow.close()
+        self.subwindows.clear()
         
         
     def hide_subwindow(self) -> None:
-        if self.subwindow:
-            self.subwindow.hide()
+        for subwindow in self.subwindows:
+            subwindow.hide()
     
     
     def hide_main_window(self) -> None:
@@ -609,8 +768,20 @@ class ScreenTranslatorApp(QMainWindow):
         super().close(**kwargs)
         
             
+    def toggle_profiling(self) -> None:
+        # Runs in the GUI thread, so the GUI thread is profiled too
+        self.profiler.toggle()
+
+
     def closeEvent(self, event) -> None:
         self.close_subwindow()
+        self.close_ocr_pool()
+        self.translator.close()
+        self.profiler.stop()
+        for exporter in self.metrics_exporters:
+            exporter.close()
+        if self.stats_overlay:
+            self.stats_overlay.close()
         event.accept()
 
         
@@ -0,0 +1,223 @@
+import re
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional
+
+from config.config import METRICS_PROMETHEUS_PORT, METRICS_JSONL_PATH, METRICS_EXPORT_INTERVAL
+
+
+# Upper bounds of the histogram buckets: 0.25 ms to ~33 s, each bucket is sqrt(2) wider
+LATENCY_BUCKETS = tuple(0.00025 * 2 ** (i / 2) for i in range(35))
+
+
+@contextmanager
+def timed(timings: dict, name: str):
+    '''
+    Adds the duration of the block to `timings[name]`, in seconds.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class LatencyHistogram():
+    '''
+    Cumulative histogram of durations with fixed logarithmic buckets.
+    Recording a value is a binary search and an increment, so it can be done on every frame.
+    '''
+    def __init__(self, name: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one counts the values above all buckets
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+
+    def observe(self, duration: float) -> None:
+        index = bisect.bisect_left(self.buckets, duration)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += duration
+
+
+    def percentile(self, q: float) -> Optional[float]:
+        '''
+        Estimates the percentile by linear interpolation inside its bucket.
+        '''
+        with self.lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        rank = q / 100 * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * max(rank - seen, 0) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            count, total = self.count, self.sum
+        return {
+            'name': self.name,
+            'count': count,
+            'mean': total / count if count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+class MetricsRegistry():
+    '''
+    The latency histograms of the whole application, one per pipeline step.
+    Histograms are created on first use and are never reset, like Prometheus counters.
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(MetricsRegistry, cls).__new__(cls)
+                cls._instance.histograms = {}
+                cls._instance.histograms_lock = threading.Lock()
+        return cls._instance
+
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        with self.histograms_lock:
+            if name not in self.histograms:
+                self.histograms[name] = LatencyHistogram(name)
+            return self.histograms[name]
+
+
+    def observe(self, name: str, duration: float) -> None:
+        self.histogram(name).observe(duration)
+
+
+    def observe_all(self, timings: Dict[str, float]) -> None:
+        for name, duration in timings.items():
+            self.observe(name, duration)
+
+
+    def snapshot(self) -> List[dict]:
+        with self.histograms_lock:
+            histograms = list(self.histograms.values())
+        return [histogram.snapshot() for histogram in histograms]
+
+
+    def prometheus_text(self) -> str:
+        '''
+        The histograms in the Prometheus text exposition format.
+        '''
+        with self.histograms_lock:
+            histograms = list(self.histograms.values())
+        lines = [
+            '# HELP screen_translator_latency_seconds Duration of the pipeline steps.',
+            '# TYPE screen_translator_latency_seconds histogram',
+        ]
+        for histogram in histograms:
+            with histogram.lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            step = re.sub(r'\W+', '_', histogram.name)
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'screen_translator_latency_seconds_bucket{{step="{step}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'screen_translator_latency_seconds_bucket{{step="{step}",le="+Inf"}} {count}')
+            lines.append(f'screen_translator_latency_seconds_sum{{step="{step}"}} {total:.6f}')
+            lines.append(f'screen_translator_latency_seconds_count{{step="{step}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+class PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = MetricsRegistry().prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PrometheusExporter():
+    '''
+    Serves the metrics at http://127.0.0.1:<port>/metrics from a daemon thread.
+    '''
+    def __init__(self, port: int = METRICS_PROMETHEUS_PORT):
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), PrometheusHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JsonlExporter():
+    '''
+    Appends a snapshot of all histograms to a JSON lines file every `interval` seconds.
+    '''
+    def __init__(self, path: str = METRICS_JSONL_PATH, interval: float = METRICS_EXPORT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+
+    def write(self) -> None:
+        record = {'time': time.time(), 'histograms': MetricsRegistry().snapshot()}
+        try:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record) + '\n')
+        except OSError as e:
+            print(e)
+
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.thread.join()
+        self.write()
+
+
+def start_exporters() -> list:
+    '''
+    Starts the exporters enabled in the config.
+    '''
+    exporters = []
+    try:
+        if METRICS_PROMETHEUS_PORT:
+            exporters.append(PrometheusExporter())
+        if METRICS_JSONL_PATH:
+            exporters.append(JsonlExporter())
+    except OSError as e:
+        print(e)
+    return exporters
@@ -0,0 +1,209 @@
+import queue
+import threading
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Callable
+
+import numpy as np
+
+
+def _process_task(ocr_system, memory, offset: int, shape: tuple, inpaint: bool) -> tuple:
+    '''
+    Recognizes a frame stored in shared memory. The inpainted image is written
+    back in place of the frame and the mask right after it, only the lines 
+    and the durations of the OCR steps are returned.
+    '''
+    height, width, _ = shape
+    image = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf, offset=offset)
+    inpainted, mask, lines = ocr_system.ocr_process_image(image, inpaint=inpaint)
+    has_image = bool(len(inpainted) and len(mask))
+    if has_image:
+        image[:] = inpainted
+        np.ndarray((height, width), dtype=np.uint8, buffer=memory.buf, offset=offset + image.nbytes)[:] = mask
+    return lines, has_image, dict(ocr_system.timings)
+
+
+def _ocr_worker(ocr_class, language: str, tasks, results) -> None:
+    '''
+    Entry point of a worker process. The OCR engine is loaded once
+    and stays in memory for the lifetime of the process.
+    '''
+    ocr_system = ocr_class(language)
+    memory = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, memory_name, offset, shape, inpaint = task
+        start = time.perf_counter()
+        try:
+            # The ring is recreated when a bigger frame arrives
+            if memory is None or memory.name != memory_name:
+                if memory is not None:
+                    memory.close()
+                memory = shared_memory.SharedMemory(name=memory_name)
+            lines, has_image, timings = _process_task(ocr_system, memory, offset, shape, inpaint)
+            results.put((seq, lines, has_image, timings, time.perf_counter() - start, None))
+        except Exception as e:
+            results.put((seq, [], False, {}, time.perf_counter() - start, str(e)))
+    if memory is not None:
+        memory.close()
+
+
+class SharedFrameRing():
+    '''
+    A fixed number of equal slots in one shared memory block.
+    Each slot holds an RGB frame followed by a single channel mask.
+    '''
+    def __init__(self, slots: int, slot_size: int):
+        self.slot_size = slot_size
+        self.memory = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        self.free_slots = list(range(slots))
+
+
+    @staticmethod
+    def required_size(shape: tuple) -> int:
+        height, width, channels = shape
+        return height * width * (channels + 1)
+
+
+    def offset(self, slot: int) -> int:
+        return slot * self.slot_size
+
+
+    def frame_view(self, slot: int, shape: tuple) -> np.ndarray:
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.memory.buf, offset=self.offset(slot))
+
+
+    def mask_view(self, slot: int, shape: tuple) -> np.ndarray:
+        height, width, channels = shape
+        return np.ndarray(
+            (height, width), dtype=np.uint8, buffer=self.memory.buf,
+            offset=self.offset(slot) + height * width * channels
+        )
+
+
+    def close(self) -> None:
+        self.memory.close()
+        self.memory.unlink()
+
+
+class OcrProcessPool():
+    '''
+    Runs `ocr_process_image` in a pool of worker processes, so the OCR does not
+    compete with the GUI for the GIL. Frames are passed through a shared memory ring
+    instead of being pickled, and the results are delivered to the callbacks
+    in the order the frames were submitted.
+    '''
+    def __init__(self, ocr_class, language: str, workers: int = 2, slots_per_worker: int = 2):
+        if workers < 1:
+            raise ValueError('The pool must have at least one worker')
+        self.ocr_class = ocr_class
+        self.language = language
+        self.workers = workers
+        self.slots = workers * slots_per_worker
+        self.ring = None
+
+        context = mp.get_context('spawn')
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(
+                target=_ocr_worker,
+                args=(ocr_class, language, self.tasks, self.results),
+                daemon=True
+            ) for _ in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+        self.condition = threading.Condition()
+        self.in_flight = {} # seq -> (slot, shape, callback)
+        self.finished = {} # results that arrived before the previous frames
+        self.next_seq = 0
+        self.next_result = 0
+        self.is_running = True
+
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+
+    def submit(self, image: np.ndarray, inpaint: bool, callback: Callable) -> int:
+        '''
+        Copies the frame into a free slot and queues it for recognition.
+        Blocks while all slots are busy.
+        `callback(result, duration, timings)` is called from the dispatcher thread,
+        where result is (inpainted, mask, lines) as returned by `ocr_process_image`
+        and timings are the durations of the OCR steps.
+        '''
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        required_size = SharedFrameRing.required_size(image.shape)
+        with self.condition:
+            if self.ring is None or self.ring.slot_size < required_size:
+                while self.in_flight and self.is_running:
+                    self.condition.wait()
+                if self.ring is not None:
+                    self.ring.close()
+                self.ring = SharedFrameRing(self.slots, required_size)
+            while not self.ring.free_slots and self.is_running:
+                self.condition.wait()
+            if not self.is_running:
+                return -1
+
+            slot = self.ring.free_slots.pop()
+            seq = self.next_seq
+            self.next_seq += 1
+            self.in_flight[seq] = (slot, image.shape, callback)
+            self.ring.frame_view(slot, image.shape)[:] = image
+            self.tasks.put((seq, self.ring.memory.name, self.ring.offset(slot), image.shape, inpaint))
+        return seq
+
+
+    def _dispatch(self) -> None:
+        while self.is_running:
+            try:
+                seq, lines, has_image, timings, duration, error = self.results.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            with self.condition:
+                slot, shape, callback = self.in_flight.pop(seq)
+                if has_image:
+                    inpainted = self.ring.frame_view(slot, shape).copy()
+                    mask = self.ring.mask_view(slot, shape).copy()
+                else:
+                    inpainted, mask = np.empty(shape = (0,)), np.empty(shape = (0,))
+                self.ring.free_slots.append(slot)
+                self.finished[seq] = (callback, (inpainted, mask, lines), duration, timings, error)
+
+                ready = []
+                while self.next_result in self.finished:
+                    ready.append(self.finished.pop(self.next_result))
+                    self.next_result += 1
+                self.condition.notify_all()
+
+            for callback, result, duration, timings, error in ready:
+                if error:
+                    print(error)
+                    continue
+                try:
+                    callback(result, duration, timings)
+                except Exception as e:
+                    print(e)
+
+
+    def close(self) -> None:
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.dispatcher.join()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
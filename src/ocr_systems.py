@@ -1,7 +1,9 @@
+import time
 import numpy as np
 import cv2
 import pytesseract
 import easyocr
+from src.metrics import timed
 from config.config import PYTESSERACT_PATH
 
 pytesseract.pytesseract.tesseract_cmd = PYTESSERACT_PATH
@@ -21,6 +23,7 @@ class TesseractOCR():
     
     def __init__(self, language: str = 'english'):
         self.language = language.lower()
+        self.timings = {} # step -> duration of the last ocr_process_image call
     
 
     def get_line_size(self, word_sizes):
@@ -58,8 +61,14 @@ class TesseractOCR():
             image = np.array(image, dtype=np.uint8)
         if inpaint:
             mask = np.zeros_like(image, shape=image.shape[:-1], dtype=np.uint8)   
-            
-        ocr_data = self.detect_and_recognize(self.preprocessing_image(image))
+        self.timings = {}
+        
+        with timed(self.timings, 'preprocess'):
+            preprocessed_image = self.preprocessing_image(image)
+        # Tesseract detects and recognizes the words in one call
+        with timed(self.timings, 'recognize'):
+            ocr_data = self.detect_and_recognize(preprocessed_image)
+        layout_start = time.perf_counter()
         prev_line, prev_block, prev_par = -1, -1, -1
         lines = []
         word_sizes = []
@@ -98,11 +107,13 @@ class TesseractOCR():
     
         lines.append((full_text.rstrip(), *self.get_line_size(word_sizes)))
         lines = list(filter(lambda line: all((line[0], line[2], line[4])), lines))
+        self.timings['layout'] = time.perf_counter() - layout_start
         
         if inpaint:
-            inpainted_image = np.array(
-                cv2.inpaint(image, mask, 5, cv2.INPAINT_TELEA), dtype=np.uint8
-            )
+            with timed(self.timings, 'inpaint'):
+                inpainted_image = np.array(
+                    cv2.inpaint(image, mask, 5, cv2.INPAINT_TELEA), dtype=np.uint8
+                )
             return (inpainted_image, mask, lines)
         
         return (np.empty(shape = (0,)), np.empty(shape = (0,)), lines)
@@ -127,6 +138,7 @@ class EasyOCR():
             detect_network = 'craft', 
             gpu = True
         ) 
+        self.timings = {} # step -> duration of the last ocr_process_image call
 
     
     def preprocessing_image(self, image: np.ndarray) -> np.ndarray:
@@ -136,8 +148,22 @@ class EasyOCR():
         return np.array(image)
 
     
+    def detect(self, image: np.ndarray) -> tuple:
+        horizontal_list, free_list = self.reader.detect(image, width_ths=1, add_margin=0, min_size=2)
+        return horizontal_list[0], free_list[0]
+
+
+    def recognize(self, image: np.ndarray, boxes: tuple) -> list:
+        horizontal_list, free_list = boxes
+        return self.reader.recognize(image, horizontal_list, free_list, detail=1)
+
+    
     def detect_and_recognize(self, image: np.ndarray) -> list:
-        return self.reader.readtext(image, detail=1, width_ths=1, add_margin=0, min_size=2)
+        # The same as `readtext`, split in two steps so they can be timed separately
+        with timed(self.timings, 'detect'):
+            boxes = self.detect(image)
+        with timed(self.timings, 'recognize'):
+            return self.recognize(image, boxes)
     
 
     def ocr_process_image(self, image: np.ndarray, inpaint: bool = False) -> tuple[np.ndarray, np.ndarray, list]:
@@ -169,6 +195,7 @@ class EasyOCR():
             image = np.array(image, dtype=np.uint8)
         if inpaint:
             mask = np.zeros_like(image, shape=image.shape[:-1], dtype=np.uint8)   
+        self.timings = {}
         
         height_corr_coef = 0.7 # A coefficient that is multiplied by the height of the returned text.
         y_thresh = 4 # threshold at which detected elements are combined along the y-axis
@@ -176,7 +203,10 @@ class EasyOCR():
         ocr_data = []
         
         # forming a general structure of the data that was detected 
-        tmp = self.detect_and_recognize(self.preprocessing_image(image))
+        with timed(self.timings, 'preprocess'):
+            preprocessed_image = self.preprocessing_image(image)
+        tmp = self.detect_and_recognize(preprocessed_image)
+        layout_start = time.perf_counter()
         for i, (bbox, text, prob) in enumerate(tmp):    
             data_dict = {
                 'top': int((bbox[0][1] + bbox[1][1]) // 2),
@@ -295,11 +325,13 @@ class EasyOCR():
                 line['right'] - line['left']
             )
         for line in lines]  
+        self.timings['layout'] = time.perf_counter() - layout_start
         
         if inpaint:
-            inpainted_image = np.array(
-                cv2.inpaint(image, mask, 5, cv2.INPAINT_TELEA), dtype=np.uint8
-            )
+            with timed(self.timings, 'inpaint'):
+                inpainted_image = np.array(
+                    cv2.inpaint(image, mask, 5, cv2.INPAINT_TELEA), dtype=np.uint8
+                )
             return (inpainted_image, mask, lines)
         else:
             return (np.empty(shape = (0,)), np.empty(shape = (0,)), lines)
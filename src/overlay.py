@@ -0,0 +1,56 @@
+import numpy as np
+from typing import List, Tuple
+
+
+Rect = Tuple[int, int, int, int]
+
+
+def to_rgba(image: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    '''
+    Combines an RGB image and a single channel mask into an RGBA image,
+    the mask is used as the alpha channel.
+    '''
+    if not isinstance(image, np.ndarray):
+        image = np.array(image, dtype=np.uint8)
+    return np.concatenate((image, mask[:, :, np.newaxis]), axis=2)
+
+
+def compute_patches(
+    previous: np.ndarray,
+    current: np.ndarray,
+    tile_size: int = 32
+) -> List[Tuple[Rect, np.ndarray]]:
+    '''
+    Compares two RGBA images of the same shape and returns a list of
+    (rect, patch) pairs, where rect is (x, y, w, h) and patch is a contiguous
+    RGBA copy of the changed area of the current image.
+
+    The image is divided into tiles, changed tiles in one row of tiles
+    are merged into horizontal runs, so one text line usually gives one patch.
+    '''
+    height, width = current.shape[:2]
+    rows = -(-height // tile_size)
+    cols = -(-width // tile_size)
+
+    # Pad to a whole number of tiles so the difference can be reduced per tile
+    changed = np.zeros((rows * tile_size, cols * tile_size), dtype=bool)
+    changed[:height, :width] = np.any(previous != current, axis=2)
+    changed = changed.reshape(rows, tile_size, cols, tile_size).any(axis=(1, 3))
+
+    patches = []
+    for row in range(rows):
+        row_tiles = changed[row]
+        col = 0
+        while col < cols:
+            if not row_tiles[col]:
+                col += 1
+                continue
+            start = col
+            while col < cols and row_tiles[col]:
+                col += 1
+            x, y = start * tile_size, row * tile_size
+            w = min(col * tile_size, width) - x
+            h = min(y + tile_size, height) - y
+            patch = np.ascontiguousarray(current[y: y+h, x: x+w])
+            patches.append(((x, y, w, h), patch))
+    return patches
@@ -0,0 +1,705 @@
+import time
+import threading
+from collections import deque
+from functools import partial
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+from thefuzz import fuzz, process as fuzz_process
+
+from src.window_capture import ScreenCapture
+from src.scheduler import TranslationScheduler
+from src.translators.fuzzy import same_numbers
+from src.stabilizer import TypewriterStabilizer
+from src.overlay import to_rgba, compute_patches
+from src.metrics import MetricsRegistry
+from src.profiler import Profiler
+from config.config import CAPTURE_INTERVAL, PIPELINE_STATS_INTERVAL, PROGRESSIVE_RENDERING, TYPEWRITER_STABILIZATION
+
+
+class Frame():
+    '''
+    A unit of work that moves through the pipeline stages.
+    Each stage fills in its own fields and records how long it took.
+    '''
+    def __init__(self, frame_id: int, image: np.ndarray, region: int = 0):
+        self.frame_id = frame_id
+        self.region = region
+        self.image = image
+        self.lines = []
+        self.patches = []
+        self.translated = []
+        self.partial = False # some lines show a placeholder instead of the translation
+        self.timings = {}
+
+
+class RegionQueue():
+    '''
+    Bounded queue between two stages that keeps only the latest frame of every region.
+    A new frame of a region replaces the stale one, so a slow consumer always receives
+    the most recent frame instead of working through a backlog.
+    Frames are taken in round-robin order of the regions, so one region cannot starve the others.
+    '''
+    def __init__(self):
+        self.items = {} # region -> latest frame
+        self.order = deque() # regions with a pending frame, in turn order
+        self.condition = threading.Condition()
+        self.dropped = 0
+
+
+    def put(self, frame) -> None:
+        with self.condition:
+            if frame.region in self.items:
+                self.dropped += 1
+            else:
+                self.order.append(frame.region)
+            self.items[frame.region] = frame
+            self.condition.notify()
+
+
+    def get(self, timeout: float = None):
+        with self.condition:
+            if not self.items:
+                self.condition.wait(timeout)
+            return self._pop(self.order[0]) if self.order else None
+
+
+    def get_all(self, timeout: float = None) -> list:
+        with self.condition:
+            if not self.items:
+                self.condition.wait(timeout)
+            return [self._pop(region) for region in list(self.order)]
+
+
+    def take(self, region: int):
+        with self.condition:
+            return self._pop(region) if region in self.items else None
+
+
+    def _pop(self, region: int):
+        self.order.remove(region)
+        return self.items.pop(region)
+
+
+    def wake(self) -> None:
+        with self.condition:
+            self.condition.notify_all()
+
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+class StageStats():
+    '''
+    Counts the processed items and the time a stage spent working.
+    Occupancy is the share of wall time the stage was busy,
+    the stage with the highest occupancy is the bottleneck.
+    Every duration is also recorded in the latency histogram of the stage.
+    '''
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.histogram = MetricsRegistry().histogram(name)
+        self.lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self) -> None:
+        with self.lock:
+            self.processed = 0
+            self.busy_time = 0.0
+            self.last_time = 0.0
+            self.started_at = time.perf_counter()
+
+
+    def add(self, duration: float) -> None:
+        with self.lock:
+            self.processed += 1
+            self.busy_time += duration
+            self.last_time = duration
+        self.histogram.observe(duration)
+
+
+    def occupancy(self) -> float:
+        elapsed = (time.perf_counter() - self.started_at) * self.workers
+        return min(self.busy_time / elapsed, 1.0) if elapsed > 0 else 0.0
+
+
+    def snapshot(self, dropped: int = 0) -> dict:
+        with self.lock:
+            return {
+                'stage': self.name,
+                'processed': self.processed,
+                'dropped': dropped,
+                'occupancy': self.occupancy(),
+                'mean_time': self.busy_time / self.processed if self.processed else 0.0,
+                'last_time': self.last_time,
+            }
+
+
+class PipelineStage(QThread):
+    '''
+    A worker thread that takes items from its input queue, processes them
+    and passes the results to the connected outputs.
+
+    Child classes implement the `process` method, if it returns None
+    nothing is passed further, a returned list is passed item by item.
+    '''
+    def __init__(self, name: str, input_queue: RegionQueue = None, parent=None):
+        super(PipelineStage, self).__init__(parent=parent)
+        self.name = name
+        self.input_queue = input_queue
+        self.outputs = []
+        self.stats = StageStats(name)
+        self.profiler = Profiler()
+        self.is_running = True
+
+
+    def connect_output(self, callback) -> None:
+        self.outputs.append(callback)
+
+
+    def emit_output(self, item) -> None:
+        for callback in self.outputs:
+            callback(item)
+
+
+    def run(self):
+        while self.is_running:
+            self.profiler.sync_thread()
+            item = self.take_input()
+            if not item:
+                continue
+            start = time.perf_counter()
+            try:
+                result = self.process(item)
+            except Exception as e:
+                print(e)
+                result = None
+            duration = time.perf_counter() - start
+            self.stats.add(duration)
+            self.emit_results(result, duration)
+
+
+    def take_input(self):
+        return self.input_queue.get(timeout=0.1)
+
+
+    def emit_results(self, result, duration: float) -> None:
+        if result is None:
+            return
+        for frame in result if isinstance(result, list) else [result]:
+            frame.timings[self.name] = duration
+            self.emit_output(frame)
+
+
+    def process(self, item):
+        raise NotImplementedError
+
+
+    def stop(self) -> None:
+        self.is_running = False
+        if self.input_queue is not None:
+            self.input_queue.wake()
+
+
+    def start(self, **kwargs) -> None:
+        self.is_running = True
+        self.stats.reset()
+        return super().start(**kwargs)
+
+
+class CaptureStage(PipelineStage):
+    '''
+    The source of the pipeline. Captures the active window once per tick,
+    not more often than once per `interval` seconds, and cuts a frame for every region.
+    '''
+    def __init__(self, interval: float = CAPTURE_INTERVAL, parent=None):
+        super(CaptureStage, self).__init__('capture', parent=parent)
+        self.sct = ScreenCapture()
+        self.interval = interval
+        self.regions = []
+        self.screen_rect = None
+        self.frame_id = 0
+        self.stop_event = threading.Event()
+
+
+    def run(self):
+        while self.is_running:
+            self.profiler.sync_thread()
+            start = time.perf_counter()
+            try:
+                frames = self.process(None)
+            except Exception as e:
+                print(e)
+                frames = None
+            duration = time.perf_counter() - start
+            self.stats.add(duration)
+            self.emit_results(frames, duration)
+            self.stop_event.wait(max(self.interval - duration, 0))
+
+
+    def process(self, item) -> list:
+        active_window_hwnd = self.sct.active_window_hwnd()
+        if not active_window_hwnd:
+            return None
+        images = self.sct.grab_areas(
+            active_window_hwnd,
+            monitor_rect=self.screen_rect,
+            areas=self.regions
+        )
+        self.frame_id += 1
+        return [Frame(self.frame_id, img, region) for region, img in enumerate(images)]
+
+
+    def stop(self) -> None:
+        super().stop()
+        self.stop_event.set()
+
+
+    def start(self, **kwargs) -> None:
+        self.stop_event.clear()
+        return super().start(**kwargs)
+
+
+    def set_regions(self, regions: List[Tuple[int, int, int, int]]):
+        for coordinates in regions:
+            if len(coordinates) != 4:
+                raise ValueError('Coordinates must have 4 values (x, y, w, h)')
+        self.regions = list(regions)
+
+
+    def set_screen_rect(self, screen_rect: Tuple[int, int, int, int]):
+        if len(screen_rect) == 4:
+            self.screen_rect = screen_rect
+        else:
+            raise ValueError('Screen coordinates must have 4 values (x, y, w, h)')
+
+
+class OcrStage(PipelineStage):
+    '''
+    Recognizes the text lines of a frame and computes the overlay patches,
+    i.e. the parts of the inpainted image that differ from what the overlay already shows.
+    '''
+    def __init__(self, ocr_system, input_queue: RegionQueue, inpaint: bool = False, parent=None):
+        super(OcrStage, self).__init__('ocr', input_queue, parent=parent)
+        self.ocr_system = ocr_system
+        self.inpaint = inpaint
+        self.overlay_images = {} # region -> RGBA image the overlay currently shows
+
+
+    def process(self, frame: Frame) -> Frame:
+        inpainted, mask, lines = self.ocr_system.ocr_process_image(
+            frame.image, inpaint=self.inpaint
+        )
+        frame.lines = lines
+        self.record_timings(frame, self.ocr_system.timings)
+        frame.patches = self.image_patches(frame.region, inpainted, mask)
+        frame.image = None
+        return frame
+
+
+    def record_timings(self, frame: Frame, timings: dict) -> None:
+        # The steps of the OCR: preprocess, detect, recognize, layout, inpaint
+        frame.timings.update(timings)
+        MetricsRegistry().observe_all(timings)
+
+
+    def image_patches(self, region: int, image: np.ndarray, mask: np.ndarray) -> list:
+        if not len(image) or not len(mask):
+            return []
+        rgba = to_rgba(image, mask)
+        overlay_image = self.overlay_images.get(region)
+        if overlay_image is None or overlay_image.shape != rgba.shape:
+            # The overlay starts fully transparent
+            overlay_image = np.zeros_like(rgba)
+        patches = compute_patches(overlay_image, rgba)
+        self.overlay_images[region] = rgba
+        return patches
+
+
+    def set_ocr_system(self, ocr_system):
+        self.ocr_system = ocr_system
+
+
+class PooledOcrStage(OcrStage):
+    '''
+    OCR stage that hands the frames over to a pool of worker processes.
+    The pool returns the results in the order of the frames, 
+    so the overlay patches are still computed against the right previous image.
+    The pool is shared by all regions, the input queue takes their frames in turn.
+    '''
+    def __init__(self, ocr_pool, input_queue: RegionQueue, inpaint: bool = False, parent=None):
+        super(PooledOcrStage, self).__init__(None, input_queue, inpaint=inpaint, parent=parent)
+        self.ocr_pool = ocr_pool
+        self.stats.workers = ocr_pool.workers
+
+
+    def run(self):
+        while self.is_running:
+            self.profiler.sync_thread()
+            frame = self.input_queue.get(timeout=0.1)
+            if frame is None:
+                continue
+            try:
+                # Blocks while all the workers are busy, meanwhile
+                # the input queue drops the stale frames
+                self.ocr_pool.submit(frame.image, self.inpaint, partial(self.on_result, frame))
+            except Exception as e:
+                print(e)
+            frame.image = None
+
+
+    def on_result(self, frame: Frame, result: tuple, duration: float, timings: dict) -> None:
+        if not self.is_running:
+            return
+        inpainted, mask, frame.lines = result
+        self.record_timings(frame, timings)
+        frame.patches = self.image_patches(frame.region, inpainted, mask)
+        frame.timings[self.name] = duration
+        self.stats.add(duration)
+        self.emit_output(frame)
+
+
+class TranslationStage(PipelineStage):
+    '''
+    Translates the recognized lines. The pending frames of all regions are taken at once.
+    Lines that are the same as in the previous frame of the region (up to OCR noise)
+    reuse their previous translation, the new or changed lines are handed to the
+    TranslationScheduler. A frame is passed on only when all its lines are translated,
+    and only the latest frame of a region waits for translations, so a translation of 
+    a line that is already gone is never rendered. If nothing has changed in a region, 
+    its frame is skipped and nothing is rendered.
+    
+    With progressive rendering a waiting frame is also passed on at once and again 
+    whenever some of its lines are translated, with a placeholder in place of the lines 
+    that are not translated yet: the recognized text ('source') or the translation 
+    previously shown at the same height ('previous').
+
+    With typewriter stabilization a line that is still being revealed character
+    by character is not translated until it stops growing (see TypewriterStabilizer),
+    its frame waits for the next frames of the region.
+    '''
+    similarity_threshold = 95 # lines with a higher fuzz.ratio are considered the same
+    
+    def __init__(self, translator, input_queue: RegionQueue, parent=None):
+        super(TranslationStage, self).__init__('translate', input_queue, parent=parent)
+        self.translator = translator
+        self.translated_lines = {} # region -> {source line: translation} of the last frame
+        self.line_counts = {} # region -> number of lines in the last frame
+        self.waiting_frames = {} # region -> latest frame waiting for translations
+        self.ready_regions = set() # regions that received translations
+        self.ready_lock = threading.Lock()
+        self.request_stats = StageStats('translate requests')
+        self.progressive_rendering = PROGRESSIVE_RENDERING
+        self.rendered_lines = {} # region -> translated lines of the last complete frame
+        self.partial_translations = {} # region -> translations of the last partial frame
+        self.scheduler = TranslationScheduler(translator, self.on_translated, stats=self.request_stats)
+        self.stabilizer = TypewriterStabilizer() if TYPEWRITER_STABILIZATION else None
+        self.stabilized_frames = {} # region -> (frame id, whether each line can be translated)
+        self.reset_event = threading.Event()
+
+
+    def take_input(self) -> list:
+        with self.ready_lock:
+            has_ready = bool(self.ready_regions)
+        frames = self.input_queue.get_all(timeout=0 if has_ready else 0.1)
+        with self.ready_lock:
+            ready, self.ready_regions = self.ready_regions, set()
+        regions = {frame.region for frame in frames}
+        frames.extend(
+            self.waiting_frames[region] for region in ready
+            if region not in regions and region in self.waiting_frames
+        )
+        return frames
+
+
+    def reset_translations(self) -> None:
+        '''
+        Forgets the translations of the shown lines, so they are translated again,
+        e.g. after the languages of the translator were switched.
+        The caches of the stage are cleared by its own thread on the next frames.
+        '''
+        self.reset_event.set()
+        self.scheduler.reset()
+        self.input_queue.wake()
+
+
+    def on_translated(self, regions: set) -> None:
+        with self.ready_lock:
+            self.ready_regions.update(regions)
+        self.input_queue.wake()
+
+
+    def previous_translation(self, region: int, line: str) -> Optional[str]:
+        translated_lines = self.translated_lines.get(region, {})
+        if line in translated_lines:
+            return translated_lines[line]
+        match = fuzz_process.extractOne(
+            line, [text for text in translated_lines if same_numbers(line, text)],
+            scorer=fuzz.ratio, # It uses Levenstein Distance
+            score_cutoff=self.similarity_threshold
+        )
+        return translated_lines[match[0]] if match else None
+
+
+    def stable_lines(self, frame: Frame) -> List[bool]:
+        if self.stabilizer is None:
+            return [True] * len(frame.lines)
+        # A waiting frame processed again is not a new observation of its lines
+        frame_id, stable_lines = self.stabilized_frames.get(frame.region, (None, None))
+        if frame_id != frame.frame_id:
+            stable_lines = self.stabilizer.update(frame.region, [line for line, *_ in frame.lines])
+            self.stabilized_frames[frame.region] = (frame.frame_id, stable_lines)
+        return stable_lines
+
+
+    def process(self, frames: list) -> list:
+        if self.reset_event.is_set():
+            self.reset_event.clear()
+            self.translated_lines.clear()
+            self.line_counts.clear()
+            self.rendered_lines.clear()
+            self.partial_translations.clear()
+        translated_frames = []
+        for frame in frames:
+            translations = []
+            missing = [] # (line, priority)
+            held = False # some lines are still being revealed
+            changed = False
+            stable_lines = self.stable_lines(frame)
+            for (line, y, _, x, _), stable in zip(frame.lines, stable_lines):
+                text = self.previous_translation(frame.region, line)
+                if text is None:
+                    changed = True
+                    text = self.scheduler.translation(line)
+                    if text is None:
+                        if stable:
+                            # Reading order: regions in turn, then top to bottom and left to right
+                            missing.append((line, (frame.region, y, x)))
+                        else:
+                            held = True
+                translations.append(text)
+            self.scheduler.update(frame.region, missing, [line for line, *_ in frame.lines])
+            
+            if missing or held:
+                self.waiting_frames[frame.region] = frame
+                if self.progressive_rendering:
+                    partial_frame = self.partial_frame(frame, translations)
+                    if partial_frame is not None:
+                        translated_frames.append(partial_frame)
+                continue
+            self.waiting_frames.pop(frame.region, None)
+            self.partial_translations.pop(frame.region, None)
+            if not changed and self.line_counts.get(frame.region) == len(frame.lines):
+                continue
+            
+            # Lines without a translation are not remembered
+            self.translated_lines[frame.region] = {
+                line: text for (line, *_), text in zip(frame.lines, translations) if text
+            }
+            self.line_counts[frame.region] = len(frame.lines)
+            frame.translated = [
+                (text, *coords) for text, (_, *coords) in zip(translations, frame.lines)
+            ]
+            self.rendered_lines[frame.region] = frame.translated
+            translated_frames.append(frame)
+        return translated_frames
+
+
+    def partial_frame(self, frame: Frame, translations: list) -> Optional[Frame]:
+        '''
+        Returns a copy of the frame in which the lines still being translated show 
+        a placeholder, or None if it would look the same as the last partial frame.
+        '''
+        rendered_lines = self.rendered_lines.get(frame.region, [])
+        partial_translations = [
+            text if text is not None else self.placeholder(line, y, h, rendered_lines)
+            for text, (line, y, h, *_) in zip(translations, frame.lines)
+        ]
+        if partial_translations == self.partial_translations.get(frame.region):
+            return None
+        self.partial_translations[frame.region] = partial_translations
+        
+        partial_frame = Frame(frame.frame_id, None, frame.region)
+        partial_frame.partial = True
+        partial_frame.lines = frame.lines
+        partial_frame.translated = [
+            (text, *coords) for text, (_, *coords) in zip(partial_translations, frame.lines)
+        ]
+        return partial_frame
+    
+    
+    def placeholder(self, line: str, y: int, h: int, rendered_lines: list) -> str:
+        if self.progressive_rendering == 'previous':
+            # The translation shown at the same height, if there was one
+            for text, rendered_y, rendered_h, *_ in rendered_lines:
+                if text and rendered_y < y + h and y < rendered_y + rendered_h:
+                    return text
+        return line
+
+
+    def stop(self) -> None:
+        super().stop()
+        self.scheduler.close()
+
+
+    def start(self, **kwargs) -> None:
+        self.request_stats.reset()
+        return super().start(**kwargs)
+
+
+class TranslationPipeline(QObject):
+    '''
+    Capture -> OCR -> translate -> render pipeline.
+
+    Every stage runs in its own thread and the stages are connected by bounded
+    queues that keep only the latest frame, so the throughput is set by the slowest
+    stage and not by the sum of all stages. 
+    
+    Several regions can share one pipeline: the window is captured once per tick, 
+    the OCR takes the regions in turn and their lines are translated in shared batches.
+    Rendering happens in the GUI thread: the pipeline emits `patches_ready` and `text_ready`
+    with the region index, and the window of that region takes the data 
+    with `take_patches` and `take_text`.
+
+    `capture_stage` replaces the screen capture, e.g. with a synthetic source in tests.
+    `recorder` (a TraceRecorder) records the captured images, the recognized lines
+    and the rendered text with their timings.
+    '''
+    patches_ready = pyqtSignal(int)
+    text_ready = pyqtSignal(int)
+
+    def __init__(
+        self,
+        ocr_system,
+        regions: List[Tuple[int, int, int, int]],
+        screen_rect: Tuple[int, int, int, int],
+        inpaint: bool = False,
+        translator = None,
+        translate: bool = False,
+        ocr_pool = None,
+        capture_stage = None,
+        recorder = None,
+        parent = None
+    ):
+        super(TranslationPipeline, self).__init__(parent=parent)
+        self.translate = translate
+
+        self.ocr_queue = RegionQueue()
+        self.translation_queue = RegionQueue()
+        self.text_queue = RegionQueue()
+
+        # Patches are not dropped: each set is a diff against the previous one
+        self.pending_patches = {}
+        self.patches_lock = threading.Lock()
+        self.render_stats = StageStats('render')
+
+        self.capture_stage = capture_stage or CaptureStage()
+        self.capture_stage.set_regions(regions)
+        self.capture_stage.set_screen_rect(screen_rect)
+        if recorder is not None:
+            # Before the OCR takes the frame and releases its image
+            self.capture_stage.connect_output(recorder.record_capture)
+        self.capture_stage.connect_output(self.ocr_queue.put)
+
+        if ocr_pool is not None:
+            self.ocr_stage = PooledOcrStage(ocr_pool, self.ocr_queue, inpaint=inpaint)
+        else:
+            self.ocr_stage = OcrStage(ocr_system, self.ocr_queue, inpaint=inpaint)
+        self.ocr_stage.connect_output(self.push_patches)
+        if recorder is not None:
+            self.ocr_stage.connect_output(recorder.record_ocr)
+
+        self.translation_stage = TranslationStage(translator, self.translation_queue)
+        self.translation_stage.connect_output(self.push_text)
+        if recorder is not None:
+            self.translation_stage.connect_output(recorder.record_text)
+        if self.translate:
+            self.ocr_stage.connect_output(self.translation_queue.put)
+
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.print_stats)
+
+
+    def stages(self) -> list:
+        stages = [self.capture_stage, self.ocr_stage]
+        if self.translate:
+            stages.append(self.translation_stage)
+        return stages
+
+
+    def start(self) -> None:
+        self.render_stats.reset()
+        for stage in reversed(self.stages()):
+            stage.start()
+        if PIPELINE_STATS_INTERVAL:
+            self.stats_timer.start(int(PIPELINE_STATS_INTERVAL * 1000))
+
+
+    def stop(self) -> None:
+        self.stats_timer.stop()
+        for stage in self.stages():
+            stage.stop()
+        for stage in self.stages():
+            stage.wait()
+
+
+    def push_patches(self, frame: Frame) -> None:
+        if not frame.patches:
+            return
+        with self.patches_lock:
+            pending_patches = self.pending_patches.setdefault(frame.region, [])
+            was_empty = not pending_patches
+            pending_patches.extend(frame.patches)
+        if was_empty:
+            self.patches_ready.emit(frame.region)
+
+
+    def take_patches(self, region: int = 0) -> list:
+        with self.patches_lock:
+            return self.pending_patches.pop(region, [])
+
+
+    def push_text(self, frame: Frame) -> None:
+        self.text_queue.put(frame)
+        self.text_ready.emit(frame.region)
+
+
+    def take_text(self, region: int = 0) -> Frame:
+        return self.text_queue.take(region)
+
+
+    def reset_translations(self) -> None:
+        if self.translate:
+            self.translation_stage.reset_translations()
+
+
+    def stats(self) -> list:
+        '''
+        Returns the statistics of all stages including rendering.
+        `dropped` is the number of stale frames dropped in front of the stage.
+        '''
+        dropped = {'ocr': self.ocr_queue.dropped, 'translate': self.translation_queue.dropped}
+        stats = [stage.stats.snapshot(dropped.get(stage.name, 0)) for stage in self.stages()]
+        if self.translate:
+            # The requests run outside of the stage thread, `dropped` are the cancelled lines
+            request_stats = self.translation_stage.request_stats
+            request_stats.workers = self.translation_stage.translator.max_concurrency
+            stats.append(request_stats.snapshot(self.translation_stage.scheduler.cancelled))
+        stats.append(self.render_stats.snapshot(self.text_queue.dropped))
+        return stats
+
+
+    def bottleneck(self) -> str:
+        return max(self.stats(), key=lambda s: s['occupancy'])['stage']
+
+
+    def print_stats(self) -> None:
+        report = ', '.join(
+            f"{s['stage']}: {s['occupancy']:.0%} busy, {s['mean_time']*1000:.1f} ms, {s['dropped']} dropped"
+            for s in self.stats()
+        )
+        print(f'Pipeline [{report}] bottleneck: {self.bottleneck()}')
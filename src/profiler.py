@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import threading
+from typing import Optional
+
+from config.config import PROFILER_MODE, PROFILER_SAMPLE_INTERVAL, PROFILES_PATH
+
+
+class Profiler():
+    '''
+    Profiles the running application on demand, without a restart.
+
+    'sample' mode samples the stacks of all Python threads every `sample_interval` seconds
+    (the GUI, the pipeline stages, the event loop of the translators) and writes
+    a speedscope file with one profile per thread.
+    'cprofile' mode runs cProfile in the GUI thread and in every pipeline stage
+    and writes the merged pstats file. The stages join and leave the session
+    from their own threads with `sync_thread`. Since Python 3.12 cProfile is built on
+    sys.monitoring, which allows one active profile for all threads, so the session
+    has a single profile and `sync_thread` does nothing.
+
+    The files are named by the start time of the session.
+    '''
+    _instance = None
+    _lock = threading.Lock()
+    
+    # One cProfile.Profile for the whole session instead of one per thread
+    single_profile = sys.version_info >= (3, 12)
+
+    def __new__(cls, mode: str = PROFILER_MODE, sample_interval: float = PROFILER_SAMPLE_INTERVAL, path: str = PROFILES_PATH):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(Profiler, cls).__new__(cls)
+                cls._instance._init(mode, sample_interval, path)
+        return cls._instance
+
+
+    def _init(self, mode: str, sample_interval: float, path: str) -> None:
+        if mode not in ('sample', 'cprofile'):
+            raise ValueError(f'Unknown profiler mode: {mode}')
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.path = path
+        self.active = False
+        self.started_at = None
+        self.condition = threading.Condition()
+        self.thread_profiles = {} # thread id -> cProfile.Profile of the running session
+        self.session_profile = None
+        self.finished_profiles = []
+        self.sampler = None
+
+
+    def toggle(self) -> Optional[str]:
+        if self.active:
+            return self.stop()
+        self.start()
+        return None
+
+
+    def start(self) -> None:
+        with self.condition:
+            if self.active:
+                return
+            self.active = True
+            self.started_at = time.localtime()
+            self.finished_profiles = []
+        if self.mode == 'sample':
+            self.sampler = threading.Thread(target=self._sample, daemon=True)
+            self.sampler.start()
+        elif self.single_profile:
+            self.session_profile = cProfile.Profile()
+            try:
+                self.session_profile.enable()
+            except ValueError as e:
+                # Another profiler or a debugger uses sys.monitoring
+                print(e)
+                self.session_profile = None
+                with self.condition:
+                    self.active = False
+                return
+        else:
+            self.sync_thread()
+        print('Profiling started')
+
+
+    def stop(self, timeout: float = 1.0) -> Optional[str]:
+        '''
+        Ends the session and writes the profile, returns the path of the file.
+        '''
+        with self.condition:
+            if not self.active:
+                return None
+            self.active = False
+        name = time.strftime('profile_%Y%m%d_%H%M%S', self.started_at)
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            if self.mode == 'sample':
+                self.sampler.join()
+                return self._write_speedscope(os.path.join(self.path, name + '.speedscope.json'))
+            if self.single_profile:
+                profile, self.session_profile = self.session_profile, None
+                profile.disable()
+                return self._write_pstats(os.path.join(self.path, name + '.pstats'), [profile])
+            self.sync_thread()
+            # The stages leave the session on their next item, or when they wait for one
+            with self.condition:
+                self.condition.wait_for(lambda: not self.thread_profiles, timeout)
+                profiles, self.thread_profiles = self.finished_profiles + list(self.thread_profiles.values()), {}
+            return self._write_pstats(os.path.join(self.path, name + '.pstats'), profiles)
+        except Exception as e:
+            print(e)
+            return None
+
+
+    def sync_thread(self) -> None:
+        '''
+        Enables or disables the profile of the calling thread to match the session.
+        Called by the threads in their loops, it does nothing in the 'sample' mode
+        and with a single profile.
+        '''
+        if self.mode != 'cprofile' or self.single_profile:
+            return
+        thread_id = threading.get_ident()
+        profile = self.thread_profiles.get(thread_id)
+        if self.active and profile is None:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                print(e)
+                return
+            with self.condition:
+                self.thread_profiles[thread_id] = profile
+        elif not self.active and profile is not None:
+            profile.disable()
+            with self.condition:
+                self.finished_profiles.append(self.thread_profiles.pop(thread_id))
+                self.condition.notify_all()
+
+
+    def _write_pstats(self, file_path: str, profiles: list) -> str:
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is None:
+            print('Nothing was profiled')
+            return None
+        stats.dump_stats(file_path)
+        print(f'Profile saved to {file_path}')
+        return file_path
+
+
+    def _sample(self) -> None:
+        self.frames = [] # speedscope shared frames
+        self.frame_indexes = {} # (name, file, line) -> index in frames
+        self.samples = {} # thread id -> list of stacks
+        own_id = threading.get_ident()
+        while self.active:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    key = (code.co_name, code.co_filename, code.co_firstlineno)
+                    if key not in self.frame_indexes:
+                        self.frame_indexes[key] = len(self.frames)
+                        self.frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+                    stack.append(self.frame_indexes[key])
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.setdefault(thread_id, []).append(stack)
+            time.sleep(self.sample_interval)
+
+
+    def _write_speedscope(self, file_path: str) -> str:
+        if not self.samples:
+            print('Nothing was profiled')
+            return None
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        profiles = []
+        for thread_id, stacks in self.samples.items():
+            profiles.append({
+                'type': 'sampled',
+                'name': names.get(thread_id, f'Thread {thread_id}'),
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': len(stacks) * self.sample_interval,
+                'samples': stacks,
+                'weights': [self.sample_interval] * len(stacks),
+            })
+        profile = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': self.frames},
+            'profiles': profiles,
+            'name': os.path.basename(file_path),
+            'exporter': 'screen translator profiler',
+        }
+        with open(file_path, 'w', encoding='utf-8') as file:
+            json.dump(profile, file)
+        print(f'Profile saved to {file_path}')
+        return file_path
@@ -0,0 +1,171 @@
+import heapq
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from src.translators.aio import EventLoopThread
+from config.config import TRANSLATION_BATCH_LINES, TRANSLATION_RETRY_DELAY, TRANSLATION_RETRY_MAX_DELAY
+
+
+class TranslationScheduler():
+    '''
+    Decides which recognized lines are translated and when.
+
+    Every region reports the lines it currently shows and which of them are
+    untranslated with `update`.
+    The lines are sent in batches of at most `batch_lines` in reading order
+    (region, top to bottom, left to right), with no more than `translator.max_concurrency`
+    batches in flight. The same text shown in several places is requested once.
+    A line that disappears from all regions is removed from the queue, and a batch
+    whose lines have all disappeared is cancelled. Translations are kept while their
+    lines are shown, so a frame whose lines arrive in different batches can complete,
+    and dropped when the lines disappear. A line whose translation failed is not
+    requested again until its retry delay has passed, the delay doubles with every failure.
+
+    The batches run on the shared event loop. `on_translated(regions)` is called
+    from the event loop thread with the regions that received translations.
+    '''
+    def __init__(self, translator, on_translated: Callable, batch_lines: int = TRANSLATION_BATCH_LINES, stats=None):
+        self.translator = translator
+        self.on_translated = on_translated
+        self.batch_lines = batch_lines
+        self.stats = stats
+        self.loop = EventLoopThread().loop
+        self.lock = threading.Lock()
+        self.wanted = {} # region -> {text: priority} of the lines waiting for a translation
+        self.visible = {} # region -> texts of all the lines the region shows
+        self.queued = {} # text -> priority
+        self.in_flight = {} # task -> (texts, start time)
+        self.results = {} # text -> translation
+        self.failures = {} # text -> (failed requests in a row, time of the next request)
+        self.cancelled = 0 # lines whose request was cancelled
+
+
+    def update(self, region: int, lines: List[Tuple[str, tuple]], visible: Iterable[str]) -> None:
+        '''
+        Replaces the lines the region is waiting for with `lines`, a list of (text, priority),
+        and the lines it shows with `visible`. A lower priority is translated earlier.
+        '''
+        with self.lock:
+            self.wanted[region] = dict(lines)
+            self.visible[region] = set(visible)
+            wanted = self._wanted_texts()
+            shown = wanted.union(*self.visible.values())
+            in_flight = {text for texts, _ in self.in_flight.values() for text in texts}
+
+            now = time.monotonic()
+            queued = {}
+            for region_lines in self.wanted.values():
+                for text, priority in region_lines.items():
+                    if text in self.results or text in in_flight:
+                        continue
+                    if text in self.failures and self.failures[text][1] > now:
+                        continue
+                    queued[text] = min(priority, queued.get(text, priority))
+            self.queued = queued
+            self.results = {text: result for text, result in self.results.items() if text in shown}
+            self.failures = {text: failure for text, failure in self.failures.items() if text in shown}
+            stale_tasks = [
+                task for task, (texts, _) in self.in_flight.items()
+                if not any(text in wanted for text in texts)
+            ]
+
+        for task in stale_tasks:
+            self.loop.call_soon_threadsafe(task.cancel)
+        if queued:
+            self.loop.call_soon_threadsafe(self._dispatch)
+
+
+    def reset(self) -> None:
+        '''
+        Drops the translations and the batches in flight, e.g. after the languages
+        were switched, and requests the waiting lines again.
+        '''
+        with self.lock:
+            tasks = list(self.in_flight)
+            self.in_flight.clear()
+            self.results.clear()
+            self.failures.clear()
+            queued = {}
+            for region_lines in self.wanted.values():
+                for text, priority in region_lines.items():
+                    queued[text] = min(priority, queued.get(text, priority))
+            self.queued = queued
+        for task in tasks:
+            self.loop.call_soon_threadsafe(task.cancel)
+        self.loop.call_soon_threadsafe(self._dispatch)
+
+
+    def translation(self, text: str) -> Optional[str]:
+        '''
+        Returns the translation, or None while the line is being translated or waits for a retry.
+        '''
+        with self.lock:
+            return self.results.get(text)
+
+
+    def _wanted_texts(self) -> set:
+        return {text for region_lines in self.wanted.values() for text in region_lines}
+
+
+    def _dispatch(self) -> None:
+        with self.lock:
+            while self.queued and len(self.in_flight) < self.translator.max_concurrency:
+                texts = heapq.nsmallest(self.batch_lines, self.queued, key=self.queued.get)
+                for text in texts:
+                    del self.queued[text]
+                task = self.loop.create_task(self.translator.atranslate_batch_concat(texts))
+                self.in_flight[task] = (texts, time.perf_counter())
+                task.add_done_callback(self._on_done)
+
+
+    def _on_done(self, task) -> None:
+        regions = set()
+        with self.lock:
+            if task not in self.in_flight:
+                # Dropped by `reset`, the result is for the previous languages
+                texts, translations = (), None
+            elif task.cancelled():
+                texts, _ = self.in_flight.pop(task)
+                self.cancelled += len(texts)
+                translations = None
+            else:
+                texts, start = self.in_flight.pop(task)
+                try:
+                    translations = task.result()
+                except Exception as e:
+                    print(e)
+                    translations = [''] * len(texts)
+                if self.stats is not None:
+                    self.stats.add(time.perf_counter() - start)
+
+            if translations is not None:
+                now = time.monotonic()
+                for text, translation in zip(texts, translations):
+                    translation = (translation or '').strip()
+                    if not translation and text.strip():
+                        failures = self.failures.get(text, (0, now))[0] + 1
+                        delay = min(TRANSLATION_RETRY_DELAY * 2 ** (failures - 1), TRANSLATION_RETRY_MAX_DELAY)
+                        self.failures[text] = (failures, now + delay)
+                        continue
+                    self.failures.pop(text, None)
+                    waiting = [region for region, region_lines in self.wanted.items() if text in region_lines]
+                    if waiting:
+                        self.results[text] = translation
+                        regions.update(waiting)
+
+        if regions:
+            self.on_translated(regions)
+        self._dispatch()
+
+
+    def close(self) -> None:
+        with self.lock:
+            self.wanted.clear()
+            self.visible.clear()
+            self.queued.clear()
+            self.results.clear()
+            self.failures.clear()
+            tasks = list(self.in_flight)
+        for task in tasks:
+            self.loop.call_soon_threadsafe(task.cancel)
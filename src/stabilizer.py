@@ -0,0 +1,75 @@
+import time
+from typing import List, Optional
+
+from config.config import TYPEWRITER_STABLE_FRAMES, TYPEWRITER_STABLE_TIME
+
+
+class TrackedLine():
+    def __init__(self, text: str, now: float, growing: bool = False):
+        self.text = text
+        self.changed_at = now
+        self.stable_frames = 0
+        self.growing = growing
+
+
+class TypewriterStabilizer():
+    '''
+    Holds back the lines that are revealed character by character.
+
+    Every line of a region is matched with a line of the previous frame.
+    A line that extends a previous one is growing, it is ready for translation
+    only after it has not changed for `stable_frames` frames or `stable_time` seconds.
+    Lines that appear complete are ready at once, so ordinary subtitles are not delayed.
+    '''
+    def __init__(self, stable_frames: int = TYPEWRITER_STABLE_FRAMES, stable_time: float = TYPEWRITER_STABLE_TIME):
+        self.stable_frames = stable_frames
+        self.stable_time = stable_time
+        self.lines = {} # region -> tracked lines of the previous frame
+        self.held = 0 # revealed prefixes that were not translated
+
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(text.split())
+
+
+    @staticmethod
+    def is_growth(previous: str, text: str) -> bool:
+        # The last revealed character may have been misread while it was being drawn
+        return len(text) > len(previous) and text.startswith(previous[:-1] if len(previous) > 1 else previous)
+
+
+    def match(self, previous_lines: List[TrackedLine], text: str) -> Optional[TrackedLine]:
+        for line in previous_lines:
+            if line.text == text:
+                return line
+        growth = [line for line in previous_lines if self.is_growth(line.text, text)]
+        return max(growth, key=lambda line: len(line.text)) if growth else None
+
+
+    def update(self, region: int, texts: List[str], now: float = None) -> List[bool]:
+        '''
+        Tracks the lines of a new frame of the region.
+        Returns whether each of the lines can be translated.
+        '''
+        now = time.perf_counter() if now is None else now
+        previous_lines = self.lines.get(region, [])
+        lines, ready = [], []
+        for text in map(self.normalize, texts):
+            previous = self.match(previous_lines, text)
+            if previous is None:
+                line = TrackedLine(text, now)
+            elif previous.text == text:
+                line = previous
+                line.stable_frames += 1
+            else:
+                line = TrackedLine(text, now, growing=True)
+                self.held += 1
+            lines.append(line)
+            ready.append(
+                not line.growing
+                or line.stable_frames >= self.stable_frames
+                or now - line.changed_at >= self.stable_time
+            )
+        self.lines[region] = lines
+        return ready
@@ -1,75 +1,12 @@
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QEventLoop
-from PyQt5.QtGui import QPixmap, QImage, QFont
+from PyQt5.QtCore import Qt, pyqtSignal, QRect
+from PyQt5.QtGui import QImage, QFont, QPainter
 from PyQt5.QtWidgets import QLabel, QWidget
 from typing import Tuple
-from thefuzz import fuzz
-import numpy as np
+import time
 
-from src.window_capture import ScreenCapture
+from src.pipeline import TranslationPipeline
 
 
-class SubwindowThread(QThread):
-    
-    update_signal = pyqtSignal(list, np.ndarray, np.ndarray)
-    
-    def __init__(self, parent=None):
-        super(SubwindowThread, self).__init__(parent=parent)
-        self.sct = ScreenCapture()
-        self.ocr_system = self.parent().ocr_system
-        self.inpaint = self.parent().inpaint
-        
-        self.coordinates = None
-        self.screen_rect = None
-        self.is_running = True
-        
-
-    def run(self):
-        self.loop = QEventLoop() 
-        while self.is_running:
-            try:
-                active_window_hwnd = self.sct.active_window_hwnd()
-                if active_window_hwnd:
-                    img = self.sct.grab(
-                        active_window_hwnd, 
-                        monitor_rect=self.screen_rect, 
-                        area=self.coordinates
-                    )
-                    inpainted, mask, lines = self.ocr_system.ocr_process_image(
-                        img, inpaint=self.inpaint
-                    )
-                    self.update_signal.emit(lines, inpainted, mask)
-                    self.loop.exec_()  
-            except Exception as e:
-                print(e)
-    
-    
-    def stop(self) -> None:
-        self.is_running = False
-        
-        
-    def start(self, **kwargs) -> None:
-        self.is_running = True
-        return super().start(**kwargs)
-    
-    
-    def set_ocr_system(self, ocr_system):
-        self.ocr_system = ocr_system
-        
-        
-    def set_coordinates(self, coordinates: Tuple[int, int, int, int]):
-        if len(coordinates) == 4:
-            self.coordinates = coordinates
-        else:
-            raise ValueError('Coordinates must have 4 values (x, y, w, h)')
-    
-    
-    def set_screen_rect(self, screen_rect: Tuple[int, int, int, int]):
-        if len(screen_rect) == 4:
-            self.screen_rect = screen_rect
-        else:
-            raise ValueError('Screen coordinates must have 4 values (x, y, w, h)')
-        
-    
 class BaseSubtitleWindow(QWidget):
     
     stop_signal = pyqtSignal()
@@ -83,11 +20,16 @@ class BaseSubtitleWindow(QWidget):
         text_style: dict = None,
         translator = None,
         translate : bool = False,
+        ocr_pool = None,
+        pipeline = None,
+        region: int = 0,
         parent = None
     ) -> None:
         super(BaseSubtitleWindow, self).__init__(parent=parent)
         
         self.ocr_system = ocr_system
+        self.ocr_pool = ocr_pool
+        self.region = region
         self.inpaint = inpaint
         self.screen_rect = screen_rect
         self.setGeometry(*geometry)
@@ -109,29 +51,41 @@ class BaseSubtitleWindow(QWidget):
         )
         self.setAttribute(Qt.WA_TranslucentBackground, True)
         
-        self.work_thread = SubwindowThread(parent = self)
-        self.work_thread.set_coordinates(geometry)
-        self.work_thread.set_screen_rect(self.screen_rect)
-        self.work_thread.update_signal.connect(self.update)
+        # A window either runs its own pipeline or renders
+        # one of the regions of a pipeline shared with other windows
+        self.owns_pipeline = pipeline is None
+        if self.owns_pipeline:
+            pipeline = TranslationPipeline(
+                ocr_system = self.ocr_system,
+                regions = [geometry],
+                screen_rect = self.screen_rect,
+                inpaint = self.inpaint,
+                translator = self.translator,
+                translate = self.translate,
+                ocr_pool = self.ocr_pool,
+                parent = self
+            )
+        self.pipeline = pipeline
+        self.pipeline.patches_ready.connect(self.render_patches)
+        self.pipeline.text_ready.connect(self.render_text)
         self.start_thread()
         
-        self.cached_text = ''
-        self.cached_translated_text = ''
-        
         
     def initUI(self) -> None:        
         pass
             
         
     def stop_thread(self) -> None:
-        self.work_thread.is_running = False
-        self.work_thread.stop()
-        self.work_thread.quit()
-        self.work_thread.wait()
+        if self.owns_pipeline:
+            self.pipeline.stop()
+        else:
+            self.pipeline.patches_ready.disconnect(self.render_patches)
+            self.pipeline.text_ready.disconnect(self.render_text)
 
     
     def start_thread(self) -> None:
-        self.work_thread.start()
+        if self.owns_pipeline:
+            self.pipeline.start()
         
         
     def close(self) -> bool:
@@ -183,9 +137,9 @@ class BaseSubtitleWindow(QWidget):
         self.set_label_stretch(label, font)        
 
     
-    def update_image(self, image: np.ndarray, mask: np.ndarray) -> None:
+    def update_image(self, patches: list) -> None:
         '''
-        A method that performs some actions with the image and mask arguments.
+        A method that performs some actions with the image patches.
 
         This method can be overridden in child classes if its behavior 
         needs to be changed or extended. In the base class the method is implemented 
@@ -195,25 +149,13 @@ class BaseSubtitleWindow(QWidget):
 
     
     def update_text(self, text_data: list) -> None:
-        if self.translate:
-            text_list = [d[0] for d in text_data]
-            text = ' '.join(text_list)
-            ratio = fuzz.ratio(text, self.cached_text) # It uses Levenstein Distance
-            if ratio >= 95 and self.cached_text and text:
-                return
-            elif text:
-                translated_text = self.translator.translate_batch_concat(text_list)
-                text_data = [(text.strip(), *coords) for text, (_, *coords) in zip(translated_text, text_data)]
-                if text_data is None:
-                    return 
-                self.cached_text = text
-                self.cached_translated_text = translated_text
-                self.remove_labels()
-                self.create_labels(text_data)
-            else:
-                self.cached_text = ''
-                self.cached_translated_text = ''
-                self.remove_labels()    
+        # The labels are reused, so a line whose translation arrives later is replaced in place
+        for label in self.labels[len(text_data):]:
+            label.deleteLater()
+        del self.labels[len(text_data):]
+        for label, text_info in zip(self.labels, text_data):
+            self.update_label(label, text_info)
+        self.create_labels(text_data[len(self.labels):])
 
         
     def create_labels(self, text_data):
@@ -224,17 +166,33 @@ class BaseSubtitleWindow(QWidget):
             label.show()
             
     
-    def update(self, text_data: list = None, image: np.ndarray = None, mask: np.ndarray = None) -> None:
-        if image is not None and mask is not None:
-            if len(image) > 0 and len(mask) > 0:
-                self.update_image(image, mask)
-        if text_data is not None:
-            self.update_text(text_data)
-        self.work_thread.loop.quit()
+    def render_patches(self, region: int) -> None:
+        if region != self.region:
+            return
+        start = time.perf_counter()
+        patches = self.pipeline.take_patches(region)
+        if patches:
+            self.update_image(patches)
+            self.pipeline.render_stats.add(time.perf_counter() - start)
+            
+            
+    def render_text(self, region: int) -> None:
+        if region != self.region:
+            return
+        # Only the latest translated frame is kept, 
+        # so the signal may arrive when there is nothing left to render
+        start = time.perf_counter()
+        frame = self.pipeline.take_text(region)
+        if frame is not None:
+            self.update_text(frame.translated)
+            self.pipeline.render_stats.add(time.perf_counter() - start)
 
     
                 
 class BackgroundSubtitleWindow(BaseSubtitleWindow):
+    
+    inpaint = False
+    
     def __init__(
         self, 
         ocr_system,
@@ -243,6 +201,9 @@ class BackgroundSubtitleWindow(BaseSubtitleWindow):
         text_style: dict = None,
         translator = None,
         translate: bool = False,
+        ocr_pool = None,
+        pipeline = None,
+        region: int = 0,
         parent = None
     ):
         if text_style:
@@ -256,11 +217,17 @@ class BackgroundSubtitleWindow(BaseSubtitleWindow):
             translator = translator,
             translate = translate, 
             inpaint = False,
+            ocr_pool = ocr_pool,
+            pipeline = pipeline,
+            region = region,
             parent = parent
         )
 
 
 class InpaintingSubtitleWindow(BaseSubtitleWindow):
+    
+    inpaint = True
+    
     def __init__(
         self, 
         ocr_system,
@@ -269,6 +236,9 @@ class InpaintingSubtitleWindow(BaseSubtitleWindow):
         text_style: dict = None,
         translator = None,
         translate: bool = False,
+        ocr_pool = None,
+        pipeline = None,
+        region: int = 0,
         parent = None
     ):  
         text_style['background-color'] = '' if text_style else {'background-color': ''}
@@ -280,24 +250,47 @@ class InpaintingSubtitleWindow(BaseSubtitleWindow):
             translator = translator,
             translate = translate,
             inpaint = True,
+            ocr_pool = ocr_pool,
+            pipeline = pipeline,
+            region = region,
             parent = parent
         )
-        self.image_label = QLabel(self)
+        self.image_widget = OverlayImageWidget(geometry[2], geometry[3], parent=self)
+        self.image_widget.lower()
 
 
-    def update_image(self, image: np.ndarray, mask: np.ndarray) -> None:
-        if not isinstance(image, np.ndarray):
-            image = np.array(image)
+    def update_image(self, patches: list) -> None:
+        self.image_widget.apply_patches(patches)
+        
+
+class OverlayImageWidget(QWidget):
+    '''
+    Keeps a persistent RGBA backing image of the overlay. 
+    Incoming patches are composed into it and only the changed 
+    rectangles are repainted.
+    '''
+    def __init__(self, width: int, height: int, parent = None):
+        super(OverlayImageWidget, self).__init__(parent=parent)
+        self.backing_image = QImage(width, height, QImage.Format_RGBA8888)
+        self.backing_image.fill(Qt.transparent)
+        self.setFixedSize(width, height)
+        
+        
+    def apply_patches(self, patches: list) -> None:
+        painter = QPainter(self.backing_image)
+        # Source mode replaces pixels, so transparent patches erase old text
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        for (x, y, w, h), patch in patches:
+            data = patch.tobytes()
+            painter.drawImage(x, y, QImage(data, w, h, 4 * w, QImage.Format_RGBA8888))
+        painter.end()
+        for (x, y, w, h), _ in patches:
+            self.update(QRect(x, y, w, h))
             
-        height, width, _ = image.shape
-        image_with_alpha = np.concatenate((image, mask[:, :, np.newaxis]), axis=2)
-        image_with_alpha = QImage(
-            image_with_alpha.tobytes(), 
-            width, height, 
-            4 * width,
-            QImage.Format_RGBA8888
-        )
-        self.image_label.setPixmap(QPixmap.fromImage(image_with_alpha))
-        self.image_label.resize(width, height)
-        self.image_label.setFixedSize(width, height)
+    
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        painter.drawImage(event.rect(), self.backing_image, event.rect())
+        painter.end()
     
\ No newline at end of file
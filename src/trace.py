@@ -0,0 +1,194 @@
+import os
+import json
+import mmap
+import time
+import zlib
+import queue
+import struct
+import hashlib
+import threading
+from typing import Iterator, Optional
+
+import numpy as np
+
+from config.config import TRACE_PATH
+
+
+TRACE_MAGIC = b'STTRACE1'
+RECORD_HEADER = struct.Struct('<cI') # kind, payload length
+IMAGE_HEADER = struct.Struct('<16sIII') # digest, height, width, channels
+IMAGE_RECORD = b'I'
+EVENT_RECORD = b'E'
+
+
+def image_digest(image: np.ndarray) -> bytes:
+    digest = hashlib.blake2b(str(image.shape).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.digest()
+
+
+def to_json(value):
+    # numpy scalars in the line coordinates
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class TraceRecorder():
+    '''
+    Writes what the pipeline saw and did into an append-only trace file:
+    the captured images, the recognized lines, the translations and the stage timings.
+
+    Each record is a kind, a length and a zlib compressed payload. An image is stored
+    once, the events refer to it by digest, so an unchanged screen costs only a small event.
+    The records are written by a background thread, the pipeline only queues them;
+    if the writer falls behind, records are dropped and counted.
+    '''
+    max_queued = 256
+
+    def __init__(self, path: str = None, compression_level: int = 1):
+        if path is None:
+            os.makedirs(TRACE_PATH, exist_ok=True)
+            path = os.path.join(TRACE_PATH, time.strftime('trace_%Y%m%d_%H%M%S.trace'))
+        self.path = path
+        self.compression_level = compression_level
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(TRACE_MAGIC)
+        self.images = set() # digests of the stored images
+        self.queue = queue.Queue(maxsize=self.max_queued)
+        self.dropped = 0
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+
+    def _put(self, item) -> None:
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+
+    def record_capture(self, frame) -> None:
+        if frame.image is not None:
+            self._put(('capture', time.time(), frame.frame_id, frame.region, frame.image))
+
+
+    def record_ocr(self, frame) -> None:
+        self._put(('ocr', time.time(), frame.frame_id, frame.region, {
+            'lines': frame.lines,
+            'timings': dict(frame.timings),
+        }))
+
+
+    def record_text(self, frame) -> None:
+        self._put(('text', time.time(), frame.frame_id, frame.region, {
+            'translated': frame.translated,
+            'partial': frame.partial,
+            'timings': dict(frame.timings),
+        }))
+
+
+    def _write(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            kind, timestamp, frame_id, region, data = item
+            try:
+                event = {'event': kind, 'time': timestamp, 'frame_id': frame_id, 'region': region}
+                if kind == 'capture':
+                    event['image'] = self._write_image(data).hex()
+                else:
+                    event.update(data)
+                self._write_record(EVENT_RECORD, zlib.compress(
+                    json.dumps(event, ensure_ascii=False, default=to_json).encode('utf-8'), self.compression_level
+                ))
+            except Exception as e:
+                print(e)
+        self.file.flush()
+
+
+    def _write_image(self, image: np.ndarray) -> bytes:
+        digest = image_digest(image)
+        if digest not in self.images:
+            self.images.add(digest)
+            height, width = image.shape[:2]
+            channels = image.shape[2] if image.ndim == 3 else 1
+            self._write_record(IMAGE_RECORD, IMAGE_HEADER.pack(digest, height, width, channels) + zlib.compress(
+                np.ascontiguousarray(image, dtype=np.uint8).data, self.compression_level
+            ))
+        return digest
+
+
+    def _write_record(self, kind: bytes, payload: bytes) -> None:
+        self.file.write(RECORD_HEADER.pack(kind, len(payload)) + payload)
+
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.writer.join()
+        self.file.close()
+        if self.dropped:
+            print(f'{self.dropped} trace records were dropped')
+
+
+class TraceReader():
+    '''
+    Reads a trace file through a memory map. Opening the trace only scans the record
+    headers, the images are decompressed when they are asked for.
+    A record cut off by a crash ends the trace.
+    '''
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+            raise ValueError(f'Not a trace file: {path}')
+        self.images = {} # digest -> (offset, length) of the image record payload
+        self.event_offsets = [] # (offset, length) of the event payloads
+        self._index()
+
+
+    def _index(self) -> None:
+        offset = len(TRACE_MAGIC)
+        size = len(self.map)
+        while offset + RECORD_HEADER.size <= size:
+            kind, length = RECORD_HEADER.unpack_from(self.map, offset)
+            payload_offset = offset + RECORD_HEADER.size
+            if payload_offset + length > size:
+                break
+            if kind == IMAGE_RECORD:
+                digest = IMAGE_HEADER.unpack_from(self.map, payload_offset)[0]
+                self.images[digest] = (payload_offset, length)
+            elif kind == EVENT_RECORD:
+                self.event_offsets.append((payload_offset, length))
+            offset = payload_offset + length
+
+
+    def __len__(self) -> int:
+        return len(self.event_offsets)
+
+
+    def event(self, index: int) -> dict:
+        offset, length = self.event_offsets[index]
+        return json.loads(zlib.decompress(self.map[offset:offset + length]))
+
+
+    def events(self) -> Iterator[dict]:
+        for index in range(len(self.event_offsets)):
+            yield self.event(index)
+
+
+    def image(self, digest) -> Optional[np.ndarray]:
+        if isinstance(digest, str):
+            digest = bytes.fromhex(digest)
+        if digest not in self.images:
+            return None
+        offset, length = self.images[digest]
+        _, height, width, channels = IMAGE_HEADER.unpack_from(self.map, offset)
+        data = zlib.decompress(self.map[offset + IMAGE_HEADER.size:offset + length])
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        return np.frombuffer(data, dtype=np.uint8).reshape(shape)
+
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,52 @@
+import asyncio
+import threading
+from typing import Awaitable, Optional
+
+
+class EventLoopThread():
+    '''
+    One asyncio event loop running in a daemon thread, shared by all translators.
+    Lets synchronous code (the Qt threads of the pipeline) run coroutines
+    without starting a thread per request.
+    '''
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance.loop = asyncio.new_event_loop()
+                cls._instance.thread = threading.Thread(
+                    target=cls._instance._run, name='translators-event-loop', daemon=True
+                )
+                cls._instance.thread.start()
+        return cls._instance
+
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+    def run(self, coroutine: Awaitable, timeout: Optional[float] = None):
+        '''
+        Runs the coroutine on the loop and waits for its result.
+        The coroutine is cancelled if it does not finish within `timeout` seconds.
+        '''
+        if self.is_loop_thread():
+            raise RuntimeError('Cannot wait for a coroutine from the event loop thread')
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+
+    def is_loop_thread(self) -> bool:
+        return threading.current_thread() is self.thread
+
+
+def run_sync(coroutine: Awaitable, timeout: Optional[float] = None):
+    return EventLoopThread().run(coroutine, timeout)
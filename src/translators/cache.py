@@ -0,0 +1,258 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from src.translators.fuzzy import FuzzyTranslationMemory
+from config.config import (
+    TRANSLATION_MEMORY_PATH, TRANSLATION_MEMORY_LRU_SIZE,
+    TRANSLATION_MEMORY_MAX_ENTRIES, TRANSLATION_MEMORY_TTL
+)
+
+
+class TranslationMemory():
+    '''
+    Persistent translation memory shared by all translators.
+
+    Translations are stored in SQLite and keyed by
+    (translator, source language, target language, normalized text).
+    The most recently used entries are also kept in an in-memory LRU,
+    so repeated lines do not even touch the database.
+    Entries older than `ttl` seconds are dropped, and when the database grows
+    beyond `max_entries` the least recently used entries are removed.
+    
+    `fuzzy_get` additionally finds near-duplicates of noisy OCR lines 
+    with a FuzzyTranslationMemory index built per language pair. The indexes follow
+    the database: expired and evicted entries are removed from them as well.
+    '''
+    _instance = None
+
+    # Eviction is checked once per this number of new entries
+    evict_interval = 1000
+
+    def __new__(
+        cls,
+        path: str = TRANSLATION_MEMORY_PATH,
+        lru_size: int = TRANSLATION_MEMORY_LRU_SIZE,
+        max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES,
+        ttl: float = TRANSLATION_MEMORY_TTL
+    ):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init(path, lru_size, max_entries, ttl)
+        return cls._instance
+
+
+    def _init(self, path: str, lru_size: int, max_entries: int, ttl: float) -> None:
+        self.lru_size = lru_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.fuzzy_hits = 0
+        self.puts_since_eviction = 0
+        self.fuzzy_indexes = {} # (translator, source, target) -> FuzzyTranslationMemory
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS translations (
+                translator TEXT NOT NULL,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                text TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                created REAL NOT NULL,
+                used REAL NOT NULL,
+                PRIMARY KEY (translator, source, target, text)
+            )
+            '''
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS translations_used ON translations (used)')
+        self.connection.commit()
+        self.evict()
+
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(text.split())
+
+
+    def get(self, translator: str, source: str, target: str, text: str) -> Optional[str]:
+        key = (translator, source, target, self.normalize(text))
+        with self.lock:
+            now = time.time()
+            if key in self.lru:
+                translation, created = self.lru[key]
+                if created > now - self.ttl:
+                    self.lru.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return translation
+                del self.lru[key]
+
+            row = self.connection.execute(
+                '''
+                SELECT translation, created FROM translations
+                WHERE translator = ? AND source = ? AND target = ? AND text = ? AND created > ?
+                ''',
+                (*key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.connection.execute(
+                'UPDATE translations SET used = ? WHERE translator = ? AND source = ? AND target = ? AND text = ?',
+                (now, *key)
+            )
+            self.connection.commit()
+            self.hits += 1
+            self._remember(key, *row)
+            return row[0]
+
+
+    def put(self, translator: str, source: str, target: str, text: str, translation: str) -> None:
+        if not translation:
+            return
+        key = (translator, source, target, self.normalize(text))
+        with self.lock:
+            now = time.time()
+            self.connection.execute(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (*key, translation, now, now)
+            )
+            self.connection.commit()
+            self._remember(key, translation, now)
+            if key[:3] in self.fuzzy_indexes:
+                self.fuzzy_indexes[key[:3]].add(key[3], translation, now)
+            self.puts_since_eviction += 1
+            evict = self.puts_since_eviction >= self.evict_interval
+        if evict:
+            self.evict()
+
+
+    def put_many(self, translator: str, source: str, target: str, texts: list, translations: list) -> None:
+        '''
+        Stores the translations of a batch in one transaction.
+        '''
+        keys = [
+            ((translator, source, target, self.normalize(text)), translation)
+            for text, translation in zip(texts, translations) if translation
+        ]
+        if not keys:
+            return
+        with self.lock:
+            now = time.time()
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(*key, translation, now, now) for key, translation in keys]
+            )
+            self.connection.commit()
+            index = self.fuzzy_indexes.get((translator, source, target))
+            for key, translation in keys:
+                self._remember(key, translation, now)
+                if index is not None:
+                    index.add(key[3], translation, now)
+            self.puts_since_eviction += len(keys)
+            evict = self.puts_since_eviction >= self.evict_interval
+        if evict:
+            self.evict()
+
+
+    def fuzzy_get(self, translator: str, source: str, target: str, text: str) -> Optional[str]:
+        '''
+        Returns the translation of a stored text that is similar to the given one.
+        Should be called after `get` has missed.
+        '''
+        translation = self.fuzzy_index(translator, source, target).lookup(text, time.time() - self.ttl)
+        if translation is not None:
+            with self.lock:
+                self.fuzzy_hits += 1
+                self.misses -= 1
+                self.hits += 1
+        return translation
+
+
+    def fuzzy_index(self, translator: str, source: str, target: str) -> FuzzyTranslationMemory:
+        key = (translator, source, target)
+        with self.lock:
+            if key not in self.fuzzy_indexes:
+                index = FuzzyTranslationMemory()
+                rows = self.connection.execute(
+                    '''
+                    SELECT text, translation, created FROM translations
+                    WHERE translator = ? AND source = ? AND target = ? AND created > ?
+                    ''',
+                    (*key, time.time() - self.ttl)
+                )
+                for text, translation, created in rows:
+                    index.add(text, translation, created)
+                self.fuzzy_indexes[key] = index
+            return self.fuzzy_indexes[key]
+
+
+    def _remember(self, key: tuple, translation: str, created: float) -> None:
+        self.lru[key] = (translation, created)
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+
+    def evict(self) -> None:
+        with self.lock:
+            self.puts_since_eviction = 0
+            expired = 'created <= ?', (time.time() - self.ttl,)
+            unused = (
+                'rowid IN (SELECT rowid FROM translations ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            for condition, parameters in (expired, unused):
+                if self.fuzzy_indexes or self.lru:
+                    rows = self.connection.execute(
+                        f'SELECT translator, source, target, text FROM translations WHERE {condition}', parameters
+                    ).fetchall()
+                    for key in rows:
+                        self.lru.pop(key, None)
+                        if key[:3] in self.fuzzy_indexes:
+                            self.fuzzy_indexes[key[:3]].remove(key[3])
+                self.connection.execute(f'DELETE FROM translations WHERE {condition}', parameters)
+            self.connection.commit()
+
+
+    def size(self) -> int:
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'memory_hits': self.memory_hits,
+            'fuzzy_hits': self.fuzzy_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'lru_size': len(self.lru),
+            'size': self.size(),
+        }
+
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute('DELETE FROM translations')
+            self.connection.commit()
+            self.lru.clear()
+            self.fuzzy_indexes.clear()
+            self.hits = self.memory_hits = self.fuzzy_hits = self.misses = 0
+
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+        TranslationMemory._instance = None
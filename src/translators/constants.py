@@ -27,4 +27,15 @@ YANDEX_CODES = {
     "japanese": "ja",
     "korean": "ko",
     "russian": "ru",
+}
+
+NLLB_CODES = {
+    "chinese (simplified)": "zho_Hans",
+    "chinese (traditional)": "zho_Hant",
+    "english": "eng_Latn",
+    "french": "fra_Latn",
+    "german": "deu_Latn",
+    "japanese": "jpn_Jpan",
+    "korean": "kor_Hang",
+    "russian": "rus_Cyrl",
 }
\ No newline at end of file
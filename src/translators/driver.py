@@ -1,10 +1,16 @@
 import sys 
+import os
 import atexit
+import json
 import re
 import subprocess
-from typing import Literal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Literal, Optional
 
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.firefox.service import Service as FirefoxService
 from selenium.webdriver.edge.service import Service as EdgeService
@@ -12,22 +18,29 @@ from webdriver_manager.chrome import ChromeDriverManager
 from webdriver_manager.firefox import GeckoDriverManager
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 
+from config.config import BROWSER_POOL_SIZE, BROWSER_MAX_REQUESTS, WEBDRIVER_CACHE_PATH
+
 
 
 class Browsers:
+    '''
+    Versions of the installed browsers, read from the registry.
+    Each browser is queried on the first access to its version.
+    '''
+    __keys = {
+        'edge': ("HKLM\SOFTWARE\WOW6432Node\Microsoft\EdgeUpdate\Clients\{F3017226-FE2A-4295-8BDF-00C3A9A7E4C5}", 'pv'),
+        'chrome': ("HKEY_CURRENT_USER\Software\Google\Chrome\BLBeacon", 'version'),
+        'firefox': ("HKEY_LOCAL_MACHINE\SOFTWARE\Mozilla\Mozilla Firefox", 'CurrentVersion'),
+    }
+    _versions = {} # browser -> version, None if it is not installed
+    _lock = threading.Lock()
     
-    __edge_key = "HKLM\SOFTWARE\WOW6432Node\Microsoft\EdgeUpdate\Clients\{F3017226-FE2A-4295-8BDF-00C3A9A7E4C5}"
-    __chrome_key = "HKEY_CURRENT_USER\Software\Google\Chrome\BLBeacon"
-    __firefox_key = "HKEY_LOCAL_MACHINE\SOFTWARE\Mozilla\Mozilla Firefox"
-    _instance = None
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._edge_version = cls.__extract_browser_version(cls.__edge_key, 'pv')
-            cls._instance._chrome_version = cls.__extract_browser_version(cls.__chrome_key, 'version')
-            cls._instance._firefox_version = cls.__extract_browser_version(cls.__firefox_key, 'CurrentVersion')
-        return cls._instance
+    @classmethod
+    def _version(cls, browser: str) -> Optional[str]:
+        with cls._lock:
+            if browser not in cls._versions:
+                cls._versions[browser] = cls.__extract_browser_version(*cls.__keys[browser])
+            return cls._versions[browser]
     
 
     @staticmethod
@@ -47,103 +60,331 @@ class Browsers:
     
     @staticmethod
     def get_edge_version():
-        return Browsers()._edge_version
+        return Browsers._version('edge')
     
     
     @staticmethod
     def get_chrome_version():
-        return Browsers()._chrome_version
+        return Browsers._version('chrome')
     
     
     @staticmethod
     def get_firefox_version():
-        return Browsers()._firefox_version
+        return Browsers._version('firefox')
     
     
     @staticmethod
     def is_edge_installed():
-        return bool(Browsers()._edge_version)
+        return bool(Browsers.get_edge_version())
     
     
     @staticmethod
     def is_chrome_installed():
-        return bool(Browsers()._chrome_version)
+        return bool(Browsers.get_chrome_version())
 
 
     @staticmethod
     def is_firefox_installed():
-        return bool(Browsers()._firefox_version)
+        return bool(Browsers.get_firefox_version())
     
 
 class WebDriverManager():
-    _instance = None
+    '''
+    Starts the headless browsers of WebDriverPool.
+    '''
+    _resolved = None # (browser, driver path)
+    _resolve_lock = threading.Lock()
+    
+    browsers = {
+        'edge': {
+            'options': webdriver.EdgeOptions,
+            'driver': webdriver.Edge,
+            'service': EdgeService,
+            'manager': EdgeChromiumDriverManager
+        },
+        'chrome': {
+            'options': webdriver.ChromeOptions,
+            'driver': webdriver.Chrome,
+            'service': ChromeService,
+            'manager': ChromeDriverManager
+        },
+        'firefox': {
+            'options': webdriver.FirefoxOptions,
+            'driver': webdriver.Firefox,
+            'service': FirefoxService,
+            'manager': GeckoDriverManager                    
+        },
+    }
 
-    def __new__(cls, browser: Literal['edge', 'chrome', 'firefox'] = 'edge'):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            
-            browsers = {
-                'edge': {
-                    'is_installed': Browsers.is_edge_installed(), 
-                    'options': webdriver.EdgeOptions,
-                    'driver': webdriver.Edge,
-                    'service': EdgeService,
-                    'manager': EdgeChromiumDriverManager
-                },
-                'chrome': {
-                    'is_installed': Browsers.is_chrome_installed(), 
-                    'options': webdriver.ChromeOptions,
-                    'driver': webdriver.Chrome,
-                    'service': ChromeService,
-                    'manager': ChromeDriverManager
-                },
-                'firefox': {
-                    'is_installed': Browsers.is_firefox_installed(), 
-                    'options': webdriver.FirefoxOptions,
-                    'driver': webdriver.Firefox,
-                    'service': FirefoxService,
-                    'manager': GeckoDriverManager                    
-                },
-            }
-            
-            installed_browsers = [b for b, value in browsers.items() if value['is_installed']]
+    @staticmethod
+    def create_driver(browser: Literal['edge', 'chrome', 'firefox'] = 'edge'):
+        '''
+        Starts a headless browser. The browser and driver resolved on the first start
+        are cached on disk, so later starts skip the detection and the driver version check.
+        '''
+        resolved = WebDriverManager._load_resolved()
+        if resolved is not None:
+            try:
+                return WebDriverManager._start_driver(*resolved)
+            except Exception as e:
+                # The browser could have been updated or removed
+                print(f'Error while starting the cached web driver: {e}')
+                WebDriverManager._clear_resolved(resolved)
+                
+        with WebDriverManager._resolve_lock:
+            # Another browser of the pool could have been resolved in the meantime
+            resolved = WebDriverManager._load_resolved()
+            if resolved is None:
+                resolved = WebDriverManager._resolve(browser)
+                driver = WebDriverManager._start_driver(*resolved)
+                WebDriverManager._save_resolved(*resolved)
+                return driver
+        return WebDriverManager._start_driver(*resolved)
+    
+    
+    @staticmethod
+    def _resolve(browser: str) -> tuple:
+        browsers = {
+            'edge': Browsers.is_edge_installed,
+            'chrome': Browsers.is_chrome_installed,
+            'firefox': Browsers.is_firefox_installed,
+        }
+        # The preferred browser is checked first, so the others are not queried if it is installed
+        if not browsers[browser]():
+            installed_browsers = [b for b, is_installed in browsers.items() if is_installed()]
             if not installed_browsers:
                 raise ValueError('No installed browsers found')
+            browser = installed_browsers[0]
+        driver_path = WebDriverManager.browsers[browser]['manager']().install()
+        return browser, driver_path
+    
+    
+    @staticmethod
+    def _start_driver(browser: str, driver_path: str):
+        driver = WebDriverManager.browsers[browser]['driver']
+        service = WebDriverManager.browsers[browser]['service']
+        
+        options = WebDriverManager.browsers[browser]['options']()
+        options.page_load_strategy = 'eager'
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_argument('--disable-infobars')
+        if browser != 'chrome':
+            options.add_argument("--headless")
+        else:
+            options.add_argument("--headless=new")
             
-            browser = browser if browser in installed_browsers else installed_browsers[0]
-            driver = browsers[browser]['driver']
-            service = browsers[browser]['service']
-            driver_manager = browsers[browser]['manager']
-            
-            options = browsers[browser]['options']()
-            options.page_load_strategy = 'eager'
-            options.add_argument('--blink-settings=imagesEnabled=false')
-            options.add_argument('--disable-infobars')
-            if browser != 'chrome':
-                options.add_argument("--headless")
-            else:
-                options.add_argument("--headless=new")
-                
-            cls._instance.driver = driver(service=service(driver_manager().install()), options=options)
-            # cls._instance.driver.set_window_position(-2000, 0)
-            atexit.register(WebDriverManager.close_instance)
-        return cls._instance
+        return driver(service=service(driver_path), options=options)
+    
+    
+    @staticmethod
+    def _load_resolved() -> Optional[tuple]:
+        if WebDriverManager._resolved is None:
+            try:
+                with open(WEBDRIVER_CACHE_PATH, 'r', encoding='utf-8') as file:
+                    cache = json.load(file)
+                if cache['browser'] in WebDriverManager.browsers and os.path.isfile(cache['driver_path']):
+                    WebDriverManager._resolved = (cache['browser'], cache['driver_path'])
+            except (OSError, ValueError, KeyError, TypeError):
+                return None
+        return WebDriverManager._resolved
     
     
+    @staticmethod
+    def _save_resolved(browser: str, driver_path: str) -> None:
+        WebDriverManager._resolved = (browser, driver_path)
+        try:
+            with open(WEBDRIVER_CACHE_PATH, 'w', encoding='utf-8') as file:
+                json.dump({'browser': browser, 'driver_path': driver_path}, file)
+        except OSError as e:
+            print(f'Error while saving the web driver cache: {e}')
+            
+            
+    @staticmethod
+    def _clear_resolved(resolved: tuple) -> None:
+        if WebDriverManager._resolved != resolved:
+            return
+        WebDriverManager._resolved = None
+        try:
+            os.remove(WEBDRIVER_CACHE_PATH)
+        except OSError:
+            pass
+            
+            
+class PooledDriver():
+    '''
+    A browser of WebDriverPool together with the state of the translator page loaded in it.
+    '''
+    def __init__(self, driver):
+        self.driver = driver
+        self.requests = 0
+        self.page_owner = None # the translator whose page is loaded
+        self.page_languages = None
+        self.last_text = None
+        self.last_translation = ''
+        
+        
     def __getattr__(self, name):
         return getattr(self.driver, name)
+    
+    
+class WebDriverPool():
+    '''
+    A pool of headless browsers, so the browser based translators can translate several texts at once.
+    Browsers are started on demand up to `size`, checked before they are handed out,
+    and restarted after `max_requests` translations or after an error.
+    '''
+    _instance = None
+    _lock = threading.Lock()
+    
+    def __new__(
+        cls, 
+        size: int = BROWSER_POOL_SIZE, 
+        max_requests: int = BROWSER_MAX_REQUESTS,
+        browser: Literal['edge', 'chrome', 'firefox'] = 'edge'
+    ):
+        with cls._lock:
+            if cls._instance is None:
+                if size < 1:
+                    raise ValueError('The pool must have at least one browser')
+                cls._instance = super().__new__(cls)
+                cls._instance.size = size
+                cls._instance.max_requests = max_requests
+                cls._instance.browser = browser
+                cls._instance.idle = []
+                cls._instance.created = 0
+                cls._instance.is_closed = False
+                cls._instance.condition = threading.Condition()
+                atexit.register(WebDriverPool.close_instance)
+        return cls._instance
+    
+    
+    def checkout(self, timeout: Optional[float] = None) -> PooledDriver:
+        '''
+        Takes a browser from the pool, starting a new one if none is idle and the pool is not full.
+        Blocks while all browsers are in use.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.condition:
+                while not self.idle and self.created >= self.size and not self.is_closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError('No free browser in the pool')
+                    self.condition.wait(remaining)
+                if self.is_closed:
+                    raise RuntimeError('The browser pool is closed')
+                # The most recently used browser is the one most likely to be warm
+                driver = self.idle.pop() if self.idle else None
+                if driver is None:
+                    self.created += 1
+                    
+            if driver is None:
+                try:
+                    driver = PooledDriver(WebDriverManager.create_driver(self.browser))
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif not self.is_healthy(driver):
+                self.discard(driver)
+                continue
+            driver.requests += 1
+            return driver
+    
+    
+    def checkin(self, driver: PooledDriver, healthy: bool = True) -> None:
+        if not healthy or driver.requests >= self.max_requests or self.is_closed:
+            self.discard(driver)
+            return
+        with self.condition:
+            self.idle.append(driver)
+            self.condition.notify()
+            
+            
+    @contextmanager
+    def driver(self, timeout: Optional[float] = None):
+        driver = self.checkout(timeout)
+        healthy = True
+        try:
+            yield driver
+        except WebDriverException:
+            healthy = False
+            raise
+        finally:
+            self.checkin(driver, healthy)
+            
+            
+    @staticmethod
+    def is_healthy(driver: PooledDriver) -> bool:
+        try:
+            return driver.execute_script('return 1') == 1
+        except Exception:
+            return False
+        
         
+    def discard(self, driver: PooledDriver) -> None:
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f'Error while closing the browser: {e}')
+        self._release_slot()
         
+        
+    def _release_slot(self) -> None:
+        with self.condition:
+            self.created -= 1
+            self.condition.notify()
+            
+            
+    def warm_up(self, count: int = 1, prepare: Optional[Callable] = None) -> None:
+        '''
+        Starts browsers in advance, so the first translations do not wait for them.
+        `prepare(driver)` is called for each of them, e.g. to load the translator page.
+        '''
+        drivers = [self.checkout() for _ in range(min(count, self.size))]
+        for driver in drivers:
+            driver.requests -= 1
+            healthy = True
+            if prepare is not None:
+                try:
+                    prepare(driver)
+                except WebDriverException as e:
+                    print(f'Error while preparing the browser: {e}')
+                    healthy = False
+            self.checkin(driver, healthy)
+            
+            
+    def warm_up_async(self, count: int = 1, prepare: Optional[Callable] = None) -> threading.Thread:
+        def warm_up():
+            try:
+                self.warm_up(count, prepare)
+            except Exception as e:
+                print(f'Error while starting the browser: {e}')
+                
+        thread = threading.Thread(target=warm_up, daemon=True)
+        thread.start()
+        return thread
+            
+            
+    def close(self) -> None:
+        with self.condition:
+            self.is_closed = True
+            idle, self.idle = self.idle, []
+            self.condition.notify_all()
+        for driver in idle:
+            self.discard(driver)
+            
+            
     @staticmethod
     def close_instance():
-        if WebDriverManager._instance:
-            WebDriverManager._instance.driver.quit()
-            WebDriverManager._instance = None
+        with WebDriverPool._lock:
+            instance, WebDriverPool._instance = WebDriverPool._instance, None
+        if instance:
+            instance.close()
                 
                 
 # This is a bad, but I haven’t figured out how to close the webdriver for any exceptions
 def exception_handler(type, value, traceback):
-    WebDriverManager.close_instance()
+    WebDriverPool.close_instance()
     sys.__excepthook__(type, value, traceback)
     sys.exit(0)
     
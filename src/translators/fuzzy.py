@@ -0,0 +1,194 @@
+import re
+import heapq
+import threading
+from operator import itemgetter
+from typing import Optional, Tuple
+
+from rapidfuzz import fuzz
+
+from config.config import FUZZY_MATCH_THRESHOLD
+
+
+NUMBER_PATTERN = re.compile(r'\d+')
+TOKEN_PATTERN = re.compile(r'\S+')
+
+
+def has_letters(token: str) -> bool:
+    return any(char.isalpha() for char in token)
+
+
+def numbers(text: str) -> list:
+    '''
+    Digit runs of the tokens without letters. A digit inside a word ("Hel1o")
+    is an OCR error rather than a number.
+    '''
+    return [
+        number for token in TOKEN_PATTERN.findall(text) if not has_letters(token)
+        for number in NUMBER_PATTERN.findall(token)
+    ]
+
+
+def same_numbers(text: str, other: str) -> bool:
+    '''
+    Lines that differ in a number ("3 potions" and "8 potions") are similar
+    by the ratio, but their translations are not interchangeable.
+    '''
+    return numbers(text) == numbers(other)
+
+
+class FuzzyTranslationMemory():
+    '''
+    In-memory index that finds a previously translated text similar to the given one,
+    so OCR variants of the same line ("Hel1o" and "Hello") share one translation.
+
+    Texts are split into n-grams stored in an inverted index: word bigrams for lines
+    of several words and character trigrams for lines of one or two words.
+    A noisy variant of a line keeps most of its n-grams, so the posting lists of the
+    rarest n-grams of the query are scanned (an n-gram damaged by OCR usually has no
+    postings at all), the entries are ranked by the number of shared n-grams,
+    and the best candidates are verified with rapidfuzz.
+    A candidate must contain the same standalone numbers as the query.
+    The scan stops after `max_postings` entries, which keeps the lookup time
+    independent of the number of stored texts.
+
+    Removed entries stay in the posting lists until more than half of the entries
+    are removed, then the index is rebuilt.
+    '''
+    short_text_words = 2 # texts with fewer words are indexed by character n-grams
+    
+    # Characters that OCR often confuses are folded into one before comparing.
+    # Digits are folded only inside words, standalone numbers are kept as they are
+    ocr_confusions = str.maketrans({'|': 'l'})
+    digit_confusions = str.maketrans({'0': 'o', '1': 'l', '5': 's'})
+
+    def __init__(
+        self,
+        threshold: float = FUZZY_MATCH_THRESHOLD,
+        max_candidates: int = 16,
+        max_postings: int = 1000
+    ):
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self.max_postings = max_postings
+        self.lock = threading.Lock()
+        self.texts = []
+        self.translations = [] # None for a removed entry
+        self.created = [] # time the translation was stored
+        self.ids = {} # normalized text -> entry id
+        self.index = {} # n-gram -> list of entry ids
+        self.removed = 0
+
+
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        return ' '.join(
+            token.translate(cls.digit_confusions) if has_letters(token) else token
+            for token in text.lower().translate(cls.ocr_confusions).split()
+        )
+
+
+    def ngrams(self, text: str) -> set:
+        words = text.split(' ')
+        if len(words) <= self.short_text_words:
+            # Prefixed so they never collide with word bigrams
+            padded = f'\0  {text} '
+            return {'\0' + padded[i: i + 3] for i in range(1, len(padded) - 2)}
+        words = ['\0'] + words + ['\0']
+        return {f'{words[i]} {words[i + 1]}' for i in range(len(words) - 1)}
+
+
+    def add(self, text: str, translation: str, created: float = 0.0) -> None:
+        text = self.normalize(text)
+        if not text or not translation:
+            return
+        with self.lock:
+            self._add(text, translation, created)
+
+
+    def _add(self, text: str, translation: str, created: float) -> None:
+        if text in self.ids:
+            entry_id = self.ids[text]
+            self.translations[entry_id] = translation
+            self.created[entry_id] = created
+            return
+        entry_id = len(self.texts)
+        self.ids[text] = entry_id
+        self.texts.append(text)
+        self.translations.append(translation)
+        self.created.append(created)
+        for gram in self.ngrams(text):
+            self.index.setdefault(gram, []).append(entry_id)
+
+
+    def remove(self, text: str) -> None:
+        text = self.normalize(text)
+        with self.lock:
+            entry_id = self.ids.pop(text, None)
+            if entry_id is None:
+                return
+            self.translations[entry_id] = None
+            self.removed += 1
+            if self.removed > len(self.texts) // 2:
+                self._rebuild()
+
+
+    def _rebuild(self) -> None:
+        entries = [
+            (text, translation, created)
+            for text, translation, created in zip(self.texts, self.translations, self.created)
+            if translation is not None
+        ]
+        self.texts, self.translations, self.created = [], [], []
+        self.ids, self.index = {}, {}
+        self.removed = 0
+        for entry in entries:
+            self._add(*entry)
+
+
+    def search(self, text: str, created_after: float = float('-inf')) -> Optional[Tuple[str, str, float]]:
+        '''
+        Returns (matched text, translation, similarity) of the most similar text
+        stored after `created_after` with a similarity of at least `threshold`, or None.
+        '''
+        query = self.normalize(text)
+        if not query:
+            return None
+        with self.lock:
+            entry_id = self.ids.get(query)
+            if entry_id is not None and self.created[entry_id] > created_after:
+                return self.texts[entry_id], self.translations[entry_id], 100.0
+
+            postings = sorted(
+                (self.index[gram] for gram in self.ngrams(query) if gram in self.index), key=len
+            )
+            counts = {}
+            scanned = 0
+            for posting in postings:
+                if scanned and scanned + len(posting) > self.max_postings:
+                    break
+                scanned += len(posting)
+                for entry_id in posting:
+                    if self.translations[entry_id] is not None and self.created[entry_id] > created_after:
+                        counts[entry_id] = counts.get(entry_id, 0) + 1
+            candidates = heapq.nlargest(self.max_candidates, counts.items(), key=itemgetter(1))
+
+            query_numbers = numbers(query)
+            best_id, best_score = None, self.threshold
+            for entry_id, _ in candidates:
+                if numbers(self.texts[entry_id]) != query_numbers:
+                    continue
+                score = fuzz.ratio(query, self.texts[entry_id], score_cutoff=best_score)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                return None
+            return self.texts[best_id], self.translations[best_id], best_score
+
+
+    def lookup(self, text: str, created_after: float = float('-inf')) -> Optional[str]:
+        match = self.search(text, created_after)
+        return match[1] if match else None
+
+
+    def __len__(self) -> int:
+        return len(self.ids)
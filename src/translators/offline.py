@@ -0,0 +1,92 @@
+import os
+import asyncio
+import threading
+from typing import List
+
+import ctranslate2
+import sentencepiece
+
+from src.translators.translators import BaseTranslator
+from src.translators.constants import NLLB_CODES
+from config.config import (
+    OFFLINE_MODEL_PATH, OFFLINE_TRANSLATOR_THREADS, OFFLINE_BEAM_SIZE, OFFLINE_MAX_DECODING_LENGTH
+)
+
+
+class OfflineTranslator(BaseTranslator):
+    '''
+    Translates on the CPU with an int8 quantized NLLB model run by CTranslate2, without network requests.
+    The model is loaded once and stays in memory for all instances.
+    All lines of a batch are translated with one call of the model.
+
+    The model has to be converted beforehand:
+        ct2-transformers-converter --model facebook/nllb-200-distilled-600M --quantization int8
+            --copy_files sentencepiece.bpe.model --output_dir models/nllb-200-distilled-600M-int8
+    '''
+    _models = {} # path -> (translator, tokenizer)
+    _lock = threading.Lock()
+
+    def __init__(self, source: str, target: str, model_path: str = OFFLINE_MODEL_PATH):
+        super(OfflineTranslator, self).__init__(
+            source, target,
+            codes = NLLB_CODES
+        )
+        self._model, self._tokenizer = self._load_model(model_path)
+
+
+    @classmethod
+    def _load_model(cls, model_path: str) -> tuple:
+        with cls._lock:
+            if model_path not in cls._models:
+                tokenizer_path = os.path.join(model_path, 'sentencepiece.bpe.model')
+                if not os.path.isfile(os.path.join(model_path, 'model.bin')) or not os.path.isfile(tokenizer_path):
+                    raise ValueError(f'Offline translation model not found: {model_path}')
+                model = ctranslate2.Translator(
+                    model_path, device='cpu', compute_type='int8',
+                    inter_threads=1, intra_threads=OFFLINE_TRANSLATOR_THREADS
+                )
+                tokenizer = sentencepiece.SentencePieceProcessor(model_file=tokenizer_path)
+                cls._models[model_path] = (model, tokenizer)
+            return cls._models[model_path]
+
+
+    def _translate_lines(self, lines: List[str]) -> List[str]:
+        if self._is_same_language():
+            return list(lines)
+        result_lines = list(lines)
+        indices = [i for i, text in enumerate(lines) if text.strip()]
+        if not indices:
+            return result_lines
+
+        source = [
+            [self.source_lang] + self._tokenizer.encode(lines[i], out_type=str) + ['</s>']
+            for i in indices
+        ]
+        results = self._model.translate_batch(
+            source,
+            target_prefix = [[self.target_lang]] * len(source),
+            beam_size = OFFLINE_BEAM_SIZE,
+            max_decoding_length = OFFLINE_MAX_DECODING_LENGTH
+        )
+        for i, result in zip(indices, results):
+            # The first token is the target language
+            result_lines[i] = self._tokenizer.decode(result.hypotheses[0][1:])
+        return result_lines
+
+
+    def _translate(self, text: str, **kwargs) -> str:
+        if not isinstance(text, str):
+            raise ValueError('Unsupported type of text')
+        return self._translate_lines([text])[0]
+
+
+    async def _atranslate_chunks(self, batch: List[str]) -> List[str]:
+        # The lines are translated as a batch by the model, so they do not need to be joined
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._translate_lines, batch)
+
+
+    def translate_batch(self, batch: List[str], **kwargs) -> List[str]:
+        if not batch:
+            raise ValueError('Batch cannot be empty')
+        return self.translate_batch_concat(batch)
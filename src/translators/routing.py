@@ -0,0 +1,216 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+from src.translators.aio import run_sync
+from src.translators.translators import BaseTranslator, GoogleTranslator, YandexTranslator
+from config.config import (
+    ROUTING_WINDOW, ROUTING_MAX_ERROR_RATE, HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY
+)
+
+
+class BackendStats():
+    '''
+    Rolling latency and error rate of one backend for one language pair.
+    '''
+    def __init__(self, window: int = ROUTING_WINDOW):
+        self.latencies = deque(maxlen=window) # of the successful requests
+        self.errors = deque(maxlen=window) # True for a failed request
+
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.errors.append(not ok)
+        if ok:
+            self.latencies.append(latency)
+
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))]
+
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.errors) / len(self.errors) if self.errors else 0.0
+
+
+    def is_healthy(self) -> bool:
+        return self.error_rate <= ROUTING_MAX_ERROR_RATE
+
+
+class RoutingTranslator(BaseTranslator):
+    '''
+    Sends each request to the fastest healthy backend for the current language pair.
+    If the answer does not come within the p95 latency of that backend, a hedged duplicate
+    is sent to the next backend and the first valid answer is taken.
+    When a backend fails, the next one is tried.
+
+    `backends` are translator classes (or factories) called with the source and target languages.
+    The default is Google and one browser backend: the browser backends share the drivers of
+    WebDriverPool, and a driver that served another translator reloads its page before the next
+    request, so hedging between Yandex and Deepl would reload the pages on every switch.
+    '''
+    def __init__(self, source: str, target: str, backends: Optional[List[Callable]] = None):
+        backends = backends or [GoogleTranslator, YandexTranslator]
+        self.backends = []
+        for backend in backends:
+            try:
+                self.backends.append(backend(source, target))
+            except ValueError as e:
+                print(f'Backend {backend} is not available: {e}')
+        if not self.backends:
+            raise ValueError('No translator supports the language pair')
+
+        codes = {}
+        for backend in self.backends:
+            codes.update({name: name for name in backend.languages})
+        super(RoutingTranslator, self).__init__(source, target, codes)
+        self.stats = {} # (backend, source, target) -> BackendStats
+
+
+    @property
+    def max_concurrency(self) -> int:
+        return max(backend.max_concurrency for backend in self.backends)
+
+
+    @property
+    def target(self):
+        return self.target_lang
+
+
+    @target.setter
+    def target(self, language):
+        self.target_lang = self._language_to_code(language)
+
+
+    @property
+    def source(self):
+        return self.source_lang
+
+
+    @source.setter
+    def source(self, language):
+        self.source_lang = self._language_to_code(language)
+
+
+    def _available_backends(self) -> List[BaseTranslator]:
+        backends = []
+        for backend in self.backends:
+            try:
+                backend.source = self.source_lang
+                backend.target = self.target_lang
+            except ValueError:
+                continue
+            backends.append(backend)
+        return backends
+
+
+    def backend_stats(self, backend: BaseTranslator) -> BackendStats:
+        key = (backend, self.source_lang, self.target_lang)
+        if key not in self.stats:
+            self.stats[key] = BackendStats()
+        return self.stats[key]
+
+
+    def ranked_backends(self) -> List[BaseTranslator]:
+        '''
+        Healthy backends first, each group ordered by the median latency.
+        Backends without measurements come first, so they get measured.
+        '''
+        def rank(backend: BaseTranslator) -> tuple:
+            stats = self.backend_stats(backend)
+            median = stats.percentile(50)
+            return (not stats.is_healthy(), median is not None, median or 0.0)
+        return sorted(self._available_backends(), key=rank)
+
+
+    def hedge_delay(self, backend: BaseTranslator) -> float:
+        p95 = self.backend_stats(backend).percentile(95)
+        return HEDGE_DEFAULT_DELAY if p95 is None else max(p95, HEDGE_MIN_DELAY)
+
+
+    async def _timed(self, backend: BaseTranslator, request: Callable, is_valid: Callable):
+        stats = self.backend_stats(backend)
+        start = time.perf_counter()
+        try:
+            result = await request(backend)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f'{backend.name} error: {e}')
+            result = None
+        ok = result is not None and is_valid(result)
+        stats.record(time.perf_counter() - start, ok)
+        return result if ok else None
+
+
+    async def _hedged(self, request: Callable[[BaseTranslator], Awaitable], is_valid: Callable, default):
+        '''
+        Runs `request(backend)` on the best backend, hedging it with the next one
+        after the p95 delay, and falling back to the next ones on failures.
+        '''
+        queue = self.ranked_backends()
+        if not queue:
+            return default
+        primary = queue[0]
+        pending = set()
+        hedged = False
+
+        def launch() -> None:
+            backend = queue.pop(0)
+            pending.add(asyncio.ensure_future(self._timed(backend, request, is_valid)))
+
+        launch()
+        try:
+            while pending:
+                timeout = self.hedge_delay(primary) if queue and not hedged else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    launch()
+                    continue
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        return result
+                if not pending and queue:
+                    launch()
+            return default
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+    def _translate(self, text: str, **kwargs) -> str:
+        return run_sync(self._atranslate(text, **kwargs))
+
+
+    async def _atranslate(self, text: str, **kwargs) -> str:
+        if not isinstance(text, str):
+            raise ValueError('Unsupported type of text')
+        if self._is_empty(text) or self._is_same_language():
+            return text
+        return await self._hedged(lambda backend: backend._atranslate(text, **kwargs), bool, '')
+
+
+    async def _atranslate_concat(self, batch: List[str]) -> List[str]:
+        # Each backend joins the lines with its own separator
+        return await self._hedged(
+            lambda backend: backend._atranslate_concat(batch),
+            lambda result: len(result) == len(batch) and all(
+                translated or not text.strip() for text, translated in zip(batch, result)
+            ),
+            []
+        )
+
+
+    def translate_batch(self, batch: List[str], timeout: Optional[float] = None, **kwargs) -> List[str]:
+        return run_sync(self.atranslate_batch(batch, timeout, **kwargs))
+
+
+    def close(self) -> None:
+        for backend in self.backends:
+            backend.close()
@@ -0,0 +1,73 @@
+# JS executed in the translator pages by the browser based translators
+
+
+# Puts the text into the input element found by XPath and notifies the page.
+# Arguments: input XPath, text. Returns false if there is no input element.
+SET_TEXT_SCRIPT = '''
+const [inputXpath, text] = arguments;
+const element = document.evaluate(
+    inputXpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+).singleNodeValue;
+if (!element) {
+    return false;
+}
+element.focus();
+if (element.isContentEditable) {
+    document.execCommand('selectAll', false, null);
+    if (text) {
+        document.execCommand('insertText', false, text);
+    } else {
+        document.execCommand('delete', false, null);
+    }
+} else {
+    const prototype = element instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+    Object.getOwnPropertyDescriptor(prototype, 'value').set.call(element, text);
+    element.dispatchEvent(new Event('input', {bubbles: true}));
+}
+return true;
+'''
+
+
+# Waits until the text of the output elements differs from the previous one
+# and has not changed for the settle time, or until the timeout.
+# Arguments: output XPath, previous text, settle time (ms), timeout (ms).
+# Returns the text, or null if it is still empty or the previous one at the timeout.
+WAIT_OUTPUT_SCRIPT = '''
+const [outputXpath, previous, settleTime, timeout, done] = arguments;
+const read = () => {
+    const nodes = document.evaluate(
+        outputXpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null
+    );
+    let text = '';
+    for (let i = 0; i < nodes.snapshotLength; i++) {
+        text += nodes.snapshotItem(i).textContent;
+    }
+    return text.trim();
+};
+
+let settleTimer = null;
+let finished = false;
+const finish = () => {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    observer.disconnect();
+    clearTimeout(settleTimer);
+    clearTimeout(deadline);
+    const text = read();
+    done(text && text !== previous ? text : null);
+};
+const check = () => {
+    clearTimeout(settleTimer);
+    const text = read();
+    if (text && text !== previous) {
+        settleTimer = setTimeout(finish, settleTime);
+    }
+};
+
+const observer = new MutationObserver(check);
+observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+const deadline = setTimeout(finish, timeout);
+check();
+'''
@@ -1,22 +1,39 @@
 # This is a temporary solution
 import re
+import html
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List
+from functools import partial
+from typing import List, Optional
 
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import quote, urlencode
-from bs4 import BeautifulSoup
-from selenium.common.exceptions import StaleElementReferenceException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import lxml.html
+from selenium.common.exceptions import WebDriverException
 
-from src.translators.driver import WebDriverManager
+from src.translators.aio import run_sync
+from src.translators.driver import WebDriverPool, PooledDriver
+from src.translators.scripts import SET_TEXT_SCRIPT, WAIT_OUTPUT_SCRIPT
+from src.translators.cache import TranslationMemory
 from src.translators.constants import *
+from config.config import (
+    USE_TRANSLATION_MEMORY, USE_FUZZY_TRANSLATION_MEMORY, 
+    HTTP_TIMEOUT, HTTP_RETRIES, HTTP_MAX_CONCURRENCY,
+    CONCAT_MAX_CHARS, CONCAT_MAX_REQUEST_SIZE
+)
 
 
 class BaseTranslator(ABC):
     
+    concat_separator = '#$#' # untranslatable element
+    concat_pattern = r'\s*#\s*\$\s*#\s*'
+    max_concurrency = 1 # parallel requests of atranslate_batch and atranslate_batch_concat
+    max_chunk_chars = CONCAT_MAX_CHARS
+    max_chunk_size = CONCAT_MAX_REQUEST_SIZE
+    
     def __init__(self, source: str, target: str, codes: dict):
         if not source:
             raise ValueError('Invalud source language')
@@ -28,6 +45,10 @@ class BaseTranslator(ABC):
         self.source_lang = self._language_to_code(source)
         self.target_lang = self._language_to_code(target)
         
+        self.name = type(self).__name__
+        self.memory = TranslationMemory() if USE_TRANSLATION_MEMORY else None
+        
+        
     def _is_same_language(self) -> bool:
         return self.target_lang == self.source_lang
     
@@ -65,11 +86,66 @@ class BaseTranslator(ABC):
         self.source_lang = self._language_to_code(language)
 
 
+    def _is_cacheable(self, text: str) -> bool:
+        return (
+            self.memory is not None and isinstance(text, str) 
+            and not self._is_empty(text.strip()) and not self._is_same_language()
+        )
+    
+    
+    def _memory_key(self) -> tuple:
+        '''
+        (translator, source, target) of the memory entries. It is taken before a translation
+        starts, the languages can be switched while the translation is in flight.
+        '''
+        return self.name, self.source_lang, self.target_lang
+    
+    
+    def _remember(self, key: tuple, texts: List[str], translations: List[str]) -> None:
+        # A translation finished after the languages were switched could be in either language
+        if key == self._memory_key():
+            self.memory.put_many(*key, texts, translations)
+    
+    
+    def _remembered_translation(self, text: str, key: tuple) -> str:
+        translated_text = self.memory.get(*key, text)
+        if translated_text is None and USE_FUZZY_TRANSLATION_MEMORY:
+            translated_text = self.memory.fuzzy_get(*key, text)
+        return translated_text
+    
+    
+    def _remembered_batch(self, batch: List[str], key: tuple) -> List[Optional[str]]:
+        '''
+        Translations of the batch from the memory, None for the lines to translate.
+        Lines that are not cacheable are returned as they are.
+        '''
+        return [
+            self._remembered_translation(text, key) if self._is_cacheable(text) else text
+            for text in batch
+        ]
+    
+    
     @abstractmethod
-    def translate(self, text: str, **kwargs) -> str:
+    def _translate(self, text: str, **kwargs) -> str:
         pass
     
     
+    def translate(self, text: str, **kwargs) -> str:
+        '''
+        Returns the translation from the translation memory if there is one
+        (or of a similar text, if fuzzy matching is enabled), otherwise translates the text and remembers the result.
+        '''
+        if not self._is_cacheable(text):
+            return self._translate(text, **kwargs)
+        
+        key = self._memory_key()
+        translated_text = self._remembered_translation(text, key)
+        if translated_text is None:
+            translated_text = self._translate(text, **kwargs)
+            self._remember(key, [text], [translated_text])
+        return translated_text
+    
+    
     def translate_batch(self, batch: List[str], **kwargs) -> List[str]:
         if not batch:
             raise ValueError('Batch cannot be empty')
@@ -78,145 +154,440 @@ class BaseTranslator(ABC):
             result_batch[i] = self.translate(text)
         return result_batch
     
+    
+    async def _atranslate(self, text: str, **kwargs) -> str:
+        '''
+        Translators without an async client run `_translate` in the default executor.
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self._translate, text, **kwargs))
+    
+    
+    async def atranslate(self, text: str, timeout: Optional[float] = None, **kwargs) -> str:
+        '''
+        Async version of `translate`. 
+        Returns an empty string if the translation does not finish within `timeout` seconds.
+        '''
+        # The memory is SQLite, it is queried in the executor to keep the event loop free
+        loop = asyncio.get_running_loop()
+        key = self._memory_key()
+        cacheable = self._is_cacheable(text)
+        if cacheable:
+            translated_text = await loop.run_in_executor(None, self._remembered_translation, text, key)
+            if translated_text is not None:
+                return translated_text
+        
+        try:
+            translated_text = await asyncio.wait_for(self._atranslate(text, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            print(f'Translation timed out: {text}')
+            return ''
+        if cacheable:
+            await loop.run_in_executor(None, self._remember, key, [text], [translated_text])
+        return translated_text
+    
+    
+    async def atranslate_batch(self, batch: List[str], timeout: Optional[float] = None, **kwargs) -> List[str]:
+        '''
+        Translates the lines concurrently, no more than `max_concurrency` at a time.
+        `timeout` is the deadline of each line. Cancelling the call cancels all pending lines.
+        '''
+        if not batch:
+            raise ValueError('Batch cannot be empty')
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def translate(text: str) -> str:
+            async with semaphore:
+                return await self.atranslate(text, timeout, **kwargs)
+            
+        return list(await asyncio.gather(*(translate(text) for text in batch)))
+    
         
     def translate_batch_concat(self, batch: List[str], **kwargs) -> List[str]:
-        pattern = r'\s*#\s*\$\s*#\s*'
-        unstrans_elem = '#$#' # #$# - untranslatable element
+        return run_sync(self.atranslate_batch_concat(batch))
+    
+    
+    async def atranslate_batch_concat(self, batch: List[str]) -> List[str]:
+        '''
+        Translates the lines with as few requests as possible by joining them with an untranslatable element.
+        Lines that are in the translation memory are not sent.
+        The memory is looked up and updated once per batch, in the executor.
+        '''
+        if self.memory is None:
+            return await self._atranslate_chunks(batch)
         
-        all_text = unstrans_elem.join(batch)
-        if all_text:
-            translated_text = self.translate(all_text)
-        translated_text = re.sub(pattern, unstrans_elem, str(translated_text)).split(unstrans_elem)
-        return translated_text
+        loop = asyncio.get_running_loop()
+        key = self._memory_key()
+        result_batch = await loop.run_in_executor(None, self._remembered_batch, batch, key)
+        missing = [i for i, text in enumerate(result_batch) if text is None]
+        if not missing:
+            return result_batch
+        
+        translated_text = await self._atranslate_chunks([batch[i] for i in missing])
+        for i, text in zip(missing, translated_text):
+            result_batch[i] = text
+        await loop.run_in_executor(
+            None, self._remember, key, [batch[i] for i in missing], [text.strip() for text in translated_text]
+        )
+        return result_batch
+    
+    
+    async def _atranslate_chunks(self, batch: List[str]) -> List[str]:
+        '''
+        Splits the lines into chunks that fit into one request and translates the chunks concurrently.
+        A chunk whose separators were mangled is translated again line by line,
+        so the result is always aligned with the batch. The lines of a failed request are empty.
+        '''
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        chunks = await asyncio.gather(
+            *(self._atranslate_chunk(chunk, semaphore) for chunk in self._split_chunks(batch))
+        )
+        return [text for chunk in chunks for text in chunk]
+    
+    
+    def _request_size(self, text: str) -> int:
+        # The text is sent in the URL
+        return len(quote(text))
+    
+    
+    def _split_chunks(self, batch: List[str]) -> List[List[str]]:
+        '''
+        Groups consecutive lines so that each group, joined with the separators, 
+        stays within `max_chunk_chars` characters and `max_chunk_size` bytes of the request.
+        A line that is longer than the limits on its own forms a separate chunk.
+        '''
+        separator_chars = len(self.concat_separator)
+        separator_size = self._request_size(self.concat_separator)
+        chunks = []
+        chunk, chunk_chars, chunk_size = [], 0, 0
+        for text in batch:
+            text_chars = len(text)
+            text_size = self._request_size(text)
+            if chunk and (
+                chunk_chars + separator_chars + text_chars > self.max_chunk_chars
+                or chunk_size + separator_size + text_size > self.max_chunk_size
+            ):
+                chunks.append(chunk)
+                chunk, chunk_chars, chunk_size = [], 0, 0
+            if chunk:
+                chunk_chars += separator_chars
+                chunk_size += separator_size
+            chunk.append(text)
+            chunk_chars += text_chars
+            chunk_size += text_size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+    
+    
+    async def _atranslate_chunk(self, chunk: List[str], semaphore: asyncio.Semaphore) -> List[str]:
+        async with semaphore:
+            translated_text = await self._atranslate_concat(chunk)
+        if len(translated_text) == len(chunk):
+            return translated_text
+        # The request failed, the lines would fail the same way
+        if not any(translated_text):
+            return [''] * len(chunk)
+        
+        async def translate(text: str) -> str:
+            async with semaphore:
+                return await self._atranslate(text)
+        
+        print(f'The separators were mangled, translating {len(chunk)} lines one by one')
+        return list(await asyncio.gather(*(translate(text) for text in chunk)))
+    
+    
+    async def _atranslate_concat(self, batch: List[str]) -> List[str]:
+        all_text = self.concat_separator.join(batch)
+        if not all_text:
+            return list(batch)
+        translated_text = await self._atranslate(all_text)
+        return re.sub(
+            self.concat_pattern, self.concat_separator, str(translated_text)
+        ).split(self.concat_separator)
+    
+    
+    def close(self) -> None:
+        '''
+        Releases the connections of the translator, called when it is replaced.
+        '''
+        pass
     
     
 
-class YandexTranslator(BaseTranslator):
+class BrowserTranslator(BaseTranslator):
+    '''
+    Base class of the translators that work through a translator page in the browser.
+    The page is loaded once, the text is put into its input element with JS, and the result
+    is awaited with a MutationObserver until the output stops changing.
+    If the input element is not found, or the output does not change in time
+    (the translation can be the same as the previous one), the text is passed in the URL
+    and the page is reloaded.
     
-    def __init__(self, source: str, target: str):
-        super(YandexTranslator, self).__init__(
-            source, target,
-            codes = YANDEX_CODES
-        )
-        self._driver = WebDriverManager()
-        self._wait_time = WebDriverWait(self._driver, 3)
+    Every browser of WebDriverPool keeps its own page, so as many texts as there are
+    browsers in the pool are translated at once.
+    '''
+    input_xpath = None
+    output_xpath = None
+    wait_time = 3 # maximum time to wait for the translation, in seconds
+    settle_time = 0.15 # the output is complete when it has not changed for this time, in seconds
+    
+    def __init__(self, source: str, target: str, codes: dict, base_url: str):
+        super(BrowserTranslator, self).__init__(source, target, codes)
+        self._pool = WebDriverPool()
+        self._base_url = base_url
+        # The browser is started in the background, so creating the translator does not block
+        self._pool.warm_up_async(prepare=self._load_page)
         
-        self._base_url = "https://translate.yandex.ru/?source_lang={}&target_lang={}&text={}"
-        self._driver.get(self._generate_url(text = ''))
+        
+    @property
+    def max_concurrency(self) -> int:
+        return self._pool.size
         
         
     def _generate_url(self, text: str, **kwargs) -> str:
         return self._base_url.format(self.source_lang, self.target_lang, quote(text))
-
-
-    def translate(self, text: str, **kwargs) -> str:
+    
+    
+    def _load_page(self, driver: PooledDriver, text: str = '') -> None:
+        driver.set_script_timeout(self.wait_time + 1)
+        driver.get(self._generate_url(text))
+        driver.page_owner = self
+        driver.page_languages = (self.source_lang, self.target_lang)
+        driver.last_text, driver.last_translation = None, ''
+        
+        
+    def _switch_languages(self, driver: PooledDriver) -> None:
+        self._load_page(driver)
+        
+        
+    def _prepare_page(self, driver: PooledDriver) -> None:
+        # The browser could have been used by another translator
+        if driver.page_owner is not self:
+            self._load_page(driver)
+        elif driver.page_languages != (self.source_lang, self.target_lang):
+            self._switch_languages(driver)
+    
+    
+    def _translate(self, text: str, **kwargs) -> str:
         if not isinstance(text, str):
             raise ValueError('Unsupported type of text')
         if self._is_empty(text) or self._is_same_language():
             return text
-
-        self._driver.get(self._generate_url(text))
-        try:
-            elements = self._wait_time.until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'translation-word')))
-        except Exception as e:
-            print(f'Error while finding elements: {e}')
-            return ''
         
         try:
-            translated_text = ''.join([elem.text for elem in elements])
-        except StaleElementReferenceException:
-            elements = self._wait_time.until(EC.presence_of_all_elements_located((By.CLASS_NAME, 'translation-word')))
-            translated_text = ''.join([elem.text for elem in elements])
-            return translated_text
-        except Exception as e:
-            print(f'Error while getting text: {e}')
+            with self._pool.driver() as driver:
+                self._prepare_page(driver)
+                # The output would not change, so there is nothing to wait for
+                if text == driver.last_text:
+                    return driver.last_translation
+                
+                if not driver.execute_script(SET_TEXT_SCRIPT, self.input_xpath, text):
+                    self._load_page(driver, text)
+                translated_text = self._wait_output(driver)
+                if translated_text is None and driver.last_translation:
+                    self._load_page(driver, text)
+                    translated_text = self._wait_output(driver)
+                if translated_text is None:
+                    # The page is in an unknown state, so nothing is reused from it
+                    print(f'Translation timed out: {text}')
+                    driver.last_text, driver.last_translation = None, ''
+                    return ''
+                driver.last_text, driver.last_translation = text, translated_text
+        except WebDriverException as e:
+            print(f'Error while translating: {e}')
             return ''
-        
         return translated_text
     
-    def translate_batch_concat(self, batch: List[str], **kwargs) -> List[str]:
-        pattern = r'\s*\[\s*1\s*\]\s*'
-        unstrans_elem = '[1]' # #$# - untranslatable element
-
-        all_text = unstrans_elem.join(batch)
-        if all_text:
-            translated_text = self.translate(all_text)
-        translated_text = re.sub(pattern, unstrans_elem, str(translated_text)).split(unstrans_elem)
-        return translated_text
+    
+    def _wait_output(self, driver: PooledDriver) -> Optional[str]:
+        return driver.execute_async_script(
+            WAIT_OUTPUT_SCRIPT, self.output_xpath, driver.last_translation,
+            int(self.settle_time * 1000), int(self.wait_time * 1000)
+        )
+    
+    
+    def translate_batch(self, batch: List[str], timeout: Optional[float] = None, **kwargs) -> List[str]:
+        '''
+        Synchronous shim over `atranslate_batch`, the lines are spread over the browsers of the pool.
+        '''
+        return run_sync(self.atranslate_batch(batch, timeout, **kwargs))
+    
+    
+class YandexTranslator(BrowserTranslator):
+    
+    concat_separator = '[1]'
+    concat_pattern = r'\s*\[\s*1\s*\]\s*'
+    input_xpath = "//*[@id='fakeArea' or @id='textarea']"
+    output_xpath = "//*[contains(@class, 'translation-word')]"
+    
+    def __init__(
+        self, source: str, target: str, 
+        base_url: str = "https://translate.yandex.ru/?source_lang={}&target_lang={}&text={}"
+    ):
+        super(YandexTranslator, self).__init__(
+            source, target,
+            codes = YANDEX_CODES,
+            base_url = base_url
+        )
         
         
-class DeeplTranslator(BaseTranslator):
-    def __init__(self, source, target):
+class DeeplTranslator(BrowserTranslator):
+    
+    input_xpath = "//*[@name='source']//*[@contenteditable='true'] | //textarea[@name='source']"
+    output_xpath = "//*[@name='target']//*[contains(@class, 'sentence_highlight')]"
+    
+    def __init__(self, source, target, base_url: str = "https://www.deepl.com/translator#{}/{}/{}"):
         super(DeeplTranslator, self).__init__(
             source, target,
-            codes = DEEPL_CODES
+            codes = DEEPL_CODES,
+            base_url = base_url
+        )
+        
+        
+    def _switch_languages(self, driver: PooledDriver) -> None:
+        # The languages are in the fragment, so changing it does not reload the page
+        driver.execute_script(
+            'window.location.hash = arguments[0]', f'#{self.source_lang}/{self.target_lang}/'
+        )
+        driver.page_languages = (self.source_lang, self.target_lang)
+        driver.last_text, driver.last_translation = None, ''
+    
+    
+class GoogleTranslator(BaseTranslator):
+    
+    max_concurrency = HTTP_MAX_CONCURRENCY
+    retry_statuses = (429, 500, 502, 503, 504)
+    
+    result_pattern = re.compile(rb'<div[^>]*\sclass="(?:[^"]*\s)?result-container(?:\s[^"]*)?"[^>]*>(.*?)</div>', re.S)
+    result_xpath = '//div[contains(concat(" ", normalize-space(@class), " "), " result-container ")]'
+    
+    def __init__(self, source, target, base_url: str = "https://translate.google.com/m?"):
+        super(GoogleTranslator, self).__init__(
+            source, target,
+            codes = GOOGLE_CODES
         )
-        self._driver = WebDriverManager()
-        self._wait_time = WebDriverWait(self._driver, 3)
         
-        self._base_url = "https://www.deepl.com/translator#{}/{}/{}"
-        self._driver.get(self._generate_url(text = ''))
+        self._base_url = base_url
+        self._timeout = HTTP_TIMEOUT
         
+        # One keep-alive session, so the TCP and TLS handshakes are not repeated for every line
+        retries = Retry(
+            total = HTTP_RETRIES, 
+            backoff_factor = 0.2, 
+            status_forcelist = self.retry_statuses,
+            allowed_methods = ('GET',)
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_MAX_CONCURRENCY, max_retries=retries)
+        self._session = requests.Session()
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
         
-    def _generate_url(self, text: str, **kwargs) -> str:
-        return self._base_url.format(self.source_lang, self.target_lang, quote(text))
+        # The async session is bound to the event loop it was created in
+        self._async_session = None
+        self._async_loop = None
         
+        
+    def _generate_url(self, text: str) -> str:
+        return self._base_url + urlencode({'sl':self.source_lang, 'tl':self.target_lang, 'q':text})
     
-    def translate(self, text: str, **kwargs) -> str:
+    
+    @classmethod
+    def _extract_translation(cls, content: bytes) -> str:
+        '''
+        Finds the result with a regex on the raw page and unescapes it,
+        the page is only parsed if the result contains markup.
+        '''
+        match = cls.result_pattern.search(content)
+        if not match:
+            print('Translation not found')
+            return ''
+        
+        result = match.group(1)
+        if b'<' not in result:
+            return html.unescape(result.decode('utf-8', errors='replace'))
+        
+        elements = lxml.html.fromstring(content).xpath(cls.result_xpath)
+        if not elements:
+            print('Translation not found')
+            return ''
+        return elements[0].text_content()
+        
+        
+    def _translate(self, text: str, **kwargs) -> str:
         if not isinstance(text, str):
             raise ValueError('Unsupported type of text')
         if self._is_empty(text) or self._is_same_language():
             return text
         
-        self._driver.get(self._generate_url(text))
-        xpath = "//*[@name='target']//*[contains(@class, 'sentence_highlight')]"
         try:
-            elements = self._wait_time.until(EC.presence_of_all_elements_located((By.XPATH, xpath)))
-        except Exception as e:
-            print(f'Error while finding elements: {e}')
-            return ''
-            
-        try:
-            translated_text = ''.join([elem.text for elem in elements])
-        except StaleElementReferenceException:
-            elements = self._wait_time.until(EC.presence_of_all_elements_located((By.XPATH, xpath)))
-            translated_text = ''.join([elem.text for elem in elements])
-            return translated_text
-        except Exception as e:
-            print(f'Error while getting text: {e}')
+            response = self._session.get(self._generate_url(text), timeout=self._timeout)
+        except requests.RequestException as e:
+            print(f'Request Error: {e}')
             return ''
         
-        return translated_text
+        with response:
+            if response.status_code != 200:
+                print('Request Error')
+                return ''
+            content = response.content
+        return self._extract_translation(content)
     
     
-class GoogleTranslator(BaseTranslator):
-    def __init__(self, source, target):
-        super(GoogleTranslator, self).__init__(
-            source, target,
-            codes = GOOGLE_CODES
-        )
-        
-        self._base_url = "https://translate.google.com/m?"
-        
-        
-    def translate(self, text: str, **kwargs) -> str:
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_loop is not loop:
+            if self._async_session is not None and self._async_loop.is_running():
+                asyncio.run_coroutine_threadsafe(self._async_session.close(), self._async_loop)
+            connect_timeout, read_timeout = self._timeout
+            self._async_session = aiohttp.ClientSession(
+                connector = aiohttp.TCPConnector(limit=HTTP_MAX_CONCURRENCY),
+                timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+            )
+            self._async_loop = loop
+        return self._async_session
+    
+    
+    async def _atranslate(self, text: str, **kwargs) -> str:
         if not isinstance(text, str):
             raise ValueError('Unsupported type of text')
         if self._is_empty(text) or self._is_same_language():
             return text
         
-
-        url = self._base_url + urlencode({'sl':self.source_lang, 'tl':self.target_lang, 'q':text})
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'lxml')
-            element = soup.find('div', class_='result-container')
-            response.close()
-            
-            if not element:
-                print('Translation not found')
-                return ''
-            return element.text
-        else:
-            print('Request Error')
-            return ''
+        session = self._get_async_session()
+        url = self._generate_url(text)
+        for attempt in range(HTTP_RETRIES + 1):
+            retry = attempt < HTTP_RETRIES
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        content = await response.read()
+                        return self._extract_translation(content)
+                    if not (retry and response.status in self.retry_statuses):
+                        print('Request Error')
+                        return ''
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not retry:
+                    print(f'Request Error: {e}')
+                    return ''
+            await asyncio.sleep(0.2 * 2 ** attempt)
+    
+    
+    def translate_batch(self, batch: List[str], timeout: Optional[float] = None, **kwargs) -> List[str]:
+        '''
+        Synchronous shim over `atranslate_batch`, the lines are translated concurrently
+        on the shared event loop.
+        '''
+        return run_sync(self.atranslate_batch(batch, timeout, **kwargs))
+    
+    
+    async def aclose(self) -> None:
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+    
+    
+    def close(self) -> None:
+        self._session.close()
+        if self._async_session is not None and self._async_loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.aclose(), self._async_loop)
@@ -1,6 +1,7 @@
-from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSlider, QWidget, QRadioButton, QButtonGroup, QDoubleSpinBox, QSizePolicy, QSpacerItem, QStackedWidget, QListWidget, QFormLayout, QComboBox, QFrame, QFontComboBox, QCheckBox, QLineEdit
+from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSlider, QWidget, QRadioButton, QButtonGroup, QDoubleSpinBox, QSizePolicy, QSpacerItem, QStackedWidget, QListWidget, QFormLayout, QComboBox, QFrame, QFontComboBox, QCheckBox, QLineEdit, QSpinBox
 from PyQt5.QtGui import QColor, QFont
-from PyQt5.QtCore import Qt, QSettings, pyqtSignal
+from PyQt5.QtCore import Qt, QSettings, QTimer, pyqtSignal
+from src.metrics import MetricsRegistry
 from config.config import *
 
 
@@ -194,6 +195,7 @@ class InterfaceSettingsWidget(QWidget):
 class MainSettingsWidget(QWidget):
     
     update_ocr_signal = pyqtSignal(str, str)
+    update_ocr_processes_signal = pyqtSignal(int)
     update_subtitle_signal = pyqtSignal(str)
     update_translator_signal = pyqtSignal(str, str)
     
@@ -228,6 +230,13 @@ class MainSettingsWidget(QWidget):
             self.combo_box_source_lang.findText(self.main_window.ocr_system_language.capitalize())
         )
         
+        self.label_ocr_processes = QLabel('OCR processes')
+        self.label_ocr_processes.setMinimumWidth(100)
+        self.spin_box_ocr_processes = QSpinBox()
+        self.spin_box_ocr_processes.setRange(0, 8)
+        self.spin_box_ocr_processes.setValue(self.main_window.ocr_processes)
+        self.spin_box_ocr_processes.setToolTip('0 - OCR runs in the same process as the interface')
+        
         self.label_subtitle_mode = QLabel('Mode')
         self.label_subtitle_mode.setMinimumWidth(100)
         self.combo_box_subtitle_mode = QComboBox()
@@ -267,12 +276,14 @@ class MainSettingsWidget(QWidget):
         self.form_layout.setWidget(0, QFormLayout.FieldRole, self.combo_box_ocr)
         self.form_layout.setWidget(1, QFormLayout.LabelRole, self.label_source_lang)
         self.form_layout.setWidget(1, QFormLayout.FieldRole, self.combo_box_source_lang)
-        self.form_layout.setWidget(2, QFormLayout.LabelRole, self.label_subtitle_mode)
-        self.form_layout.setWidget(2, QFormLayout.FieldRole, self.combo_box_subtitle_mode)
-        self.form_layout.setWidget(3, QFormLayout.LabelRole, self.label_translator)
-        self.form_layout.setWidget(3, QFormLayout.FieldRole, self.combo_box_translator)
-        self.form_layout.setWidget(4, QFormLayout.LabelRole, self.label_target_lang)
-        self.form_layout.setWidget(4, QFormLayout.FieldRole, self.combo_box_target_lang)
+        self.form_layout.setWidget(2, QFormLayout.LabelRole, self.label_ocr_processes)
+        self.form_layout.setWidget(2, QFormLayout.FieldRole, self.spin_box_ocr_processes)
+        self.form_layout.setWidget(3, QFormLayout.LabelRole, self.label_subtitle_mode)
+        self.form_layout.setWidget(3, QFormLayout.FieldRole, self.combo_box_subtitle_mode)
+        self.form_layout.setWidget(4, QFormLayout.LabelRole, self.label_translator)
+        self.form_layout.setWidget(4, QFormLayout.FieldRole, self.combo_box_translator)
+        self.form_layout.setWidget(5, QFormLayout.LabelRole, self.label_target_lang)
+        self.form_layout.setWidget(5, QFormLayout.FieldRole, self.combo_box_target_lang)
 
         self.main_layout.addLayout(self.form_layout)
         self.main_layout.addWidget(self.push_button)
@@ -328,6 +339,7 @@ class MainSettingsWidget(QWidget):
         selected_ocr = self.combo_box_ocr.currentText()
         selected_language = self.combo_box_source_lang.currentText().lower()
         self.update_ocr_signal.emit(selected_ocr, selected_language)
+        self.update_ocr_processes_signal.emit(self.spin_box_ocr_processes.value())
         
     
     def update_subtitle_mode_configuration(self):
@@ -339,6 +351,13 @@ class MainSettingsWidget(QWidget):
         selected_translator = self.combo_box_translator.currentText()
         selected_language = self.combo_box_target_lang.currentText()
         self.update_translator_signal.emit(selected_translator, selected_language)
+        # The main window keeps its translator if the selected one is not available
+        self.combo_box_translator.setCurrentIndex(
+            self.combo_box_translator.findText(self.main_window.translator_name)
+        )
+        self.combo_box_target_lang.setCurrentIndex(
+            self.combo_box_target_lang.findText(self.main_window.translator_target_language.capitalize())
+        )
     
         
     def apply_configuration(self):
@@ -357,6 +376,10 @@ class MainSettingsWidget(QWidget):
             OCR_SYSTEM_LANGUAGE_KEY, 
             self.combo_box_source_lang.currentText().lower()
         )
+        self.settings.setValue(
+            OCR_PROCESSES_KEY, 
+            self.spin_box_ocr_processes.value()
+        )
         self.settings.setValue(
             SUBTITLE_MODE_NAME_KEY, 
             self.combo_box_subtitle_mode.currentText()
@@ -530,3 +553,40 @@ class FontStyleSettingsWidget(QWidget):
             self.settings.setValue(key, value)
         self.settings.endGroup()
         
+
+
+class StatsOverlayWidget(QLabel):
+    '''
+    A small always-on-top panel with the latency percentiles of every pipeline step.
+    It does not take the mouse input, so it can stay over the game.
+    '''
+    def __init__(self, interval: float = STATS_OVERLAY_INTERVAL, parent = None):
+        super(StatsOverlayWidget, self).__init__(parent = parent)
+        self.setWindowFlags(
+            Qt.WindowStaysOnTopHint
+            | Qt.FramelessWindowHint
+            | Qt.WindowTransparentForInput
+            | Qt.Tool
+        )
+        self.setStyleSheet(
+            'font-family: monospace; font-size: 11px; color: white; '
+            'background-color: rgba(0, 0, 0, 160); padding: 4px'
+        )
+        self.move(10, 10)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(int(interval * 1000))
+        self.refresh()
+
+
+    def refresh(self) -> None:
+        rows = [f"{'step':<18}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"]
+        for stats in MetricsRegistry().snapshot():
+            if not stats['count']:
+                continue
+            rows.append(
+                f"{stats['name']:<18}{stats['count']:>7}"
+                + ''.join(f"{stats[q] * 1000:>9.1f}" for q in ('p50', 'p95', 'p99'))
+            )
+        self.setText('<pre>' + '\n'.join(rows) + '</pre>')
+        self.adjustSize()
@@ -1,5 +1,5 @@
 import numpy as np
-from typing import Tuple
+from typing import List, Tuple
 
 import win32gui
 import win32ui
@@ -31,15 +31,31 @@ class ScreenCapture():
         monitor_rect: Tuple[int, int, int, int] = None, 
         area: Tuple[int, int, int, int] = None
     ) -> np.ndarray:
+        return self.grab_areas(hWnd, monitor_rect, [area])[0]
+    
+    
+    def grab_areas(
+        self, 
+        hWnd: int = None, 
+        monitor_rect: Tuple[int, int, int, int] = None, 
+        areas: List[Tuple[int, int, int, int]] = None
+    ) -> List[np.ndarray]:
+        '''
+        Captures the window once and cuts all the areas out of this single capture.
+        An area that is None is replaced with the monitor rect.
+        '''
         if not hWnd:
             hWnd = self.active_window_hwnd()
             
-        left, top, right, bottom = self.window_rect(hWnd)
+        window_rect = self.window_rect(hWnd)
+        img = self.grab_window(hWnd, window_rect)
+        return [self.crop_area(img, window_rect, area if area else monitor_rect) for area in areas or [None]]
+    
+    
+    def grab_window(self, hWnd: int, window_rect: Tuple[int, int, int, int]) -> np.ndarray:
+        left, top, right, bottom = window_rect
         width = right - left
         height = bottom - top
-    
-        area_left, area_top, area_width, area_height = area if area else monitor_rect
-
         
         hwndDC = win32gui.GetWindowDC(hWnd)
         mfcDC  = win32ui.CreateDCFromHandle(hwndDC)
@@ -64,6 +80,19 @@ class ScreenCapture():
         
         if not result:
             raise Exception('Failed to capture a window')
+        return img
+    
+    
+    def crop_area(
+        self, 
+        img: np.ndarray, 
+        window_rect: Tuple[int, int, int, int], 
+        area: Tuple[int, int, int, int]
+    ) -> np.ndarray:
+        left, top, right, bottom = window_rect
+        width = right - left
+        height = bottom - top
+        area_left, area_top, area_width, area_height = area
         
         full_img = np.zeros(
             shape=(area_height,  area_width, 3), dtype=np.uint8